@@ -0,0 +1,67 @@
+"""Compare AMF encoding with copy-on-need key stringifying against the former full copy, and sizes of repeated
+messages with and without session context.
+"""
+import random
+from timeit import timeit
+from zlib import compress
+from pyamf import encode
+from cherrycommon._amf import dumps, AMFContext
+
+NUMBER = 1000
+
+
+def old_keys_to_string(s):
+    if isinstance(s, dict):
+        re = {}
+        for k, v in s.iteritems():
+            k = unicode(k)
+            if not k:
+                continue
+            re[k] = old_keys_to_string(v)
+        return re
+    elif isinstance(s, (list, tuple, set)):
+        re = []
+        for v in s:
+            re.append(old_keys_to_string(v))
+        return re
+    else:
+        return s
+
+
+def old_dumps(s):
+    return compress(encode(old_keys_to_string(s)).read())
+
+
+def make_state(i):
+    return {
+        'player': {'name': 'player_{}'.format(i), 'level': random.randint(1, 50), 'gold': random.randint(0, 5000)},
+        'units': dict(('unit_{}'.format(j), {'type': random.choice(['archer', 'knight', 'mage']),
+                                             'hp': random.randint(1, 100), 'position': [j, j * 2]})
+                      for j in range(30)),
+        'quests': [{'id': 'quest_{}'.format(j), 'state': random.choice(['active', 'done'])} for j in range(10)]
+    }
+
+
+def bench(name, func, number=NUMBER):
+    elapsed = timeit(func, number=number)
+    print '{:<40} {:8.3f} us/op'.format(name, elapsed / number * 1000000)
+
+
+def main():
+    random.seed(1)
+    state = make_state(1)
+    bench('old dumps', lambda: old_dumps(state))
+    bench('new dumps', lambda: dumps(state))
+    context = AMFContext()
+    bench('session dumps', lambda: context.dumps(state))
+
+    messages = [make_state(i) for i in range(100)]
+    context = AMFContext()
+    sizes = (sum(len(dumps(message)) for message in messages),
+             sum(len(context.dumps(message)) for message in messages))
+    for name, size in zip(('plain', 'session'), sizes):
+        print '{:<40} {:8.1f} bytes'.format('{} message'.format(name), float(size) / len(messages))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+"""Measure diff on documents with 10k keys, where only a few fields were changed.
+"""
+from copy import deepcopy
+from timeit import timeit
+from cherrycommon.dictutils import diff, merge, PersistentDict
+
+NUMBER = 20
+
+
+def make_document(keys=10000, width=100):
+    return dict(('group_{}'.format(i), dict(('field_{}'.format(j), j) for j in range(width)))
+                for i in range(keys // width))
+
+
+def bench(name, func, number=NUMBER):
+    elapsed = timeit(func, number=number)
+    print '{:<40} {:8.3f} us/op'.format(name, elapsed / number * 1000000)
+
+
+def main():
+    changes = {'group_1': {'field_1': -1}, 'group_50': {'field_2': None}, 'group_99': {'field_3': 'changed'}}
+    old = make_document()
+
+    new = merge(deepcopy(old), changes)
+    bench('diff, copied document', lambda: diff(old, new))
+
+    shared = merge(dict(old), changes, copy=False)
+    bench('diff, shared subtrees', lambda: diff(old, shared))
+
+    persistent = PersistentDict(old)
+    persistent_new = persistent.merge(changes)
+    bench('diff, PersistentDict', lambda: diff(persistent, persistent_new))
+
+
+if __name__ == '__main__':
+    main()
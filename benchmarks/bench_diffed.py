@@ -0,0 +1,64 @@
+"""Measure Diffed reads on objects with deep diff chains.
+"""
+from timeit import timeit
+from cherrycommon.dictutils import Diffed
+
+NUMBER = 100000
+
+
+def make_diffed(depth, keys=100, **kwargs):
+    data = dict(('field_{}'.format(i), i) for i in range(keys))
+    diffs = [{'field_{}'.format(i % keys): i} for i in range(depth)]
+    return Diffed(data, diffs, **kwargs)
+
+
+def lookup_keys(diffed):
+    """Former Diffed.keys implementation, which walked all containers on every call.
+    """
+    keys = set()
+    for container in reversed(list(diffed.lookup())):
+        for key, value in container.iteritems():
+            if value is None:
+                keys.discard(key)
+            else:
+                keys.add(key)
+    return list(keys)
+
+
+def bench(name, func, number=NUMBER):
+    elapsed = timeit(func, number=number)
+    print '{:<40} {:8.3f} us/op'.format(name, elapsed / number * 1000000)
+
+
+def main():
+    for depth in (1, 10, 40):
+        diffed = make_diffed(depth)
+        bench('getitem, {} diffs'.format(depth), lambda: diffed['field_99'])
+        bench('contains, {} diffs'.format(depth), lambda: 'field_99' in diffed)
+        bench('get_effective_item, {} diffs'.format(depth), lambda: diffed.get_effective_item('field_99'))
+
+    diffed = Diffed({'inventory': {'items': {'sword': 1}}}, [{'inventory': {'items': {}}} for _ in range(20)])
+    bench('nested getitem, 20 diffs', lambda: diffed['inventory']['items']['sword'])
+
+    for keys in (1000, 5000):
+        diffed = make_diffed(40, keys)
+        diffed.add_diff(dict(('field_{}'.format(i), None) for i in range(0, keys, 10)))
+        bench('lookup keys, {} keys'.format(keys), lambda: len(lookup_keys(diffed)), 100)
+        bench('len, {} keys'.format(keys), lambda: len(diffed), 100)
+        bench('iter, {} keys'.format(keys), lambda: list(diffed), 100)
+        bench('effective_keys, {} keys'.format(keys), lambda: diffed.effective_keys(), 100)
+
+    diffed = make_diffed(40, 1000)
+    diffed.add_diff(dict(('field_{}'.format(i), -i) for i in range(100)))
+    bench('snapshot, 40 diffs, 100 changes', lambda: diffed.snapshot(), 10000)
+
+    for max_depth in (None, 16):
+        diffed = make_diffed(500, max_depth=max_depth)
+        diffed.add_diff({})
+        bench('dump_item, 500 diffs, max_depth {}'.format(max_depth), lambda: diffed.dump_item('field_99'), 1000)
+        bench('reindex, 500 diffs, max_depth {}'.format(max_depth), lambda: diffed.reindex() or len(diffed),
+              1000)
+
+
+if __name__ == '__main__':
+    main()
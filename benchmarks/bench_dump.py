@@ -0,0 +1,70 @@
+"""Compare dump_value and flatten_value with the former isinstance based implementation on game-like documents.
+"""
+from timeit import timeit
+from cherrycommon.dictutils import dump_value, flatten_value, DictView, ListView
+
+NUMBER = 200
+
+
+def isinstance_dump_value(value):
+    if hasattr(value, 'dump'):
+        return value.dump()
+    if isinstance(value, basestring):
+        return unicode(value)
+    elif isinstance(value, (tuple, list, set)):
+        return map(isinstance_dump_value, value)
+    elif isinstance(value, dict):
+        return dict((key, isinstance_dump_value(value)) for key, value in value.iteritems())
+    elif isinstance(value, int) and value > 0xffffffff:
+        return long(value)
+    return value
+
+
+def isinstance_flatten_value(value):
+    if isinstance(value, (dict, DictView)):
+        return dict((k, isinstance_flatten_value(v)) for k, v in value.iteritems())
+    elif isinstance(value, (list, ListView)):
+        return map(isinstance_flatten_value, value)
+    elif isinstance(value, basestring):
+        value = unicode(value)
+        try:
+            value = float(value)
+        except ValueError:
+            return value
+    if isinstance(value, float):
+        int_value = int(value)
+        if int_value == value:
+            return int_value
+    return value
+
+
+def make_player(index):
+    return {
+        '_id': u'player_{}'.format(index),
+        'name': u'Player {}'.format(index),
+        'level': 12,
+        'xp': 1520L,
+        'gold': 100.0,
+        'flags': {'tutorial': True, 'banned': False, 'locale': u'en_US'},
+        'inventory': dict((u'item_{}'.format(i), {'count': i, 'type': u'sword', 'durability': 0.75})
+                          for i in range(20)),
+        'quests': [{'id': u'quest_{}'.format(i), 'progress': [1, 2, 3], 'state': u'active'} for i in range(10)],
+        'friends': [u'player_{}'.format(i) for i in range(50)],
+    }
+
+
+def bench(name, func):
+    elapsed = timeit(func, number=NUMBER)
+    print '{:<40} {:8.3f} ms/op'.format(name, elapsed / NUMBER * 1000)
+
+
+def main():
+    players = [make_player(i) for i in range(10)]
+    bench('isinstance dump_value', lambda: isinstance_dump_value(players))
+    bench('dump_value', lambda: dump_value(players))
+    bench('isinstance flatten_value', lambda: isinstance_flatten_value(players))
+    bench('flatten_value', lambda: flatten_value(players))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Compare peak memory of CollectionDumper responses, streamed from an iterator, against the former behaviour, which
+listed the cursor and encoded it into a single string. Each case runs in a separate process.
+"""
+import resource
+import subprocess
+import sys
+from tornado.httpclient import AsyncHTTPClient
+from tornado.ioloop import IOLoop
+from tornado.testing import bind_unused_port
+from tornado.web import Application
+from cherrycommon.dictutils import JSON, encode_data
+from cherrycommon.handlers import CollectionDumper
+
+
+def generate_documents(count):
+    for i in xrange(count):
+        yield {'_id': 'document_{}'.format(i), 'stats': {'hp': i, 'damage': [i, i * 2]}, 'name': 'unit' * 10}
+
+
+class GeneratorDumper(CollectionDumper):
+    def initialize(self, count=0):
+        self.count = count
+        self.data_format = JSON
+
+    def query_documents(self, **kwargs):
+        return generate_documents(self.count)
+
+
+class OldDumper(GeneratorDumper):
+    def respond(self, data=None):
+        self.set_header('Content-Type', 'application/json')
+        self.write(encode_data(list(data), JSON))
+
+
+def run(count, stream):
+    socket, port = bind_unused_port()
+    application = Application([('/', GeneratorDumper if stream else OldDumper, {'count': count})])
+    application.listen(0).add_sockets([socket])
+    sizes = []
+    IOLoop.current().run_sync(lambda: AsyncHTTPClient().fetch(
+        'http://127.0.0.1:{}/'.format(port), streaming_callback=lambda chunk: sizes.append(len(chunk)),
+        request_timeout=600))
+    print '{:<40} {:8d} kB max rss, {} kB sent'.format(
+        '{} {} documents'.format('stream' if stream else 'old', count),
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, sum(sizes) // 1024)
+
+
+def main():
+    for count in (10000, 100000):
+        for stream in (False, True):
+            subprocess.check_call([sys.executable, __file__, str(count), str(int(stream))])
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run(int(sys.argv[1]), bool(int(sys.argv[2])))
+    else:
+        main()
@@ -0,0 +1,36 @@
+"""Compare JSON encoding through the data format registry against the former stdlib ``json.dumps`` of dumped
+objects.
+"""
+import json
+from timeit import timeit
+from cherrycommon.dictutils import DictView, Diffed, encode_data, JSON
+
+NUMBER = 200
+
+DOCUMENT = {
+    'units': dict(('unit_{}'.format(i), {'stats': {'hp': i, 'damage': [i, i * 2]}, 'name': 'unit'})
+                  for i in range(1000)),
+    'version': 1
+}
+
+
+def bench(name, func, number=NUMBER):
+    elapsed = timeit(func, number=number)
+    print '{:<40} {:8.3f} us/op'.format(name, elapsed / number * 1000000)
+
+
+def main():
+    bench('old dict', lambda: json.dumps(DOCUMENT))
+    bench('new dict', lambda: encode_data(DOCUMENT, JSON))
+
+    view = DictView(DOCUMENT)
+    bench('old DictView', lambda: json.dumps(view.dump()))
+    bench('new DictView', lambda: encode_data(view, JSON))
+
+    diffed = Diffed(DOCUMENT, [{'version': 2}, {'units': {'unit_1': {'name': 'changed'}}}])
+    bench('old Diffed', lambda: json.dumps(diffed.dump()))
+    bench('new Diffed', lambda: encode_data(diffed, JSON))
+
+
+if __name__ == '__main__':
+    main()
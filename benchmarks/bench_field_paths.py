@@ -0,0 +1,80 @@
+"""Compare compiled field paths with the former recursive get_value / set_value implementation.
+"""
+from collections import MutableMapping
+from timeit import timeit
+from cherrycommon.dictutils import (get_value, set_value, compile_field, split_field, dump_value, flatten_value,
+                                    MappingView, ListView, _default)
+
+
+def recursive_get_value(document, field, default=_default, flatten=True):
+    if not isinstance(document, (dict, MappingView)):
+        raise TypeError('Only mapping type supported as a document')
+    full_match, nested_field, index = split_field(field)
+    try:
+        value = document[nested_field]
+    except KeyError:
+        if default is not _default:
+            return default
+        raise KeyError('Field not found: {}'.format(field))
+    if index is not None:
+        if not isinstance(value, (tuple, list, ListView)):
+            raise TypeError('Nested value is not a list')
+        try:
+            value = value[int(index)]
+        except IndexError:
+            if default is not _default:
+                return default
+            raise
+    if full_match != field:
+        field = field[len(full_match) + 1:]
+        return recursive_get_value(value, field, default, flatten)
+    if not flatten:
+        return dump_value(value)
+    else:
+        return flatten_value(value)
+
+
+def recursive_set_value(document, field, value):
+    if not isinstance(document, (dict, MutableMapping)):
+        raise TypeError('Only dict or MutableMapping type supported as a document.')
+    full_match, nested_field, index = split_field(field)
+    if full_match == field:
+        if index is not None:
+            document[nested_field][index] = value
+        else:
+            document[nested_field] = value
+    else:
+        nested_value = document.setdefault(nested_field, {})
+        if index is not None:
+            nested_value = nested_value[index]
+        recursive_set_value(nested_value, field[len(full_match) + 1:], value)
+
+
+DOCUMENT = {
+    'stats': {
+        'level': [{'xp': 10}, {'xp': 20}, {'xp': 30}],
+        'gold': 100
+    },
+    'profile': {'name': 'player', 'settings': {'sound': {'volume': 5}}}
+}
+FIELDS = ['stats.level[2].xp', 'stats.gold', 'profile.settings.sound.volume', 'profile.name']
+NUMBER = 100000
+
+
+def bench(name, func):
+    elapsed = timeit(func, number=NUMBER)
+    print '{:<32} {:8.3f} us/op'.format(name, elapsed / NUMBER / len(FIELDS) * 1000000)
+
+
+def main():
+    compiled = map(compile_field, FIELDS)
+    bench('recursive get_value', lambda: [recursive_get_value(DOCUMENT, f) for f in FIELDS])
+    bench('cached get_value', lambda: [get_value(DOCUMENT, f) for f in FIELDS])
+    bench('CompiledField.get', lambda: [f.get(DOCUMENT) for f in compiled])
+    bench('recursive set_value', lambda: [recursive_set_value(DOCUMENT, f, 1) for f in FIELDS])
+    bench('cached set_value', lambda: [set_value(DOCUMENT, f, 1) for f in FIELDS])
+    bench('CompiledField.set', lambda: [f.set(DOCUMENT, 1) for f in compiled])
+
+
+if __name__ == '__main__':
+    main()
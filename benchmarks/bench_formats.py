@@ -0,0 +1,42 @@
+"""Compare payload size and encode/decode speed of data formats on numeric-heavy game state documents.
+"""
+import random
+from timeit import timeit
+from cherrycommon.dictutils import DictView, encode_data, decode_data, JSON, XJSON, AMF, YAML, MSGPACK
+
+NUMBER = 1000
+
+
+def make_document(i):
+    return {
+        '_id': 'player_{}'.format(i),
+        'stats': {'level': random.randint(1, 50), 'xp': random.randint(0, 10 ** 6), 'gold': 2 ** 40 + i,
+                  'rating': random.random() * 1000},
+        'inventory': dict(('item_{}'.format(j), {'count': random.randint(1, 99), 'durability': random.random()})
+                          for j in range(20)),
+        'history': [random.randint(0, 10 ** 6) for _ in range(50)]
+    }
+
+
+def bench(name, func, number=NUMBER):
+    elapsed = timeit(func, number=number)
+    print '{:<40} {:8.3f} us/op'.format(name, elapsed / number * 1000000)
+
+
+def main():
+    random.seed(1)
+    document = make_document(1)
+    for data_format in (JSON, XJSON, AMF, YAML, MSGPACK):
+        number = 50 if data_format == YAML else NUMBER
+        encoded = encode_data(document, data_format)
+        print '{:<40} {:8d} bytes'.format('{} size'.format(data_format), len(encoded))
+        bench('{} encode'.format(data_format), lambda: encode_data(document, data_format), number)
+        bench('{} decode'.format(data_format), lambda: decode_data(encoded, data_format), number)
+
+    view = DictView(document)
+    for data_format in (JSON, MSGPACK):
+        bench('{} encode DictView'.format(data_format), lambda: encode_data(view, data_format))
+
+
+if __name__ == '__main__':
+    main()
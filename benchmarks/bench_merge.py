@@ -0,0 +1,66 @@
+"""Compare merge with the former implementation, which checked every nested source dict for emptiness, on nested
+documents with 10k keys.
+"""
+from copy import deepcopy
+from timeit import timeit
+from cherrycommon.dictutils import merge, is_empty, dump_value, MappingView
+
+NUMBER = 20
+
+
+def recursive_merge(target, source, keep_none=False, skip_empty=True):
+    if source is None:
+        return None
+    for key, source_value in source.items():
+        if source_value is None:
+            if keep_none:
+                target[key] = None
+            else:
+                target.pop(key, None)
+            continue
+        if skip_empty and is_empty(source_value):
+            continue
+        if isinstance(source_value, dict):
+            target_value = target.get(key, {})
+            if isinstance(target_value, MappingView):
+                target_value = target_value.dump()
+            elif not isinstance(target_value, dict):
+                target_value = {}
+            recursive_merge(target_value, source_value, keep_none=keep_none, skip_empty=skip_empty)
+            target[key] = target_value
+        else:
+            target[key] = dump_value(source_value)
+    return target
+
+
+def make_document(width, depth, value=0):
+    if not depth:
+        return dict(('field_{}'.format(i), value) for i in range(width))
+    return dict(('nested_{}'.format(i), make_document(width, depth - 1, value)) for i in range(width))
+
+
+def bench(name, func):
+    elapsed = timeit(func, number=NUMBER)
+    print '{:<40} {:10.3f} ms/op'.format(name, elapsed / NUMBER * 1000)
+
+
+def main():
+    # 22 ** 3 ~ 10k leaf keys
+    target = make_document(22, 2)
+    source = make_document(22, 2, 1)
+    bench('recursive merge', lambda: recursive_merge(deepcopy(target), source))
+    bench('merge', lambda: merge(deepcopy(target), source))
+    bench('merge, shared', lambda: merge(dict(target), source, copy=False))
+    bench('deepcopy (baseline)', lambda: deepcopy(target))
+
+    # Deep, mostly empty source, where emptiness checks dominated.
+    deep_source = make_document(4, 6, None)
+    for i in range(4):
+        deep_source['nested_{}'.format(i)] = {'nested': make_document(4, 5)}
+    bench('recursive merge, deep source', lambda: recursive_merge({}, deep_source))
+    bench('merge, deep source', lambda: merge({}, deep_source))
+    bench('merge, deep source, shared', lambda: merge({}, deep_source, copy=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+"""Compare snapshots and diff application for plain dict and PersistentDict backed documents.
+"""
+from copy import deepcopy
+from timeit import timeit
+from cherrycommon.dictutils import PersistentDict, merge
+
+NUMBER = 100
+
+
+def make_document(keys):
+    return dict(('item_{}'.format(i), {'count': i, 'level': 1}) for i in range(keys))
+
+
+def bench(name, func):
+    elapsed = timeit(func, number=NUMBER)
+    print '{:<40} {:10.3f} us/op'.format(name, elapsed / NUMBER * 1000000)
+
+
+def main():
+    document = make_document(5000)
+    persistent = PersistentDict(document)
+    diff = {'item_10': {'count': 0}, 'item_20': None, 'gold': 5}
+
+    bench('dict snapshot (deepcopy)', lambda: deepcopy(document))
+    bench('PersistentDict snapshot', lambda: persistent)
+    bench('dict snapshot and merge', lambda: merge(deepcopy(document), diff))
+    bench('PersistentDict merge', lambda: persistent.merge(diff))
+    bench('dict getitem', lambda: document['item_99'])
+    bench('PersistentDict getitem', lambda: persistent['item_99'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Compare slot based views with cached children against the former Mapping/Sequence based views, which wrapped
+nested values on every access.
+"""
+from collections import Mapping, Sequence
+import sys
+from timeit import timeit
+from cherrycommon.dictutils import DictView, dump_value
+
+NUMBER = 100000
+
+
+class OldListView(Sequence):
+    def __init__(self, sequence):
+        self._data = sequence
+
+    def __getitem__(self, index):
+        return old_view_value(self._data[index])
+
+    def __len__(self):
+        return len(self._data)
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def dump(self):
+        return map(dump_value, self)
+
+
+class OldDictView(Mapping):
+    def __init__(self, data=None):
+        self._data = data or {}
+
+    def __len__(self):
+        return len(self._data)
+
+    def __getitem__(self, item):
+        return old_view_value(self._data[item])
+
+    def keys(self):
+        return self._data.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def dump(self):
+        return dict((key, dump_value(value)) for key, value in self.iteritems())
+
+
+def old_view_value(value):
+    if isinstance(value, str):
+        return unicode(value)
+    elif isinstance(value, (dict, OldDictView)):
+        return OldDictView(value)
+    elif isinstance(value, (list, set, tuple, OldListView)):
+        return OldListView(value)
+    return value
+
+
+CONFIG = {
+    'units': dict(('unit_{}'.format(i), {'stats': {'hp': i, 'damage': [i, i * 2]}, 'name': 'unit'})
+                  for i in range(100)),
+    'version': 1
+}
+
+
+def bench(name, func, number=NUMBER):
+    elapsed = timeit(func, number=number)
+    print '{:<40} {:8.3f} us/op'.format(name, elapsed / number * 1000000)
+
+
+def instance_size(view):
+    size = sys.getsizeof(view)
+    if hasattr(view, '__dict__'):
+        size += sys.getsizeof(view.__dict__)
+    return size
+
+
+def main():
+    for name, view in (('old', OldDictView(CONFIG)), ('new', DictView(CONFIG))):
+        print '{:<40} {:8d} bytes'.format('{} view size'.format(name), instance_size(view))
+        bench('{} nested read'.format(name), lambda: view['units']['unit_50']['stats']['damage'][1])
+        bench('{} iterate values'.format(name), lambda: [unit['stats'] for unit in view['units'].itervalues()],
+              1000)
+        bench('{} dump'.format(name), lambda: view.dump(), 100)
+
+
+if __name__ == '__main__':
+    main()
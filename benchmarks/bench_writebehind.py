@@ -0,0 +1,82 @@
+"""Compare direct DataProvider updates against write-behind buffering, for many small updates of few documents.
+Mongo is replaced with a collection, which sleeps for a round trip on every request, so the numbers show round trips
+saved, rather than the server's own cost.
+"""
+from random import Random
+from time import time, sleep
+from cherrycommon.db import DataProvider
+from cherrycommon.writebehind import WriteBehindBuffer
+
+ROUND_TRIP = 0.0002
+
+
+class Bulk(object):
+    def __init__(self, collection):
+        self.collection = collection
+
+    def find(self, spec):
+        return self
+
+    def upsert(self):
+        return self
+
+    def update_one(self, update):
+        pass
+
+    def execute(self):
+        self.collection.request()
+
+
+class Collection(object):
+    requests = 0
+
+    def request(self):
+        self.requests += 1
+        sleep(ROUND_TRIP)
+
+    def update(self, spec, update, **kwargs):
+        self.request()
+
+    def initialize_ordered_bulk_op(self):
+        return Bulk(self)
+
+
+class BenchDataProvider(DataProvider):
+    def _get_collection(self, host, port, db, collection):
+        return Collection()
+
+
+def generate_updates(count, documents):
+    random = Random(0)
+    for _ in xrange(count):
+        _id = 'player_{}'.format(random.randrange(documents))
+        if random.random() < 0.5:
+            yield _id, {'$inc': {'gold': random.randrange(100), 'stats.kills': 1}}
+        else:
+            yield _id, {'$set': {'position': [random.random(), random.random()], 'stats.hp': random.randrange(100)}}
+
+
+def run(name, provider, updates, flush_every=None):
+    started = time()
+    for i, (_id, update) in enumerate(updates):
+        provider.update(_id, update)
+        if flush_every and i % flush_every == flush_every - 1:
+            provider.write_behind.flush()
+    if provider.write_behind is not None:
+        provider.write_behind.flush()
+    elapsed = time() - started
+    print '{:<40} {:8.3f} us/op {:8d} round trips'.format(
+        name, elapsed / len(updates) * 1e6, provider.collection.requests)
+
+
+def main():
+    updates = list(generate_updates(5000, 50))
+    run('direct', BenchDataProvider('bench', 'players'), updates)
+    for flush_every in (100, 1000):
+        provider = BenchDataProvider('bench', 'players')
+        provider.write_behind = WriteBehindBuffer(provider)
+        run('write-behind, flush every {}'.format(flush_every), provider, updates, flush_every)
+
+
+if __name__ == '__main__':
+    main()
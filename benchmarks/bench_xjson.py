@@ -0,0 +1,52 @@
+"""Compare x-json payload sizes and throughput with and without preset dictionary on small player-like documents.
+"""
+import random
+from timeit import timeit
+from cherrycommon import _xjson
+from cherrycommon.dictutils import encode_json
+
+NUMBER = 10000
+
+
+def make_document(i):
+    return {
+        '_id': 'player_{}'.format(i),
+        'name': 'Player {}'.format(i),
+        'stats': {'level': random.randint(1, 50), 'xp': random.randint(0, 100000), 'gold': random.randint(0, 5000)},
+        'inventory': [{'id': random.choice(['sword', 'shield', 'potion', 'bow']), 'count': random.randint(1, 5)}
+                      for _ in range(random.randint(2, 8))],
+        'quests': dict(('quest_{}'.format(random.randint(1, 30)), {'state': random.choice(['active', 'done'])})
+                       for _ in range(random.randint(1, 6)))
+    }
+
+
+def bench(name, func, number=NUMBER):
+    elapsed = timeit(func, number=number)
+    print '{:<40} {:8.3f} us/op'.format(name, elapsed / number * 1000000)
+
+
+def main():
+    random.seed(1)
+    documents = [make_document(i) for i in range(2000)]
+    dictionary = _xjson.build_dictionary(documents[:1000])
+    _xjson.register_dictionary(1, dictionary)
+    payloads = documents[1000:]
+    raw = sum(len(encode_json(document)) for document in payloads)
+    print '{:<40} {:8d} bytes'.format('dictionary size', len(dictionary))
+    print '{:<40} {:8.1f} bytes'.format('json payload', float(raw) / len(payloads))
+
+    document = payloads[0]
+    for dictionary_id in (None, 1):
+        name = 'dictionary' if dictionary_id else 'plain'
+        _xjson.set_default_dictionary(dictionary_id)
+        compressed = sum(len(_xjson.dumps(document)) for document in payloads)
+        print '{:<40} {:8.1f} bytes, ratio {:.2f}'.format(
+            '{} payload'.format(name), float(compressed) / len(payloads), float(raw) / compressed)
+        encoded = _xjson.dumps(document)
+        bench('{} dumps'.format(name), lambda: _xjson.dumps(document))
+        bench('{} loads'.format(name), lambda: _xjson.loads(encoded))
+    _xjson.set_default_dictionary()
+
+
+if __name__ == '__main__':
+    main()
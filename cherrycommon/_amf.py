@@ -1,5 +1,9 @@
+from types import NoneType
 from zlib import compress, decompress
-from pyamf import encode, decode, register_class_loader, ClassAlias, CLASS_CACHE
+from pyamf import encode, decode, get_encoder, get_decoder, register_class_loader, ClassAlias, CLASS_CACHE, AMF3
+from pyamf.amf3 import encode_int, REFERENCE_BIT
+from cherrycommon.dictutils import MappingView, ListView, PersistentDict, _diffed_items, _raw_view_types, \
+    _raw_diffed_types
 
 _amf_aliases = {}
 
@@ -22,28 +26,123 @@ def _class_loader(alias):
 register_class_loader(_class_loader)
 
 
-def _keys_to_string(s):
-    if isinstance(s, dict):
-        re = {}
-        for k, v in s.iteritems():
-            k = unicode(k)
-            if not k:
+# Values of these types are encoded as is.
+_scalar_types = frozenset([str, unicode, int, long, float, bool, NoneType])
+
+
+def _plain_value(value):
+    """Makes value encodable: stringifies keys, drops empty ones and unwraps views. Dicts and lists are copied only if
+    something in them has to be changed, otherwise value is returned as is.
+    """
+    cls = value.__class__
+    if cls in _scalar_types:
+        return value
+    elif cls is dict or isinstance(value, dict):
+        # Subclasses, e.g. OrderedDict, are encoded as plain dicts.
+        result = None if cls is dict else dict(value)
+        for key, item in value.iteritems():
+            plain_item = item if item.__class__ in _scalar_types else _plain_value(item)
+            key_cls = key.__class__
+            # pyamf writes int keys as strings itself, but silently breaks the stream on empty keys.
+            if (key_cls is str or key_cls is unicode) and key or key_cls is int or key_cls is long:
+                if plain_item is item:
+                    continue
+                if result is None:
+                    result = dict(value)
+                result[key] = plain_item
+            else:
+                if result is None:
+                    result = dict(value)
+                del result[key]
+                key = unicode(key)
+                if key:
+                    result[key] = plain_item
+        return value if result is None else result
+    elif cls is list or cls is tuple:
+        result = None
+        for index, item in enumerate(value):
+            if item.__class__ in _scalar_types:
                 continue
-            re[k] = _keys_to_string(v)
-        return re
-    elif isinstance(s, (list, tuple, set)):
-        re = []
-        for v in s:
-            re.append(_keys_to_string(v))
-        return re
-    else:
-        return s
+            plain_item = _plain_value(item)
+            if plain_item is not item:
+                if result is None:
+                    result = list(value)
+                result[index] = plain_item
+        return value if result is None else result
+    elif cls is set:
+        return map(_plain_value, value)
+    elif cls in _raw_diffed_types:
+        return _plain_value(_diffed_items(value))
+    elif cls in _raw_view_types:
+        return _plain_value(value._data)
+    elif cls is PersistentDict:
+        return _plain_value(dict(value.iteritems()))
+    elif isinstance(value, (MappingView, ListView, PersistentDict)):
+        # Subclasses may override dump, e.g. to exclude fields.
+        return _plain_value(value.dump())
+    return value
 
 
 def dumps(s):
-    return compress(encode(_keys_to_string(s)).read())
+    return compress(encode(_plain_value(s)).read())
 
 
 def loads(s):
     for data in decode(decompress(s)):
-        return data
\ No newline at end of file
+        return data
+
+
+class AMFContext(object):
+    """Keeps AMF3 string and class trait reference tables across messages of one session, e.g. connection with a
+    client, so keys, repeated string values and traits are sent in full only once. The other side should decode
+    messages with the same kind of context, in the same order they were encoded. Object references are not kept, since
+    objects may change between messages.
+
+    :param max_strings: max number of strings kept in the session table. Strings are kept in the order they were met
+     first, so both sides get the same table.
+    """
+
+    def __init__(self, max_strings=4096):
+        self.max_strings = max_strings
+        self._encode_strings = []
+        self._encode_classes = []
+        self._decode_strings = []
+        self._decode_classes = []
+
+    @staticmethod
+    def _restore(context, strings, classes):
+        for string in strings:
+            context.addString(string)
+        for class_definition in classes:
+            context.addClass(class_definition, class_definition.alias.klass)
+            if hasattr(class_definition, 'reference'):
+                # Pure python pyamf expects references of known classes to be encoded already.
+                class_definition.reference = encode_int(class_definition.reference << 2 | REFERENCE_BIT)
+
+    def _store(self, context, strings, classes):
+        for ref in xrange(len(strings), self.max_strings):
+            string = context.getString(ref)
+            if string is None:
+                break
+            strings.append(string)
+        ref = len(classes)
+        while True:
+            class_definition = context.getClassByReference(ref)
+            if class_definition is None:
+                break
+            classes.append(class_definition)
+            ref += 1
+
+    def dumps(self, s):
+        encoder = get_encoder(AMF3)
+        self._restore(encoder.context, self._encode_strings, self._encode_classes)
+        encoder.writeElement(_plain_value(s))
+        self._store(encoder.context, self._encode_strings, self._encode_classes)
+        return compress(encoder.stream.getvalue())
+
+    def loads(self, s):
+        decoder = get_decoder(AMF3, decompress(s))
+        self._restore(decoder.context, self._decode_strings, self._decode_classes)
+        data = decoder.readElement()
+        self._store(decoder.context, self._decode_strings, self._decode_classes)
+        return data
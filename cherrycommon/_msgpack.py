@@ -0,0 +1,13 @@
+"""This is a msgpack adapter for encode_data and decode_data methods. Strings are packed as raw strings and unpacked
+as unicode, the same way JSON does it. Views and Diffed objects are packed straight from their data.
+"""
+from msgpack import packb, unpackb
+from cherrycommon.dictutils import _encode_default
+
+
+def dumps(s):
+    return packb(s, default=_encode_default)
+
+
+def loads(s):
+    return unpackb(s, raw=False)
@@ -1,11 +1,166 @@
-from zlib import compress, decompress
-from json import dumps as _dumps
-from json import loads as _loads
+"""This is x-json adapter for encode_data and decode_data methods: JSON compressed with zlib.
+
+Small payloads are compressed much better with a preset dictionary, built from sample payloads with
+:func:`build_dictionary`. Dictionaries are registered by id, which is stored in compressed payloads, so payloads
+compressed with old dictionaries could be decoded as long as those are registered::
+
+    register_dictionary(1, open('x-json.1.dict', 'rb').read(), default=True)
+
+Payloads without dictionary are plain zlib streams, the same as before. Dictionary could be built from documents of a
+collection with ``python -m cherrycommon._xjson db collection x-json.1.dict``.
+"""
+from collections import defaultdict
+import re
+from zlib import compress, decompress, compressobj, decompressobj, Z_DEFAULT_COMPRESSION, DEFLATED, Z_SYNC_FLUSH
+from cherrycommon.dictutils import encode_json, decode_json, _reservoir
+
+# zlib header never starts with this byte, so payloads compressed with dictionary are told apart by it.
+_DICTIONARY_MARKER = '\xff'
+# Deflate window is 32k, the rest of larger dictionary would be never referenced.
+MAX_DICTIONARY_SIZE = 32 * 1024
+
+
+class _Dictionary(object):
+    """Compressor and decompressor, which have already processed the dictionary. Python 2 zlib doesn't accept preset
+    dictionaries, so the dictionary is compressed as a raw deflate stream and flushed, then primed objects are copied
+    for each payload, so payloads may reference the dictionary the same way they'd reference a preset one.
+    """
+
+    __slots__ = 'header', 'compressor', 'decompressor'
+
+    def __init__(self, dictionary_id, dictionary, level=Z_DEFAULT_COMPRESSION):
+        dictionary = dictionary[-MAX_DICTIONARY_SIZE:]
+        self.header = _DICTIONARY_MARKER + chr(dictionary_id)
+        self.compressor = compressobj(level, DEFLATED, -15)
+        primed = self.compressor.compress(dictionary) + self.compressor.flush(Z_SYNC_FLUSH)
+        self.decompressor = decompressobj(-15)
+        self.decompressor.decompress(primed)
+
+    def compress(self, data):
+        compressor = self.compressor.copy()
+        return ''.join((self.header, compressor.compress(data), compressor.flush()))
+
+    def decompress(self, data):
+        decompressor = self.decompressor.copy()
+        return decompressor.decompress(buffer(data, len(self.header))) + decompressor.flush()
+
+
+_dictionaries = {}
+_default_dictionary = None
+
+
+def register_dictionary(dictionary_id, dictionary, default=False):
+    """Registers preset dictionary for x-json compression.
+
+    :param dictionary_id: id, which is stored in compressed payloads, from 0 to 255.
+    :param dictionary: dictionary built with :func:`build_dictionary`.
+    :param default: use dictionary to compress payloads in :func:`dumps`.
+    """
+    global _default_dictionary
+    if not 0 <= dictionary_id <= 255:
+        raise ValueError('Dictionary id should be from 0 to 255. Got {}'.format(dictionary_id))
+    _dictionaries[dictionary_id] = _Dictionary(dictionary_id, dictionary)
+    if default:
+        _default_dictionary = _dictionaries[dictionary_id]
+
+
+def set_default_dictionary(dictionary_id=None):
+    """Sets registered dictionary to compress payloads with. If dictionary_id is None, payloads are compressed without
+    dictionary.
+    """
+    global _default_dictionary
+    _default_dictionary = None if dictionary_id is None else _dictionaries[dictionary_id]
 
 
 def dumps(s):
-    return compress(_dumps(s))
+    if _default_dictionary is None:
+        return compress(encode_json(s))
+    return _default_dictionary.compress(encode_json(s))
 
 
 def loads(s):
-    return _loads(decompress(s))
\ No newline at end of file
+    if s[:1] != _DICTIONARY_MARKER:
+        return decode_json(decompress(s))
+    try:
+        dictionary = _dictionaries[ord(s[1])]
+    except (KeyError, IndexError):
+        raise ValueError('Unknown x-json dictionary: {!r}'.format(s[1:2]))
+    return decode_json(dictionary.decompress(s))
+
+
+# JSON strings, with quotes, and runs of everything else between them.
+_piece_pattern = re.compile(r'"(?:[^"\\]|\\.)*"|[^"]+')
+
+
+def build_dictionary(documents, size=16 * 1024, max_pieces=4):
+    """Builds preset dictionary for x-json compression from sample documents. Dictionary is made of substrings, which
+    are found in the most of samples, like keys together with the punctuation around them. Substrings, which save the
+    most, are put to the end of dictionary, closer to compressed data.
+
+    :param documents: sample documents, encoded the same way payloads are.
+    :param size: max size of dictionary in bytes.
+    :param max_pieces: max number of JSON strings and runs between them joined in one substring.
+    :rtype: str
+    """
+    size = min(size, MAX_DICTIONARY_SIZE)
+    counts = defaultdict(int)
+    for document in documents:
+        pieces = _piece_pattern.findall(encode_json(document))
+        substrings = set()
+        for start in xrange(len(pieces)):
+            for end in xrange(start + 1, min(start + max_pieces, len(pieces)) + 1):
+                substrings.add(''.join(pieces[start:end]))
+        for substring in substrings:
+            counts[substring] += 1
+
+    # Substrings found only once don't repeat across payloads.
+    scored = sorted(((count * len(substring), substring) for substring, count in counts.iteritems() if count > 1),
+                    reverse=True)
+    chosen = []
+    total = 0
+    for score, substring in scored:
+        if total + len(substring) > size:
+            continue
+        if any(substring in other for other in chosen):
+            continue
+        chosen.append(substring)
+        total += len(substring)
+        if total >= size:
+            break
+    chosen.reverse()
+    return ''.join(chosen)
+
+
+def sample_dictionary(data_provider, sample=1000, size=16 * 1024, **kwargs):
+    """Builds dictionary with :func:`build_dictionary` from random sample of documents from
+    :class:`cherrycommon.db.DataProvider`.
+
+    :param sample: number of documents to sample.
+    :param kwargs: passed to ``data_provider.find``.
+    """
+    return build_dictionary(_reservoir(data_provider.find(**kwargs), sample), size)
+
+
+def main():
+    from argparse import ArgumentParser
+    from cherrycommon.db import DataProvider, DEFAULT_HOST, DEFAULT_PORT
+
+    parser = ArgumentParser(description='Build x-json compression dictionary from documents in collection.')
+    parser.add_argument('db')
+    parser.add_argument('collection')
+    parser.add_argument('output', help='Path to dictionary file.')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', default=DEFAULT_PORT, type=int)
+    parser.add_argument('--sample', default=1000, type=int, help='Number of documents to sample.')
+    parser.add_argument('--size', default=16 * 1024, type=int, help='Max dictionary size in bytes.')
+    args = parser.parse_args()
+
+    data_provider = DataProvider(args.db, args.collection, host=args.host, port=args.port)
+    dictionary = sample_dictionary(data_provider, args.sample, args.size)
+    with open(args.output, 'wb') as f:
+        f.write(dictionary)
+    print 'Dictionary of {} bytes saved to {}'.format(len(dictionary), args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""Non-blocking access to mongo collections from IOLoop based processes. Blocking :class:`cherrycommon.db.DataProvider`
+calls are run in a bounded pool of threads, and their results are delivered as tornado futures, so they could be
+yielded from coroutines::
+
+    players = AsyncDataProvider('game', 'players', use_cache=True)
+
+    @coroutine
+    def get_friends(player_id):
+        player = yield players.get(player_id)
+        friends = yield players.get_many(player['friends'])
+        raise Return(friends)
+"""
+from Queue import Queue
+import sys
+from threading import Thread, Lock
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+from cherrycommon.db import DataProvider, DEFAULT_HOST, DEFAULT_PORT
+
+DEFAULT_MAX_WORKERS = 8
+
+
+class ThreadPool(object):
+    """Runs blocking calls in up to max_workers daemon threads. Futures are resolved on the IOLoop of the thread,
+    which submitted the call. Calls are queued, while all threads are busy.
+
+    :param max_workers: max number of threads, which also bounds number of concurrent queries to the database.
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS):
+        self.max_workers = max_workers
+        self._queue = Queue()
+        self._threads = []
+        self._lock = Lock()
+        self._shutdown = False
+
+    def submit(self, fn, *args, **kwargs):
+        """Runs fn(*args, **kwargs) in a pool thread.
+
+        :rtype: tornado.concurrent.Future
+        """
+        if self._shutdown:
+            raise RuntimeError('Thread pool is shut down.')
+        future = Future()
+        self._queue.put((future, IOLoop.current(), fn, args, kwargs))
+        if len(self._threads) < self.max_workers:
+            self._add_thread()
+        return future
+
+    def _add_thread(self):
+        with self._lock:
+            if len(self._threads) < self.max_workers:
+                thread = Thread(target=self._work, name='ThreadPool-{}'.format(len(self._threads)))
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+            future, loop, fn, args, kwargs = task
+            try:
+                result = fn(*args, **kwargs)
+            except Exception:
+                loop.add_callback(future.set_exc_info, sys.exc_info())
+            else:
+                loop.add_callback(future.set_result, result)
+            del task, future, loop
+
+    def shutdown(self, wait=True):
+        """Stops threads, after queued calls are done.
+        """
+        with self._lock:
+            self._shutdown = True
+            for _ in self._threads:
+                self._queue.put(None)
+            threads, self._threads = self._threads, []
+        if wait:
+            for thread in threads:
+                thread.join()
+
+
+_default_pool = None
+
+
+def get_default_pool():
+    """Returns thread pool shared by data providers, which are created without one.
+    """
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = ThreadPool()
+    return _default_pool
+
+
+class AsyncDataProvider(object):
+    """The same as :class:`cherrycommon.db.DataProvider`, but methods return futures instead of blocking. Documents,
+    which are cached, are returned without going to a pool thread. Cursors are read in the pool thread, so find and all
+    resolve with lists.
+
+    :param pool: :class:`ThreadPool` to run queries in, the shared one by default.
+    """
+
+    data_provider_class = DataProvider
+
+    def __init__(self, db, collection, use_cache=False, indexes=None, host=DEFAULT_HOST, port=DEFAULT_PORT, pool=None):
+        self.data_provider = self.data_provider_class(db, collection, use_cache=use_cache, indexes=indexes, host=host,
+                                                      port=port)
+        self.pool = pool or get_default_pool()
+
+    @property
+    def use_cache(self):
+        return self.data_provider.use_cache
+
+    def _submit(self, fn, *args, **kwargs):
+        return self.pool.submit(fn, *args, **kwargs)
+
+    @staticmethod
+    def _resolved(result):
+        future = Future()
+        future.set_result(result)
+        return future
+
+    def get(self, _id, include_fields=None, exclude_fields=None, force_reload=False):
+        if not force_reload:
+            document = self.data_provider.get_cached(_id)
+            if document is not None:
+                return self._resolved(document)
+        return self._submit(self.data_provider.get, _id, include_fields=include_fields, exclude_fields=exclude_fields,
+                            force_reload=force_reload)
+
+    def get_many(self, ids, include_fields=None, exclude_fields=None, force_reload=False):
+        return self._submit(self.data_provider.get_many, ids, include_fields=include_fields,
+                            exclude_fields=exclude_fields, force_reload=force_reload)
+
+    def _find(self, *args, **kwargs):
+        return list(self.data_provider.find(*args, **kwargs))
+
+    def find(self, *args, **kwargs):
+        return self._submit(self._find, *args, **kwargs)
+
+    def find_one(self, spec, *args, **kwargs):
+        return self._submit(self.data_provider.find_one, spec, *args, **kwargs)
+
+    def find_and_modify(self, *args, **kwargs):
+        return self._submit(self.data_provider.find_and_modify, *args, **kwargs)
+
+    def all(self, include_fields=None, exclude_fields=None, keys=False, *args, **kwargs):
+        return self.find(include_fields=include_fields, exclude_fields=exclude_fields, keys=keys, *args, **kwargs)
+
+    def ids(self):
+        return self._submit(self.data_provider.ids)
+
+    def keys(self):
+        return self.ids()
+
+    def save(self, document, safe=False):
+        return self._submit(self.data_provider.save, document, safe=safe)
+
+    def insert(self, documents, **kwargs):
+        return self._submit(self.data_provider.insert, documents, **kwargs)
+
+    def update(self, spec, update, **kwargs):
+        return self._submit(self.data_provider.update, spec, update, **kwargs)
+
+    def bulk_update(self, updates):
+        return self._submit(self.data_provider.bulk_update, updates)
+
+    def remove(self, spec=None):
+        return self._submit(self.data_provider.remove, spec)
@@ -0,0 +1,141 @@
+from threading import Lock
+from time import time
+
+# Fields of the linked list entries.
+_PREV, _NEXT, _KEY, _VALUE, _SIZE, _EXPIRES = range(6)
+
+
+class LRUCache(object):
+    """Thread safe mapping with bounded number of entries and/or total size. Least recently used entries are evicted,
+    when a bound is exceeded. Entries could also expire after ttl seconds since they were set.
+
+    :param max_entries: max number of entries, None means unlimited.
+    :param max_size: max total size of entries, measured with size_of, None means unlimited.
+    :param ttl: seconds, after which entries expire, None means never.
+    :param size_of: function, which returns size of value. Required if max_size is set.
+    """
+
+    def __init__(self, max_entries=None, max_size=None, ttl=None, size_of=None):
+        if max_size is not None and size_of is None:
+            raise ValueError('size_of is required to limit size of cache.')
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.ttl = ttl
+        self._size_of = size_of
+        self._lock = Lock()
+        self._entries = {}
+        # Circular doubly linked list, the root's next entry is the least recently used one.
+        self._root = root = []
+        root[:] = [root, root, None, None, 0, None]
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _unlink(self, entry):
+        prev_entry, next_entry = entry[_PREV], entry[_NEXT]
+        prev_entry[_NEXT] = next_entry
+        next_entry[_PREV] = prev_entry
+
+    def _link(self, entry):
+        root = self._root
+        last = root[_PREV]
+        entry[_PREV] = last
+        entry[_NEXT] = root
+        last[_NEXT] = root[_PREV] = entry
+
+    def _remove(self, entry):
+        self._unlink(entry)
+        del self._entries[entry[_KEY]]
+        self.size -= entry[_SIZE]
+
+    def __getitem__(self, key):
+        with self._lock:
+            try:
+                entry = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                raise
+            if entry[_EXPIRES] is not None and entry[_EXPIRES] <= time():
+                self._remove(entry)
+                self.expirations += 1
+                self.misses += 1
+                raise KeyError(key)
+            self._unlink(entry)
+            self._link(entry)
+            self.hits += 1
+            return entry[_VALUE]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        size = self._size_of(value) if self._size_of is not None else 0
+        expires = time() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._remove(entry)
+            entry = self._entries[key] = [None, None, key, value, size, expires]
+            self._link(entry)
+            self.size += size
+            self._evict()
+
+    def _evict(self):
+        root = self._root
+        while ((self.max_entries is not None and len(self._entries) > self.max_entries) or
+               (self.max_size is not None and self.size > self.max_size)):
+            self._remove(root[_NEXT])
+            self.evictions += 1
+
+    def __delitem__(self, key):
+        with self._lock:
+            self._remove(self._entries[key])
+
+    def pop(self, key, *default):
+        with self._lock:
+            try:
+                entry = self._entries[key]
+            except KeyError:
+                if default:
+                    return default[0]
+                raise
+            self._remove(entry)
+            return entry[_VALUE]
+
+    def __contains__(self, key):
+        entry = self._entries.get(key)
+        return entry is not None and (entry[_EXPIRES] is None or entry[_EXPIRES] > time())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(list(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            root = self._root
+            root[_PREV] = root[_NEXT] = root
+            self.size = 0
+
+    def get_stats(self):
+        """Returns dict with number of hits, misses, evictions and expirations, and current number of entries and
+        their total size.
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'entries': len(self._entries),
+            'size': self.size
+        }
+
+    def __repr__(self):
+        return 'LRUCache({})'.format(self.get_stats())
@@ -1,8 +1,11 @@
 from collections import MutableMapping
+from bson import ObjectId, BSON
 from pymongo import MongoClient, Connection
 from collections import Mapping
-from cherrycommon.dictutils import MappingView, dump_value, Diffed
+from cherrycommon.dictutils import MappingView, dump_value, Diffed, PersistentDict, Increment, ListItems, merge, \
+    is_empty
 from cherrycommon.timeutils import seconds
+from cherrycommon.cache import LRUCache
 
 DEFAULT_HOST = 'localhost'
 DEFAULT_PORT = 27017
@@ -29,6 +32,107 @@ def get_mongo_client(host=DEFAULT_HOST, port=DEFAULT_PORT, **kwargs):
         return client
 
 
+_unset = object()
+
+
+def _get_path(prefix, key):
+    if prefix:
+        return '{}.{}'.format(prefix, key)
+    return key
+
+
+def _squash_diff(node, diff):
+    """Squashes diff into the node of update tree. Nested dicts of the node are nested nodes, _unset marks deleted
+    fields, Increments and ListItems are kept as is and one-item tuples hold values, which replace the whole field.
+    """
+    for key, value in diff.iteritems():
+        if value is None:
+            node[key] = _unset
+        elif isinstance(value, (dict, PersistentDict)):
+            operation = node.get(key)
+            if isinstance(operation, dict):
+                _squash_diff(operation, value)
+            elif operation is None:
+                _squash_diff(node.setdefault(key, {}), value)
+            else:
+                # Field was replaced or deleted earlier in the chain, so the diff is merged into the new value.
+                if not is_empty(value):
+                    target = operation[0] if isinstance(operation, tuple) and isinstance(operation[0], dict) else {}
+                    node[key] = (merge(target, value),)
+        elif value.__class__ is Increment:
+            operation = node.get(key)
+            if operation is None:
+                node[key] = value
+            elif operation.__class__ is Increment:
+                node[key] = value.apply(operation)
+            elif operation is _unset:
+                node[key] = (value.delta,)
+            elif isinstance(operation, dict):
+                raise TypeError('Nested document {} could not be incremented.'.format(key))
+            else:
+                node[key] = (value.apply(operation[0]),)
+        elif value.__class__ is ListItems:
+            operation = node.get(key)
+            if operation is None:
+                node[key] = value
+            elif operation.__class__ is ListItems:
+                node[key] = value.apply(operation)
+            elif operation is _unset:
+                node[key] = (value.apply(None),)
+            elif isinstance(operation, dict) or operation.__class__ is Increment:
+                raise TypeError('Items of {} could not be set, it is not a list.'.format(key))
+            else:
+                node[key] = (value.apply(operation[0]),)
+        else:
+            node[key] = (dump_value(value),)
+
+
+def _fill_update(node, prefix, update):
+    for key, operation in node.iteritems():
+        path = _get_path(prefix, key)
+        if operation is _unset:
+            update.setdefault('$unset', {})[path] = 1
+        elif isinstance(operation, dict):
+            _fill_update(operation, path, update)
+        elif operation.__class__ is Increment:
+            update.setdefault('$inc', {})[path] = operation.delta
+        elif operation.__class__ is ListItems:
+            for index, item in operation.items.iteritems():
+                update.setdefault('$set', {})['{}.{}'.format(path, index)] = dump_value(item)
+        else:
+            update.setdefault('$set', {})[path] = operation[0]
+
+
+def get_update(*diffs):
+    """Converts chain of diffs, as used by Diffed, into a single Mongo update document with $set, $unset and $inc
+    operators. Nested dicts are updated by dotted paths, so only changed fields are written. DictViews and other
+    values replace the whole field, None deletes it, Increments are summed up into $inc. ListItems are translated
+    into "items.2" paths, so list items could be updated as well. Fields, changed by nested dicts, are expected to be
+    dicts in the stored document, use DictView to replace a value of other type.
+
+    Examples:
+        >>> get_update({'gold': 10, 'stats': {'level': 2, 'bonus': None}}, {'items': ListItems({0: 'sword'})})
+        {'$set': {'gold': 10, 'stats.level': 2, 'items.0': 'sword'}, '$unset': {'stats.bonus': 1}}
+
+    :param diffs: diffs in order of applying.
+    :type diffs: dict or DictView or PersistentDict
+    :rtype: dict
+    :return: update document, empty if nothing should be changed.
+    """
+    tree = {}
+    for diff in diffs:
+        if diff is None:
+            raise ValueError('Document removal can not be converted into update.')
+        _squash_diff(tree, diff)
+    update = {}
+    _fill_update(tree, '', update)
+    return update
+
+
+def _document_size(document):
+    return len(BSON.encode(document))
+
+
 class DataProvider(Mapping):
     def _get_collection(self, host, port, db, collection):
         try:
@@ -43,9 +147,62 @@ class DataProvider(Mapping):
 
     _global_cache = {}
 
+    # Document caches are created per collection from cache_class with cache_options, unless configured explicitly.
+    cache_class = LRUCache
+    cache_options = {'max_entries': 10000}
+
     @classmethod
     def _get_cache(cls, db, collection):
-        return cls._global_cache.setdefault((db, collection), {})
+        try:
+            return cls._global_cache[(db, collection)]
+        except KeyError:
+            return cls._global_cache.setdefault((db, collection), cls._create_cache(**cls.cache_options))
+
+    @classmethod
+    def _create_cache(cls, **options):
+        if options.get('max_size') is not None:
+            options.setdefault('size_of', _document_size)
+        return cls.cache_class(**options)
+
+    @classmethod
+    def configure_cache(cls, db, collection, **options):
+        """Replaces document cache of collection with the new one, e.g. to set bounds or TTL for the collection::
+
+            DataProvider.configure_cache('game', 'players', max_size=64 * 1024 * 1024, ttl=seconds(minutes=10))
+
+        Data providers, which are already created for the collection, keep using the previous cache.
+
+        :param options: passed to cache_class. If max_size is set, sizes of documents are measured in BSON bytes.
+        """
+        cache = cls._global_cache[(db, collection)] = cls._create_cache(**options)
+        return cache
+
+    # Object with invalidate(db, collection, _id=None) method, which is notified about changed documents, so it could
+    # drop them from caches of other processes, see cherrycommon.invalidation.
+    cache_invalidator = None
+
+    # Buffer, which coalesces updates of single documents, see cherrycommon.writebehind.WriteBehindBuffer.
+    write_behind = None
+
+    @classmethod
+    def drop_cached(cls, db, collection, _id=None):
+        """Drops document from cache of collection in this process, or the whole cache if _id is None.
+        """
+        cache = cls._global_cache.get((db, collection))
+        if cache is not None:
+            if _id is None:
+                cache.clear()
+            else:
+                cache.pop(_id, None)
+
+    @classmethod
+    def get_cache_stats(cls):
+        """Returns cache stats, see :meth:`cherrycommon.cache.LRUCache.get_stats`, for each cached collection.
+
+        :rtype: dict
+        :return: stats by (db, collection) tuples.
+        """
+        return dict((key, cache.get_stats()) for key, cache in cls._global_cache.items())
 
     _index_ttl = seconds(hours=1)
 
@@ -66,14 +223,27 @@ class DataProvider(Mapping):
             self._cache = None
 
     def _drop_cache_entry(self, pk):
-        if self._cache:
-            try:
-                del self._cache[pk]
-            except KeyError:
-                pass
+        if self._cache is not None:
+            self._cache.pop(pk, None)
+
+    def _invalidate(self, pk=None):
+        """Drops changed document, or all documents if pk is None, from cache and notifies cache_invalidator.
+        """
+        if pk is None:
+            if self._cache is not None:
+                self._cache.clear()
+        else:
+            self._drop_cache_entry(pk)
+        if self.cache_invalidator is not None:
+            self.cache_invalidator.invalidate(self._db_name, self._collection_name, pk)
+
+    def _flush_write_behind(self):
+        # Buffered updates should reach the collection before writes issued after them.
+        if self.write_behind is not None:
+            self.write_behind.flush()
 
     def _prepare_fields(self, include_fields, exclude_fields):
-        if self._cache:
+        if self._cache is not None:
             return None
         if include_fields:
             fields = dict.fromkeys(include_fields, 1)
@@ -85,6 +255,12 @@ class DataProvider(Mapping):
     def use_cache(self):
         return self._cache is not None
 
+    def get_cached(self, _id):
+        """Get document from cache without querying collection. Returns None if it's not cached.
+        """
+        if self._cache is not None:
+            return self._cache.get(_id)
+
     def get(self, _id, include_fields=None, exclude_fields=None, force_reload=False):
         """
         Get document from collection by its primary key. 'fields' argument does not matter,
@@ -104,6 +280,45 @@ class DataProvider(Mapping):
                 self._drop_cache_entry(_id)
         return document
 
+    # Max number of ids in one $in query of get_many.
+    get_many_chunk_size = 1000
+
+    def get_many(self, ids, include_fields=None, exclude_fields=None, force_reload=False):
+        """Get documents from collection by their primary keys. Cached documents are taken from cache, the rest are
+        fetched with $in queries of up to get_many_chunk_size ids each and cached.
+
+        :return: list of documents in order of ids, with None for ids, which are not found.
+        """
+        ids = list(ids)
+        found = {}
+        missing = []
+        if self.use_cache and (not force_reload):
+            for _id in ids:
+                if _id in found:
+                    continue
+                document = self._cache.get(_id)
+                if document is None:
+                    missing.append(_id)
+                found[_id] = document
+        else:
+            missing = list(set(ids))
+
+        if missing:
+            fields = self._prepare_fields(include_fields, exclude_fields)
+            chunk_size = self.get_many_chunk_size
+            for start in xrange(0, len(missing), chunk_size):
+                chunk = missing[start:start + chunk_size]
+                for document in self._collection.find({'_id': {'$in': chunk}}, fields=fields):
+                    found[document['_id']] = document
+                if self.use_cache:
+                    for _id in chunk:
+                        document = found.get(_id)
+                        if document:
+                            self._cache[_id] = document
+                        else:
+                            self._drop_cache_entry(_id)
+        return [found.get(_id) for _id in ids]
+
     @staticmethod
     def _keys_iterator(cursor):
         for document in cursor:
@@ -125,7 +340,11 @@ class DataProvider(Mapping):
     def find_and_modify(self, *args, **kwargs):
         """Executes find and modify against the collection.
         """
-        return self._collection.find_and_modify(*args, **kwargs)
+        self._flush_write_behind()
+        document = self._collection.find_and_modify(*args, **kwargs)
+        if document and '_id' in document:
+            self._invalidate(document['_id'])
+        return document
 
     def find_one(self, spec, *args, **kwargs):
         include_fields = kwargs.pop('include_fields', {})
@@ -150,9 +369,10 @@ class DataProvider(Mapping):
     def save(self, document, safe=False):
         """Saves document in collection. Creates one, if not exists yet.
         """
+        self._flush_write_behind()
         self._collection.save(document, safe=safe)
-        if hasattr(document, '_id'):
-            self._drop_cache_entry(document['_id'])
+        if '_id' in document:
+            self._invalidate(document['_id'])
 
     def insert(self, documents, **kwargs):
         """Stores documents into the collection.
@@ -161,42 +381,72 @@ class DataProvider(Mapping):
         """
         if not isinstance(documents, list):
             documents = [documents]
+        self._flush_write_behind()
         self._collection.insert(documents, **kwargs)
 
     def update(self, spec, update, **kwargs):
         """Updates documents in collection.
         You can also pass named args, supported by pymongo.Collection.update method.
         Warning! Update with query will reset all cached documents for this collection.
+        If write_behind is set, updates of a single document with operators, e.g. $set, are buffered and written
+        later. Replacement documents are written immediately.
 
         :param spec: id, list of ids or query for documents to update.
         :type spec: dict or list of basestring or tuple of basestring or basestring or bson.ObjectID
         :param update: update specification
         :type update: dict
         """
-        #TODO: drop document from cache, if necessary
         if isinstance(spec, dict):
             multi = True
+            ids = None,
         elif isinstance(spec, (list, set,)):
             multi = True
-            spec = {'_id': {'$in': spec}}
-        elif isinstance(spec, basestring):
+            ids = spec
+            spec = {'_id': {'$in': list(spec)}}
+        elif isinstance(spec, (basestring, ObjectId)):
+            if (self.write_behind is not None and set(kwargs) <= {'upsert'} and update and
+                    all(key.startswith('$') for key in update)):
+                self.write_behind.update(spec, update, upsert=kwargs.get('upsert', False))
+                return
+            ids = spec,
             spec = {'_id': spec}
             multi = False
         else:
             raise TypeError('Invalid query: {}'.format(spec))
         kwargs.setdefault('multi', multi)
+        self._flush_write_behind()
         self._collection.update(spec, update, safe=True, **kwargs)
+        for _id in ids:
+            self._invalidate(_id)
+
+    def bulk_update(self, updates):
+        """Updates single documents with one ordered bulk write.
+
+        :param updates: list of (_id, update, upsert) tuples.
+        """
+        bulk = self._collection.initialize_ordered_bulk_op()
+        for _id, update, upsert in updates:
+            if upsert:
+                bulk.find({'_id': _id}).upsert().update_one(update)
+            else:
+                bulk.find({'_id': _id}).update_one(update)
+        try:
+            return bulk.execute()
+        finally:
+            for _id in set(_id for _id, _, _ in updates):
+                self._invalidate(_id)
 
     def remove(self, spec=None):
-        if spec is not None:
-            if isinstance(spec, basestring):
-                self._drop_cache_entry(spec)
-                spec = {'_id': spec}
-            self._collection.remove(spec)
-        else:
+        self._flush_write_behind()
+        if spec is None:
             self._collection.remove()
-            if self.use_cache:
-                self._cache.clear()
+            self._invalidate()
+        elif isinstance(spec, (basestring, ObjectId)):
+            self._collection.remove({'_id': spec})
+            self._invalidate(spec)
+        else:
+            self._collection.remove(spec)
+            self._invalidate()
 
     # Mapping implementation
     def __getitem__(self, item):
@@ -311,6 +561,16 @@ class Proxy(MappingView):
             raise KeyError('Document "{}" not found'.format(_id))
         return document
 
+    @classmethod
+    def get_many(cls, ids):
+        """Creates proxies for documents with given ids, see :meth:`DataProvider.get_many`.
+
+        :return: list of proxies in order of ids, with None for ids, which are not found.
+        """
+        documents = cls.get_data_provider().get_many(
+            ids, include_fields=cls.include_fields, exclude_fields=cls.exclude_fields)
+        return [cls(data=document) if document else None for document in documents]
+
     @classmethod
     def all(cls):
         for data in cls.get_data_provider().find(
@@ -340,9 +600,12 @@ class Proxy(MappingView):
 
 
 class DiffedProxy(Proxy, MutableMapping):
+    max_depth = None
+    max_size = None
+
     def __init__(self, _id=None, data=None, diffs=()):
         super(DiffedProxy, self).__init__(_id=_id, data=data)
-        self._data = Diffed(self._data)
+        self._data = Diffed(self._data, max_depth=self.max_depth, max_size=self.max_size)
         self.add_diff(*diffs)
 
     @property
@@ -358,6 +621,18 @@ class DiffedProxy(Proxy, MutableMapping):
     def apply_diff(self, *diffs):
         self._data.apply_diff(*diffs)
 
+    def pin_diff(self, *diffs):
+        self._data.pin_diff(*diffs)
+
+    def unpin_diff(self, *diffs):
+        self._data.unpin_diff(*diffs)
+
+    def compact(self):
+        return self._data.compact()
+
+    def snapshot(self):
+        return self._data.snapshot()
+
     def flatten_diff(self, *diffs):
         self._data.flatten_diff(*diffs)
 
@@ -373,12 +648,37 @@ class DiffedProxy(Proxy, MutableMapping):
     def dump_diff(self):
         return self._data.dump_diff()
 
+    def get_update(self):
+        """Returns Mongo update document for all the diffs applied.
+        """
+        return get_update(*self.diffs)
+
+    def commit(self):
+        """Saves the diffs with a single update of changed fields and flattens them into the data. Empty diff is
+        added afterwards, so the proxy could be changed further.
+
+        :return: update document sent to the database.
+        """
+        update = self.get_update()
+        if update:
+            self.get_data_provider().update(self.id, update)
+        if self.diffs:
+            self.flatten()
+            self.add_diff({})
+        return update
+
     def __setitem__(self, item, value):
         self._data[item] = value
 
     def __delitem__(self, key):
         del self._data[key]
 
+    def incr(self, item, delta=1):
+        return self._data.incr(item, delta)
+
+    def set_list_item(self, item, index, value):
+        return self._data.set_list_item(item, index, value)
+
     def __getitem__(self, item):
         return self._data[item]
 
@@ -1,44 +1,199 @@
 from collections import Mapping, Sequence, MutableMapping
+from importlib import import_module
+import random
 import re
 from types import NoneType
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
-def dump_value(value):
-    if hasattr(value, 'dump'):
-        return value.dump()
-    if isinstance(value, basestring):
-        return unicode(value)
-    elif isinstance(value, (tuple, list, set)):
-        return map(dump_value, value)
-    elif isinstance(value, dict):
-        #TODO: Raise an exception if key is empty string or None.
-        return dict((key, dump_value(value)) for key, value in value.iteritems()
-                    if key is not None or key != '')
-    elif isinstance(value, int) and value > 0xffffffff:
+
+# Values of these types are already plain, so dump_value or flatten_value return them as is.
+_dump_plain_types = frozenset([unicode, long, float, bool, NoneType])
+_flatten_plain_types = frozenset([int, long, bool, NoneType])
+
+
+def _dump_plain(value):
+    return value
+
+
+def _dump_dumpable(value):
+    return value.dump()
+
+
+def _dump_int(value):
+    if value > 0xffffffff:
         return long(value)
     return value
 
 
-def flatten_value(value):
-    if isinstance(value, (dict, DictView)):
-        return dict((k, flatten_value(v)) for k, v in value.iteritems())
-    elif isinstance(value, (list, ListView)):
-        return map(flatten_value, value)
-    elif isinstance(value, basestring):
-        value = unicode(value)
-        try:
-            value = float(value)
-        except ValueError:
-            return value
-    if isinstance(value, float):
+def _dump_sequence(value):
+    result = []
+    append = result.append
+    for item in value:
+        if item.__class__ in _dump_plain_types:
+            append(item)
+        else:
+            append(dump_value(item))
+    return result
+
+
+def _dump_dict(value):
+    #TODO: Raise an exception if key is empty string or None.
+    result = {}
+    for key, item in value.iteritems():
+        if item.__class__ in _dump_plain_types:
+            result[key] = item
+        else:
+            result[key] = dump_value(item)
+    return result
+
+
+def _get_dumper(cls):
+    if hasattr(cls, 'dump'):
+        return _dump_dumpable
+    elif issubclass(cls, basestring):
+        return unicode
+    elif issubclass(cls, (tuple, list, set)):
+        return _dump_sequence
+    elif issubclass(cls, dict):
+        return _dump_dict
+    elif issubclass(cls, int) and not issubclass(cls, bool):
+        return _dump_int
+    return _dump_plain
+
+
+_dumpers = {
+    unicode: _dump_plain,
+    long: _dump_plain,
+    float: _dump_plain,
+    bool: _dump_plain,
+    NoneType: _dump_plain,
+    str: unicode,
+    int: _dump_int,
+    list: _dump_sequence,
+    tuple: _dump_sequence,
+    set: _dump_sequence,
+    dict: _dump_dict,
+}
+
+
+def register_dump_type(cls, dumper):
+    """Registers function, which converts instances of cls (exactly this class, not subclasses) to plain values in
+    :func:`dump_value`.
+
+    :param cls: class to register dumper for.
+    :type cls: type
+    :param dumper: function, which receives instance of cls and returns plain value.
+    """
+    _dumpers[cls] = dumper
+
+
+def dump_value(value):
+    """Converts value to plain python types, i.e. dicts, lists, unicode strings and numbers. Objects, which have
+    ``dump`` method are dumped using it.
+    """
+    cls = value.__class__
+    try:
+        dumper = _dumpers[cls]
+    except KeyError:
+        dumper = _dumpers[cls] = _get_dumper(cls)
+    return dumper(value)
+
+
+def _flatten_float(value):
+    try:
         int_value = int(value)
-        if int_value == value:
-            return int_value
+    except (ValueError, OverflowError):
+        return value
+    if int_value == value:
+        return int_value
     return value
 
 
+_number_prefixes = frozenset(u'0123456789+-.iInN \t\n\r\x0b\x0c')
+
+
+def _flatten_string(value):
+    value = unicode(value)
+    if not value or (value[0] not in _number_prefixes and value[0] <= u'\x7f'):
+        # Only strings, started with digits, sign, dot, whitespace or first letter of inf or nan could be numbers.
+        return value
+    try:
+        return _flatten_float(float(value))
+    except ValueError:
+        return value
+
+
+def _flatten_sequence(value):
+    result = []
+    append = result.append
+    for item in value:
+        if item.__class__ in _flatten_plain_types:
+            append(item)
+        else:
+            append(flatten_value(item))
+    return result
+
+
+def _flatten_dict(value):
+    result = {}
+    for key, item in value.iteritems():
+        if item.__class__ in _flatten_plain_types:
+            result[key] = item
+        else:
+            result[key] = flatten_value(item)
+    return result
+
+
+def _get_flattener(cls):
+    if issubclass(cls, (dict, DictView)):
+        return _flatten_dict
+    elif issubclass(cls, (list, ListView)):
+        return _flatten_sequence
+    elif issubclass(cls, basestring):
+        return _flatten_string
+    elif issubclass(cls, float):
+        return _flatten_float
+    return _dump_plain
+
+
+_flatteners = {
+    unicode: _flatten_string,
+    str: _flatten_string,
+    float: _flatten_float,
+    int: _dump_plain,
+    long: _dump_plain,
+    bool: _dump_plain,
+    NoneType: _dump_plain,
+    list: _flatten_sequence,
+    dict: _flatten_dict,
+}
+
+
+def register_flatten_type(cls, flattener):
+    """Registers function, which converts instances of cls (exactly this class, not subclasses) in
+    :func:`flatten_value`.
+    """
+    _flatteners[cls] = flattener
+
+
+def flatten_value(value):
+    """Converts value to plain python types and also tries to convert strings to numbers and floats to ints,
+    if there's no fractional part.
+    """
+    cls = value.__class__
+    try:
+        flattener = _flatteners[cls]
+    except KeyError:
+        flattener = _flatteners[cls] = _get_flattener(cls)
+    return flattener(value)
+
+
 def is_empty(value):
-    if isinstance(value, dict):
+    if isinstance(value, (dict, PersistentDict, MappingView)):
         if not len(value):
             return True
         for k, v in value.iteritems():
@@ -49,35 +204,215 @@ def is_empty(value):
         return False
 
 
-def merge(target, source, keep_none=False, skip_empty=True):
-    if source is None:
-        return None
-    for key, source_value in source.items():
+class Increment(object):
+    """Numeric delta, which could be stored in a diff instead of absolute value. When merged, delta is added to the
+    target value, missing value is counted as zero, the same way $inc works in Mongo.
+    """
+
+    __slots__ = 'delta',
+
+    def __init__(self, delta):
+        if not isinstance(delta, (int, long, float)) or isinstance(delta, bool):
+            raise TypeError('Only numeric increments supported. {!r} given.'.format(delta))
+        self.delta = delta
+
+    def apply(self, value):
+        """Returns value incremented by delta. Increments are summed up into a new Increment.
+        """
+        if value is None:
+            return self.delta
+        elif value.__class__ is Increment:
+            return Increment(value.delta + self.delta)
+        return value + self.delta
+
+    def __eq__(self, other):
+        return other.__class__ is Increment and other.delta == self.delta
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((Increment, self.delta))
+
+    def __repr__(self):
+        return 'Increment({!r})'.format(self.delta)
+
+
+class ListItems(object):
+    """Items of list field by indexes, which could be stored in a diff instead of the whole list. When merged, items
+    are set in the target list, the same way "items.2" paths of Mongo updates set them: the list is padded with Nones
+    up to the index. Missing field becomes a dict with string keys, as in Mongo.
+    """
+
+    __slots__ = 'items',
+
+    def __init__(self, items):
+        items = dict(items)
+        for index in items:
+            if not isinstance(index, (int, long)) or isinstance(index, bool) or index < 0:
+                raise TypeError('Only non-negative integer indexes supported. {!r} given.'.format(index))
+        self.items = items
+
+    def apply(self, value):
+        """Returns copy of value with items set. Items of ListItems are merged into a new ListItems.
+        """
+        if value.__class__ is ListItems:
+            items = dict(value.items)
+            items.update(self.items)
+            return ListItems(items)
+        elif isinstance(value, (list, tuple)):
+            result = list(value)
+            for index, item in sorted(self.items.iteritems()):
+                if index >= len(result):
+                    result.extend([None] * (index + 1 - len(result)))
+                result[index] = dump_value(item)
+            return result
+        elif value is None:
+            return dict((unicode(index), dump_value(item)) for index, item in self.items.iteritems())
+        raise TypeError('Only items of lists could be set. {!r} given.'.format(value))
+
+    def __eq__(self, other):
+        return other.__class__ is ListItems and other.items == self.items
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'ListItems({!r})'.format(self.items)
+
+
+# Values, which are applied to the values below them in diffs, rather than replace them.
+_delta_types = frozenset([Increment, ListItems])
+
+
+def _merge(target, source, keep_none, skip_empty, copy):
+    """Merges source into target in a single pass. Returns False if source turned out to be empty, i.e. contains
+    nothing but empty dicts, so nothing was written to target.
+    """
+    merged = False
+    for key, source_value in source.iteritems():
         if source_value is None:
             if keep_none:
                 target[key] = None
             else:
                 target.pop(key, None)
-            continue
-        if skip_empty and is_empty(source_value):
-            continue
-        if isinstance(source_value, dict):
-            target_value = target.get(key, {})
-            if isinstance(target_value, MappingView):
+            merged = True
+        elif isinstance(source_value, (dict, PersistentDict)):
+            target_value = target.get(key)
+            if isinstance(target_value, PersistentDict):
+                # Persistent dicts are never changed in place, merged version replaces the original one.
+                target_value, nested_merged = target_value._merge(source_value, keep_none, skip_empty)
+                if nested_merged or not skip_empty:
+                    target[key] = target_value
+                    merged = True
+                continue
+            elif isinstance(target_value, MappingView):
                 target_value = target_value.dump()
             elif not isinstance(target_value, dict):
                 target_value = {}
-            merge(target_value, source_value, keep_none=keep_none, skip_empty=skip_empty)
-            target[key] = target_value
-        else:
+            elif not copy:
+                target_value = dict(target_value)
+            if _merge(target_value, source_value, keep_none, skip_empty, copy) or not skip_empty:
+                target[key] = target_value
+                merged = True
+        elif source_value.__class__ in _delta_types:
+            target[key] = source_value.apply(target.get(key))
+            merged = True
+        elif copy or hasattr(source_value, 'dump'):
             target[key] = dump_value(source_value)
+            merged = True
+        else:
+            target[key] = source_value
+            merged = True
+    return merged
+
+
+def merge(target, source, keep_none=False, skip_empty=True, copy=True):
+    """Merges source into target. Nested dicts are merged recursively, None values in source delete
+    corresponding fields from target, Increment values are added to corresponding fields of target, ListItems set
+    items of corresponding lists.
+
+    :param target: dict to merge into, it is modified in place.
+    :type target: dict
+    :param source: dict to merge.
+    :type source: dict or MappingView
+    :param keep_none: store None values instead of deleting fields.
+    :param skip_empty: skip values, which are dicts without anything but empty dicts inside.
+    :param copy: If True, values from source are copied into target and nested dicts of target are updated in place.
+     Otherwise values from source are shared with target and nested dicts of target, which should be changed, are
+     replaced with updated copies, so neither source nor previous versions of nested dicts are modified.
+    :return: target or None if source is None.
+    """
+    if source is None:
+        return None
+    _merge(target, source, keep_none, skip_empty, copy)
     return target
 
 
+def diff(old, new):
+    """Computes minimal diff, which turns old document into new one, when merged into it. Diff is in the same format,
+    Diffed and :func:`merge` use: fields, which were removed, are set to None, nested dicts contain only changed
+    fields. Values are compared by equality, so 1 and 1.0 are considered the same. Subtrees, which are the same
+    objects or equal, are skipped without walking through them, so the cost depends mostly on the size of changed
+    part. Lists are not diffed, changed list is included as a whole. Empty dicts are treated as missing fields, the same
+    way merge skips them.
+
+    Examples:
+        >>> diff({'gold': 1, 'stats': {'xp': 1, 'level': 1}, 'flag': True}, {'gold': 2, 'stats': {'xp': 1, 'level': 2}})
+        {'flag': None, 'gold': 2, 'stats': {'level': 2}}
+
+    :param old: previous version of document.
+    :type old: dict or MappingView or PersistentDict
+    :param new: new version of document.
+    :type new: dict or MappingView or PersistentDict
+    :rtype: dict
+    """
+    if isinstance(old, PersistentDict) and isinstance(new, PersistentDict):
+        # Only walk through the trie nodes, which are not shared by both versions.
+        keys = set(old._root.changed_keys(new._root))
+        new_items = ((key, new[key]) for key in keys if key in new)
+        removed_keys = [key for key in keys if key not in new]
+    else:
+        new_items = new.iteritems()
+        removed_keys = [key for key in old if key not in new]
+
+    result = {}
+    for key, new_value in new_items:
+        try:
+            old_value = old[key]
+        except KeyError:
+            if not is_empty(new_value):
+                result[key] = dump_value(new_value)
+            continue
+        if old_value is new_value:
+            continue
+        elif isinstance(new_value, _nested_types) and isinstance(old_value, _nested_types):
+            if new_value.__class__ is dict and old_value == new_value:
+                continue
+            nested_diff = diff(old_value, new_value)
+            if nested_diff:
+                result[key] = nested_diff
+        elif old_value == new_value:
+            continue
+        elif is_empty(new_value):
+            # Empty dicts are skipped by merge, so the old value is deleted instead.
+            result[key] = None
+        else:
+            result[key] = dump_value(new_value)
+    for key in removed_keys:
+        result[key] = None
+    return result
+
+
+_plain_view_types = {unicode, int, long, float, bool, NoneType}
+
+
 def view_value(value):
-    if isinstance(value, str):
+    if value.__class__ in _plain_view_types:
+        return value
+    elif isinstance(value, str):
         return unicode(value)
-    elif isinstance(value, (dict, MappingView)):
+    elif isinstance(value, (dict, MappingView, PersistentDict)):
         return DictView(value)
     elif isinstance(value, (list, set, tuple, ListView)):
         return ListView(value)
@@ -87,6 +422,7 @@ def view_value(value):
 
 _default = object()
 _field_pattern = re.compile('(([^\.\[\]]+)(\[(\d+)\])?)+')
+_step_pattern = re.compile('^([^\.\[\]]+)(?:\[(\d+)\])?$')
 
 
 def split_field(field):
@@ -99,6 +435,130 @@ def split_field(field):
     return full_match, nested_field, index
 
 
+class CompiledField(object):
+    """Field name parsed once into a tuple of ``(key, index)`` steps. Use it instead of a string field name
+    in :func:`get_value` and :func:`set_value`, when the same field is accessed many times.
+
+    Examples:
+        >>> field = compile_field('stats.level[2].xp')
+        >>> field.steps
+        (('stats', None), ('level', 2), ('xp', None))
+    """
+
+    __slots__ = 'field', 'steps'
+
+    def __init__(self, field):
+        steps = []
+        for step in field.split('.'):
+            match = _step_pattern.match(step)
+            if not match:
+                raise ValueError('Invalid field: {}'.format(field))
+            key, index = match.groups()
+            if index is not None:
+                index = int(index)
+            steps.append((key, index))
+        self.field = field
+        self.steps = tuple(steps)
+
+    def get(self, document, default=_default, flatten=True):
+        value = document
+        for key, index in self.steps:
+            if not isinstance(value, (dict, MappingView, PersistentDict)):
+                raise TypeError('Only mapping type supported as a document')
+            try:
+                value = value[key]
+            except KeyError:
+                if default is not _default:
+                    return default
+                raise KeyError('Field not found: {}'.format(self.field))
+
+            if index is not None:
+                if not isinstance(value, (tuple, list, ListView)):
+                    raise TypeError('Nested value is not a list')
+                try:
+                    value = value[index]
+                except IndexError:
+                    if default is not _default:
+                        return default
+                    raise
+
+        if not flatten:
+            return dump_value(value)
+        else:
+            return flatten_value(value)
+
+    def set(self, document, value):
+        last = len(self.steps) - 1
+        for i, (key, index) in enumerate(self.steps):
+            if not isinstance(document, (dict, MutableMapping)):
+                raise TypeError('Only dict or MutableMapping type supported as a document.')
+            if i == last:
+                break
+            document = document.setdefault(key, {})
+            if index is not None:
+                if isinstance(document, list):
+                    document = document[index]
+                else:
+                    raise ValueError('Value should be list')
+
+        if index is not None:
+            try:
+                nested_value = document[key]
+            except KeyError:
+                nested_value = [None] * (index + 1)
+                document[key] = nested_value
+            else:
+                if isinstance(nested_value, list):
+                    l = len(nested_value)
+                    if l <= index:
+                        nested_value += [None] * (index + 1 - l)
+                else:
+                    raise ValueError('Value should be list')
+            nested_value[index] = value
+        else:
+            document[key] = value
+
+    def __eq__(self, other):
+        return isinstance(other, CompiledField) and self.field == other.field
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.field)
+
+    def __repr__(self):
+        return 'CompiledField({!r})'.format(self.field)
+
+
+_compiled_fields = {}
+_compiled_fields_evicting = {}
+compiled_fields_limit = 1024
+
+
+def compile_field(field):
+    """Return :class:`CompiledField` for provided field name. Compiled fields are cached, so the same field name
+    is parsed only once. The cache is bounded by ``compiled_fields_limit``: it is split into two generations and
+    fields, which were not used since the previous generation started, are evicted first.
+
+    :param field: dot separated field name.
+    :type field: basestring or CompiledField
+    :rtype: CompiledField
+    """
+    global _compiled_fields, _compiled_fields_evicting
+    try:
+        return _compiled_fields[field]
+    except KeyError:
+        if isinstance(field, CompiledField):
+            return field
+    compiled = _compiled_fields_evicting.get(field) or CompiledField(field)
+    if len(_compiled_fields) >= compiled_fields_limit // 2:
+        _compiled_fields_evicting = _compiled_fields
+        _compiled_fields = {}
+    _compiled_fields[field] = compiled
+    return compiled
+
+
 def get_value(document, field, default=_default, flatten=True):
     """This function will try to get value from a document by the field name. Nested fields supported.
     For nested lists you can provide indexes in the form `nested_list[0]`.
@@ -114,75 +574,62 @@ def get_value(document, field, default=_default, flatten=True):
 
     :param document: Object to lookup field in
     :type document: dict or MappingView
-    :param field: dot separated field name
-    :type field: basestring
+    :param field: dot separated field name, or compiled one.
+    :type field: basestring or CompiledField
     :param default: Default value to return, if field not found in the document. If default is None -
      KeyError will be raised.
     :return: if the field found in document, it's value will be converted to most simple format available.
      i.e. all dumpable values will be dumped, also the function will try to convert value to number.
     """
-    if not isinstance(document, (dict, MappingView)):
-        raise TypeError('Only mapping type supported as a document')
+    return compile_field(field).get(document, default, flatten)
 
-    full_match, nested_field, index = split_field(field)
-    try:
-        value = document[nested_field]
-    except KeyError:
-        if default is not _default:
-            return default
-        raise KeyError('Field not found: {}'.format(field))
 
-    if index is not None:
-        if not isinstance(value, (tuple, list, ListView)):
-            raise TypeError('Nested value is not a list')
-        try:
-            value = value[int(index)]
-        except IndexError:
-            if default is not _default:
-                return default
-            raise
-
-    if full_match != field:
-        field = field[len(full_match) + 1:]
-        return get_value(value, field, default, flatten)
-
-    if not flatten:
-        return dump_value(value)
-    else:
-        return flatten_value(value)
+def set_value(document, field, value):
+    compile_field(field).set(document, value)
 
 
-def set_value(document, field, value):
-    if not isinstance(document, (dict, MutableMapping)):
-        raise TypeError('Only dict or MutableMapping type supported as a document.')
+def _is_numeric_column(column):
+    for value in column:
+        if not isinstance(value, (int, long, float)) or isinstance(value, bool):
+            return False
+    return bool(column)
 
-    full_match, nested_field, index = split_field(field)
-    if full_match == field:
-        if index is not None:
+
+def project(documents, fields, default=None):
+    """Extract values of several fields from many documents at once. Field names are compiled only once and
+    documents are walked in a single pass, values are flattened the same way as :func:`get_value` does.
+
+    Examples:
+        >>> columns = project([{'a': {'b': 1}}, {'a': {'b': '2'}}, {}], ['a.b'], default=0)
+        >>> columns['a.b']
+        array([1, 2, 0])
+
+    :param documents: iterable of documents, i.e. list or cursor, returned by DataProvider.find.
+    :param fields: dot separated field names, or compiled ones.
+    :type fields: list of basestring or list of CompiledField
+    :param default: value used for missing fields.
+    :return: dict with columns for each field. If numpy is installed and all values in column are numbers,
+     column is numpy array, otherwise it's a list.
+    :rtype: dict
+    """
+    fields = list(fields)
+    compiled = map(compile_field, fields)
+    columns = [[] for _ in fields]
+    appends = [column.append for column in columns]
+    steps = zip(compiled, appends)
+    for document in documents:
+        for field, append in steps:
             try:
-                nested_value = document[nested_field]
-            except KeyError:
-                nested_value = [None] * (index + 1)
-                document[nested_field] = nested_value
-            else:
-                if isinstance(nested_value, list):
-                    l = len(nested_value)
-                    if l <= index:
-                        nested_value += [None] * (index + 1 - l)
-                else:
-                    raise ValueError('Value should be list')
-            nested_value[index] = value
-        else:
-            document[nested_field] = value
-    else:
-        nested_value = document.setdefault(nested_field, {})
-        if index is not None:
-            if isinstance(nested_value, list):
-                nested_value = nested_value[index]
-            else:
-                raise ValueError('Value should be list')
-        field = field[len(full_match) + 1:]
-        set_value(nested_value, field, value)
+                append(field.get(document, default))
+            except (TypeError, IndexError):
+                append(default)
+
+    projection = {}
+    for field, column in zip(fields, columns):
+        if numpy is not None and _is_numeric_column(column):
+            column = numpy.array(column)
+        projection[field] = column
+    return projection
 
 
 def get_schema(documents, skip_nested=False, keep_none=False, nested_level=None):
@@ -192,30 +639,178 @@ def get_schema(documents, skip_nested=False, keep_none=False, nested_level=None)
     for document in documents:
         merge(documents_union, document, keep_none)
     schema = []
-    queue = sorted([(field, value, 0) for field, value in documents_union.iteritems()])
-    while queue:
-        field, value, level = queue.pop(0)
+    stack = sorted([(field, value, 0) for field, value in documents_union.iteritems()], reverse=True)
+    while stack:
+        field, value, level = stack.pop()
         if isinstance(value, dict):
             if not skip_nested:
                 schema.append(field)
             if nested_level is None or level < nested_level:
-                nested = sorted([
+                stack.extend(sorted([
                     ('{}.{}'.format(field, nested_field), nested_value, level + 1)
                     for nested_field, nested_value in value.iteritems()
-                ])
-                for nested_tuple in nested:
-                    queue.insert(0, nested_tuple)
+                ]))
         else:
             schema.append(field)
     return schema
 
 
-class ListView(Sequence):
+NULL_TYPE = 'null'
+BOOL_TYPE = 'bool'
+NUMBER_TYPE = 'number'
+STRING_TYPE = 'string'
+DICT_TYPE = 'dict'
+LIST_TYPE = 'list'
+
+
+def _get_value_type(value):
+    if value is None:
+        return NULL_TYPE
+    elif isinstance(value, bool):
+        return BOOL_TYPE
+    elif isinstance(value, (int, long, float)):
+        return NUMBER_TYPE
+    elif isinstance(value, basestring):
+        return STRING_TYPE
+    elif isinstance(value, (dict, MappingView, PersistentDict)):
+        return DICT_TYPE
+    elif isinstance(value, (list, tuple, set, ListView)):
+        return LIST_TYPE
+    else:
+        return value.__class__.__name__
+
+
+class FieldStats(object):
+    """Statistics for the field, collected by :func:`infer_schema`.
+    """
+
+    __slots__ = 'field', 'count', 'types'
+
+    def __init__(self, field):
+        self.field = field
+        self.count = 0
+        self.types = {}
+
+    @property
+    def nullable(self):
+        return NULL_TYPE in self.types
+
+    @property
+    def is_number(self):
+        """True if all values, except nulls, are numbers.
+        """
+        numbers = self.types.get(NUMBER_TYPE, 0)
+        return numbers > 0 and numbers + self.types.get(NULL_TYPE, 0) == self.count
+
+    @property
+    def is_list(self):
+        return LIST_TYPE in self.types
+
+    @property
+    def is_dict(self):
+        return DICT_TYPE in self.types
+
+    def __repr__(self):
+        return '<FieldStats: {} ({}) {}>'.format(self.field, self.count, self.types)
+
+
+class Schema(object):
+    """Result of :func:`infer_schema`: number of analyzed documents and statistics for each field found in them.
+    """
+
+    def __init__(self):
+        self.documents = 0
+        self.fields = {}
+
+    def add(self, document, nested_level=None):
+        self.documents += 1
+        fields = self.fields
+        stack = [(None, document, 0)]
+        while stack:
+            prefix, value, level = stack.pop()
+            for key, nested_value in value.iteritems():
+                field = key if prefix is None else '{}.{}'.format(prefix, key)
+                try:
+                    stats = fields[field]
+                except KeyError:
+                    stats = fields[field] = FieldStats(field)
+                value_type = _get_value_type(nested_value)
+                stats.count += 1
+                stats.types[value_type] = stats.types.get(value_type, 0) + 1
+                if value_type == DICT_TYPE and (nested_level is None or level < nested_level):
+                    stack.append((field, nested_value, level + 1))
+
+    def presence(self, field):
+        """Share of documents, where the field is present.
+        """
+        try:
+            return float(self.fields[field].count) / self.documents
+        except KeyError:
+            return 0.0
+
+    def get_fields(self, skip_nested=False):
+        """Sorted list of fields. If skip_nested is set, fields which contain nested dicts are skipped.
+        """
+        return sorted(field for field, stats in self.fields.iteritems() if not (skip_nested and stats.is_dict))
+
+
+def _reservoir(documents, size):
+    sample = []
+    for i, document in enumerate(documents):
+        if i < size:
+            sample.append(document)
+        else:
+            j = random.randint(0, i)
+            if j < size:
+                sample[j] = document
+    return sample
+
+
+def infer_schema(documents, sample=None, nested_level=None):
+    """Collects schema and per field statistics from documents. Documents are consumed one by one, so cursor
+    returned by DataProvider.find could be analyzed in bounded memory.
+
+    :param documents: iterable with documents.
+    :param sample: If set, only randomly chosen (using reservoir sampling) number of documents will be analyzed.
+    :type sample: int
+    :param nested_level: Do not analyze fields nested deeper than this level.
+    :type nested_level: int
+    :rtype: Schema
+    """
+    if isinstance(documents, (dict, MappingView, PersistentDict)):
+        documents = [documents]
+    if sample is not None:
+        documents = _reservoir(documents, sample)
+    schema = Schema()
+    for document in documents:
+        schema.add(document, nested_level)
+    return schema
+
+
+class ListView(object):
+    """Read only view for a sequence. Nested dicts and sequences are wrapped into views on access, views are cached
+    until the item is replaced in the underlying sequence. Iteration yields raw items, use :meth:`itervalues` to
+    iterate over views.
+    """
+
+    __slots__ = '_data', '_views'
+
     def __init__(self, sequence):
         self._data = sequence
+        self._views = None
 
     def __getitem__(self, index):
-        return view_value(self._data[index])
+        value = self._data[index]
+        # Slices are not cached, they are new sequences every time.
+        if value.__class__ in _view_types and index.__class__ is not slice:
+            views = self._views
+            if views is None:
+                views = self._views = {}
+            view = views.get(index)
+            if view is None or view._data is not value:
+                view = views[index] = view_value(value)
+            return view
+        return view_value(value)
 
     def __len__(self):
         return len(self._data)
@@ -226,6 +821,25 @@ class ListView(Sequence):
     def __iter__(self):
         return iter(self._data)
 
+    def itervalues(self):
+        """Yields items wrapped into views.
+        """
+        for index in xrange(len(self._data)):
+            yield self[index]
+
+    def __reversed__(self):
+        for index in reversed(xrange(len(self._data))):
+            yield self[index]
+
+    def index(self, value):
+        for index, item in enumerate(self):
+            if item == value:
+                return index
+        raise ValueError
+
+    def count(self, value):
+        return sum(1 for item in self if item == value)
+
     def dump(self):
         return map(dump_value, self)
 
@@ -236,57 +850,552 @@ class ListView(Sequence):
         self.__str__()
 
 
-class MappingView(Mapping):
+Sequence.register(ListView)
+
+
+class MappingView(object):
+    """Read only view for a mapping. Nested dicts and sequences are wrapped into views on access, views are cached
+    until the value is replaced in the underlying mapping.
+    """
+
+    __slots__ = '_data', '_views'
+
+    def __init__(self, data=None):
+        if data is None:
+            data = {}
+        self._data = data
+        self._views = None
+
+    def __len__(self):
+        return len(self._data)
+
+    def __getitem__(self, item):
+        value = self._data[item]
+        if value.__class__ in _view_types:
+            views = self._views
+            if views is None:
+                views = self._views = {}
+            view = views.get(item)
+            if view is None or view._data is not value:
+                view = views[item] = self.view_value(value)
+            return view
+        return self.view_value(value)
+
+    def __contains__(self, item):
+        return self._data.__contains__(item)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return self._data.keys()
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def iterkeys(self):
+        return iter(self)
+
+    def itervalues(self):
+        """Yields values wrapped into views, without building intermediate lists.
+        """
+        for key in self:
+            yield self[key]
+
+    def iteritems(self):
+        """Yields key, value pairs with values wrapped into views, without building intermediate lists.
+        """
+        for key in self:
+            yield key, self[key]
+
+    def values(self):
+        return list(self.itervalues())
+
+    def items(self):
+        return list(self.iteritems())
+
+    def __eq__(self, other):
+        if not isinstance(other, Mapping):
+            return NotImplemented
+        return dict(self.items()) == dict(other.items())
+
+    def __ne__(self, other):
+        return not (self == other)
+
+    __hash__ = None
+
+    def dump(self):
+        return dict((key, dump_value(value)) for key, value in self.iteritems())
+
+    def __str__(self):
+        return 'MappingView({})'.format(self.dump())
+
+    def __unicode__(self):
+        self.__str__()
+
+    @staticmethod
+    def view_value(value):
+        return view_value(value)
+
+
+Mapping.register(MappingView)
+
+
+class DictView(MappingView):
+    __slots__ = ()
+
+    def dump(self):
+        # Values are dumped straight from the underlying data, without wrapping them into views first.
+        return dump_value(self._data)
+
+
+_view_types = {dict, list, tuple, set}
+
+
+_HAMT_BITS = 5
+_HAMT_MASK = (1 << _HAMT_BITS) - 1
+_HAMT_HASH_MASK = 0xffffffff
+_NODE = object()
+
+
+def _popcount(value):
+    return bin(value).count('1')
+
+
+class _BitmapNode(object):
+    """Node of hash array mapped trie. Entries are stored in the flat tuple as key, value pairs. If key is _NODE,
+    value is a nested node.
+    """
+
+    __slots__ = 'bitmap', 'entries'
+
+    def __init__(self, bitmap, entries):
+        self.bitmap = bitmap
+        self.entries = entries
+
+    def get(self, shift, key_hash, key):
+        node = self
+        while True:
+            bitmap = node.bitmap
+            bit = 1 << ((key_hash >> shift) & _HAMT_MASK)
+            if not bitmap & bit:
+                raise KeyError(key)
+            i = 2 * bin(bitmap & (bit - 1)).count('1')
+            entries = node.entries
+            entry_key = entries[i]
+            if entry_key is _NODE:
+                node = entries[i + 1]
+                if node.__class__ is _CollisionNode:
+                    return node.get(shift, key_hash, key)
+                shift += _HAMT_BITS
+            elif entry_key is key or entry_key == key:
+                return entries[i + 1]
+            else:
+                raise KeyError(key)
+
+    def assoc(self, shift, key_hash, key, value):
+        """Returns node with value set for key and flag if the key was added.
+        """
+        bit = 1 << ((key_hash >> shift) & _HAMT_MASK)
+        i = 2 * _popcount(self.bitmap & (bit - 1))
+        entries = self.entries
+        if not self.bitmap & bit:
+            return _BitmapNode(self.bitmap | bit, entries[:i] + (key, value) + entries[i:]), True
+
+        entry_key, entry_value = entries[i], entries[i + 1]
+        if entry_key is _NODE:
+            node, added = entry_value.assoc(shift + _HAMT_BITS, key_hash, key, value)
+            if node is entry_value:
+                return self, False
+            return _BitmapNode(self.bitmap, entries[:i + 1] + (node,) + entries[i + 2:]), added
+        elif entry_key is key or entry_key == key:
+            if entry_value is value:
+                return self, False
+            return _BitmapNode(self.bitmap, entries[:i + 1] + (value,) + entries[i + 2:]), False
+        else:
+            node = _make_node(shift + _HAMT_BITS, _hash(entry_key), entry_key, entry_value, key_hash, key, value)
+            return _BitmapNode(self.bitmap, entries[:i] + (_NODE, node) + entries[i + 2:]), True
+
+    def dissoc(self, shift, key_hash, key):
+        """Returns node without the key or None if node became empty.
+        """
+        bit = 1 << ((key_hash >> shift) & _HAMT_MASK)
+        if not self.bitmap & bit:
+            return self
+        i = 2 * _popcount(self.bitmap & (bit - 1))
+        entries = self.entries
+        entry_key, entry_value = entries[i], entries[i + 1]
+        if entry_key is _NODE:
+            node = entry_value.dissoc(shift + _HAMT_BITS, key_hash, key)
+            if node is entry_value:
+                return self
+            elif node is not None:
+                return _BitmapNode(self.bitmap, entries[:i + 1] + (node,) + entries[i + 2:])
+        elif not (entry_key is key or entry_key == key):
+            return self
+
+        if self.bitmap == bit:
+            return None
+        return _BitmapNode(self.bitmap ^ bit, entries[:i] + entries[i + 2:])
+
+    def changed_keys(self, other):
+        """Yields keys, which may have different values in other node. Subnodes, shared by both nodes, are skipped,
+        keys may be yielded more than once.
+        """
+        if other is self:
+            return
+        elif other.__class__ is not _BitmapNode:
+            for node in self, other:
+                for key, value in node.iteritems():
+                    yield key
+            return
+        entries, other_entries = self.entries, other.entries
+        bitmap, other_bitmap = self.bitmap, other.bitmap
+        changed = bitmap | other_bitmap
+        i = j = 0
+        while changed:
+            bit = changed & -changed
+            changed ^= bit
+            if bitmap & other_bitmap & bit:
+                key, value = entries[i], entries[i + 1]
+                other_key, other_value = other_entries[j], other_entries[j + 1]
+                i += 2
+                j += 2
+                if value is other_value and key is other_key:
+                    continue
+                elif key is _NODE and other_key is _NODE:
+                    for key in value.changed_keys(other_value):
+                        yield key
+                    continue
+                items = [(key, value), (other_key, other_value)]
+            elif bitmap & bit:
+                items = [(entries[i], entries[i + 1])]
+                i += 2
+            else:
+                items = [(other_entries[j], other_entries[j + 1])]
+                j += 2
+            for key, value in items:
+                if key is _NODE:
+                    for key, value in value.iteritems():
+                        yield key
+                else:
+                    yield key
+
+    def iteritems(self):
+        entries = self.entries
+        for i in xrange(0, len(entries), 2):
+            if entries[i] is _NODE:
+                for item in entries[i + 1].iteritems():
+                    yield item
+            else:
+                yield entries[i], entries[i + 1]
+
+
+class _CollisionNode(object):
+    """Node for keys with equal hashes.
+    """
+
+    __slots__ = 'key_hash', 'entries'
+
+    def __init__(self, key_hash, entries):
+        self.key_hash = key_hash
+        self.entries = entries
+
+    def _find(self, key):
+        entries = self.entries
+        for i in xrange(0, len(entries), 2):
+            if entries[i] is key or entries[i] == key:
+                return i
+        return -1
+
+    def get(self, shift, key_hash, key):
+        i = self._find(key)
+        if i < 0:
+            raise KeyError(key)
+        return self.entries[i + 1]
+
+    def assoc(self, shift, key_hash, key, value):
+        if key_hash != self.key_hash:
+            node = _BitmapNode(1 << ((self.key_hash >> shift) & _HAMT_MASK), (_NODE, self))
+            return node.assoc(shift, key_hash, key, value)
+        i = self._find(key)
+        if i < 0:
+            return _CollisionNode(self.key_hash, self.entries + (key, value)), True
+        elif self.entries[i + 1] is value:
+            return self, False
+        return _CollisionNode(self.key_hash, self.entries[:i + 1] + (value,) + self.entries[i + 2:]), False
+
+    def dissoc(self, shift, key_hash, key):
+        i = self._find(key)
+        if i < 0:
+            return self
+        entries = self.entries[:i] + self.entries[i + 2:]
+        if not entries:
+            return None
+        return _CollisionNode(self.key_hash, entries)
+
+    def changed_keys(self, other):
+        if other is not self:
+            for node in self, other:
+                for key, value in node.iteritems():
+                    yield key
+
+    def iteritems(self):
+        entries = self.entries
+        for i in xrange(0, len(entries), 2):
+            yield entries[i], entries[i + 1]
+
+
+def _hash(key):
+    return hash(key) & _HAMT_HASH_MASK
+
+
+def _make_node(shift, first_hash, first_key, first_value, second_hash, second_key, second_value):
+    if first_hash == second_hash:
+        return _CollisionNode(first_hash, (first_key, first_value, second_key, second_value))
+    first_bit = (first_hash >> shift) & _HAMT_MASK
+    second_bit = (second_hash >> shift) & _HAMT_MASK
+    if first_bit == second_bit:
+        node = _make_node(shift + _HAMT_BITS, first_hash, first_key, first_value,
+                          second_hash, second_key, second_value)
+        return _BitmapNode(1 << first_bit, (_NODE, node))
+    elif first_bit < second_bit:
+        entries = first_key, first_value, second_key, second_value
+    else:
+        entries = second_key, second_value, first_key, first_value
+    return _BitmapNode((1 << first_bit) | (1 << second_bit), entries)
+
+
+_EMPTY_NODE = _BitmapNode(0, ())
+
+
+class PersistentDict(Mapping):
+    """Immutable mapping, backed by hash array mapped trie. Modifications return new PersistentDict, which shares
+    all unchanged nodes with the original one, so keeping many versions of the same document is cheap.
+    Nested dicts are converted to PersistentDict, other values are stored as is.
+
+    Examples:
+        >>> v1 = PersistentDict({'gold': 1, 'stats': {'xp': 1}})
+        >>> v2 = v1.merge({'stats': {'xp': 2}})
+        >>> v1['stats']['xp'], v2['stats']['xp']
+        (1, 2)
+    """
+
     def __init__(self, data=None):
-        if data is None:
-            data = {}
-        self._data = data
-
-    def __len__(self):
-        return len(self._data)
+        self._root = _EMPTY_NODE
+        self._len = 0
+        if data:
+            root, length = self._root, self._len
+            for key, value in data.iteritems():
+                if isinstance(value, dict):
+                    value = PersistentDict(value)
+                root, added = root.assoc(0, _hash(key), key, value)
+                length += added
+            self._root, self._len = root, length
+
+    @classmethod
+    def _create(cls, root, length):
+        instance = cls.__new__(cls)
+        instance._root = root or _EMPTY_NODE
+        instance._len = length
+        return instance
 
     def __getitem__(self, item):
-        return self.view_value(self._data[item])
+        return self._root.get(0, _hash(item), item)
 
     def __contains__(self, item):
-        return self._data.__contains__(item)
+        try:
+            self._root.get(0, _hash(item), item)
+        except KeyError:
+            return False
+        return True
 
-    def keys(self):
-        return self._data.keys()
+    def __len__(self):
+        return self._len
 
     def __iter__(self):
-        return iter(self.keys())
+        for key, _ in self._root.iteritems():
+            yield key
+
+    def iteritems(self):
+        return self._root.iteritems()
+
+    def set(self, key, value):
+        """Returns new PersistentDict with value set for the key.
+        """
+        if isinstance(value, dict):
+            value = PersistentDict(value)
+        root, added = self._root.assoc(0, _hash(key), key, value)
+        if root is self._root:
+            return self
+        return self._create(root, self._len + added)
+
+    def delete(self, key):
+        """Returns new PersistentDict without the key. If there's no such key, the same object is returned.
+        """
+        root = self._root.dissoc(0, _hash(key), key)
+        if root is self._root:
+            return self
+        return self._create(root, self._len - 1)
+
+    def update(self, data):
+        """Returns new PersistentDict with all items from data set.
+        """
+        result = self
+        for key, value in data.iteritems():
+            result = result.set(key, value)
+        return result
+
+    def _merge(self, source, keep_none, skip_empty):
+        root, length = self._root, self._len
+        merged = False
+        for key, source_value in source.iteritems():
+            key_hash = _hash(key)
+            if source_value is None:
+                if keep_none:
+                    root, added = root.assoc(0, key_hash, key, None)
+                    length += added
+                else:
+                    dissociated = root.dissoc(0, key_hash, key) or _EMPTY_NODE
+                    if dissociated is not root:
+                        root = dissociated
+                        length -= 1
+                merged = True
+            elif isinstance(source_value, (dict, PersistentDict)):
+                try:
+                    target_value = root.get(0, key_hash, key)
+                except KeyError:
+                    target_value = _EMPTY
+                else:
+                    if isinstance(target_value, MappingView):
+                        target_value = PersistentDict(target_value.dump())
+                    elif isinstance(target_value, dict):
+                        target_value = PersistentDict(target_value)
+                    elif not isinstance(target_value, PersistentDict):
+                        target_value = _EMPTY
+                target_value, nested_merged = target_value._merge(source_value, keep_none, skip_empty)
+                if nested_merged or not skip_empty:
+                    root, added = root.assoc(0, key_hash, key, target_value)
+                    length += added
+                    merged = True
+            elif source_value.__class__ in _delta_types:
+                try:
+                    target_value = root.get(0, key_hash, key)
+                except KeyError:
+                    target_value = None
+                root, added = root.assoc(0, key_hash, key, source_value.apply(target_value))
+                length += added
+                merged = True
+            else:
+                if hasattr(source_value, 'dump'):
+                    source_value = dump_value(source_value)
+                root, added = root.assoc(0, key_hash, key, source_value)
+                length += added
+                merged = True
+        if root is self._root:
+            return self, merged
+        return self._create(root, length), merged
+
+    def merge(self, source, keep_none=False, skip_empty=True):
+        """Returns new PersistentDict with source merged, the same way as :func:`merge` does it. Only nodes on the
+        changed paths are allocated.
+        """
+        if source is None:
+            return self
+        return self._merge(source, keep_none, skip_empty)[0]
 
     def dump(self):
         return dict((key, dump_value(value)) for key, value in self.iteritems())
 
-    def __str__(self):
-        return 'MappingView({})'.format(self.dump())
+    def __repr__(self):
+        return 'PersistentDict({!r})'.format(self.dump())
 
-    def __unicode__(self):
-        self.__str__()
 
-    @staticmethod
-    def view_value(value):
-        return view_value(value)
+_EMPTY = PersistentDict()
+_view_types.add(PersistentDict)
+_nested_types = dict, PersistentDict, MappingView
 
 
-class DictView(MappingView):
+class BaseDiffed(MappingView, MutableMapping):
     pass
 
 
-class BaseDiffed(MappingView, MutableMapping):
-    pass
+def _squash_diffs(older, newer):
+    """Squashes two subsequent diffs into a new one, so lookups through it give the same results as through both of
+    them. Neither of diffs is modified.
+    """
+    result = dict(older.iteritems())
+    for key, value in newer.iteritems():
+        if isinstance(value, (dict, PersistentDict)):
+            try:
+                older_value = result[key]
+            except KeyError:
+                result[key] = value
+                continue
+            if isinstance(older_value, (dict, PersistentDict)):
+                result[key] = _squash_diffs(older_value, value)
+            elif isinstance(older_value, DictView):
+                result[key] = DictView(merge(older_value.dump(), value, skip_empty=False))
+            else:
+                # Deletion or other value hides everything below, so the nested diff replaces it.
+                result[key] = DictView(merge({}, value, skip_empty=False))
+        elif value.__class__ is Increment and key in result and isinstance(
+                result[key], (NoneType, int, long, float, Increment)):
+            result[key] = value.apply(result[key])
+        elif value.__class__ is ListItems and key in result and isinstance(
+                result[key], (NoneType, list, tuple, ListItems)):
+            result[key] = value.apply(result[key])
+        else:
+            result[key] = value
+    return result
+
+
+compaction_stats = {'compactions': 0, 'squashed_diffs': 0}
+
+
+def _copy_diff(diff):
+    """Copies nested dicts of the diff. Dicts are copied with dict(), so the copy is consistent even if the diff is
+    modified from other thread. PersistentDicts are copied into dicts, so the copy could be modified.
+    """
+    diff = dict(diff)
+    for key, value in diff.items():
+        if value.__class__ is dict or isinstance(value, PersistentDict):
+            diff[key] = _copy_diff(value)
+    return diff
 
 
 class Diffed(MappingView, MutableMapping):
-    def __init__(self, data=None, diffs=None):
+    _writable = True
+
+    def __init__(self, data=None, diffs=None, max_depth=None, max_size=None):
+        """
+        :param data: the data, diffs are applied to.
+        :param diffs: diff or list of diffs to apply.
+        :param max_depth: if set, diffs are compacted, when there are more diffs applied.
+        :param max_size: if set, diffs are compacted, when total number of fields in them exceeds this value.
+        """
         if data is None:
             data = {}
-        elif not isinstance(data, dict):
-            raise TypeError('Only dicts supported. {object!s} given.'.format(object=data))
+        elif not isinstance(data, (dict, PersistentDict)):
+            raise TypeError('Only dicts and PersistentDicts supported. {object!s} given.'.format(object=data))
         super(Diffed, self).__init__(data)
         self._diffs = []
+        self._index = None
+        self._keys = None
+        self._children = {}
+        self._pinned = {}
+        self._squashed = set()
+        self._snapshotted = False
+        self._aliases = {}
+        # (parent, item) for nested objects, so flattened data could be put back to the parent's data.
+        self._parent = None
+        self.max_depth = max_depth
+        self.max_size = max_size
+        self.compactions = 0
+        self.squashed_diffs = 0
         if isinstance(diffs, dict):
             self.add_diff(diffs)
         elif isinstance(diffs, (tuple, list,)):
@@ -294,19 +1403,19 @@ class Diffed(MappingView, MutableMapping):
         else:
             self._diffs = []
 
+    @property
+    def _shared(self):
+        """
+        True if the data or the diffs could be used by snapshots. Nested objects share them with the parent, so they are
+        shared, when any of parents is.
+        """
+        return self._snapshotted or (self._parent is not None and self._parent[0]._shared)
+
     def get_effective_item(self, item):
         """
         Returns "effective" item, i.e. item found in rightmost of applied diffs or in data.
         """
-        for lookup in self.lookup():
-            try:
-                value = lookup[item]
-            except KeyError:
-                continue
-            else:
-                return value
-        else:
-            raise KeyError('{} not found'.format(item))
+        return self._get_container(item)[item]
 
     def view_effective_item(self, item):
         """
@@ -318,25 +1427,10 @@ class Diffed(MappingView, MutableMapping):
         """
         Yields applied diffs in reversed order and the data.
         """
-        try:
-            diff = self._diffs[-1]
-        except IndexError:
-            yield self._data
-        else:
-            if diff is None:
-                raise LookupError('Object is deleted')
-            else:
-                yield diff
-            for diff in reversed(self._diffs[:-1]):
-                if diff is None:
-                    break
-                elif isinstance(diff, DictView):
-                    yield diff
-                    break
-                else:
-                    yield diff
-            else:
-                yield self._data
+        if self._diffs and self._diffs[-1] is None:
+            raise LookupError('Object is deleted')
+        for container in self._lookup_chain():
+            yield container
 
     def get_current_diff(self):
         """
@@ -344,137 +1438,390 @@ class Diffed(MappingView, MutableMapping):
         """
         return self.lookup().next()
 
-    def __getitem__(self, item):
-        if not self._diffs:
-            value = self._data[item]
-            if value is None:
-                raise KeyError('{} not found'.format(item))
-            elif isinstance(value, dict):
-                return Diffed(value)
+    def _lookup_chain(self):
+        chain = []
+        for diff in reversed(self._diffs):
+            if diff is None:
+                return chain
+            chain.append(diff)
+            if isinstance(diff, DictView) and len(chain) > 1:
+                return chain
+        chain.append(self._data)
+        return chain
+
+    def _build_index(self):
+        index = {}
+        for container in reversed(self._lookup_chain()):
+            index.update(dict.fromkeys(container, container))
+        self._keys = set(key for key, container in index.iteritems() if container[key] is not None)
+        return index
+
+    def _get_index(self):
+        """
+        Returns index, which maps each key to the rightmost container, i.e. the diff or the data, where it's found.
+        Set of keys, which are not deleted, is maintained along with the index.
+        """
+        if self._diffs and self._diffs[-1] is None:
+            raise LookupError('Object is deleted')
+        index = self._index
+        if index is None:
+            index = self._index = self._build_index()
+        return index
+
+    def _index_item(self, item, container):
+        self._index[item] = container
+        if container[item] is None:
+            self._keys.discard(item)
+        else:
+            self._keys.add(item)
+
+    def _reindex_items(self, items):
+        chain = self._lookup_chain()
+        for item in items:
+            for container in chain:
+                if item in container:
+                    self._index_item(item, container)
+                    break
             else:
-                return view_value(value)
+                self._index.pop(item, None)
+                self._keys.discard(item)
 
-        last_diff = self._diffs[-1]
+    def _get_container(self, item):
+        """
+        Returns the container, where "effective" item is stored.
+        """
         try:
-            last_value = last_diff[item]
+            return self._get_index()[item]
         except KeyError:
-            #If item is not diffed in the last diff we need to gather values from previous diffs
-            diffs = []
-            for diff in reversed(self._diffs[:-1]):
-                try:
-                    value = diff[item]
-                except KeyError:
-                    continue
-                except TypeError:
-                    value = None
+            raise KeyError('{} not found'.format(item))
 
-                if isinstance(value, dict):
-                    diffs.append(value)
-                elif diffs or isinstance(value, DictView):
-                    diffs.append(value)
-                    break
-                else:
-                    return view_value(value)
+    def reindex(self):
+        """
+        Drops lookup index and cached nested objects, so they will be rebuilt on next access. Call it if diffs or data
+        were modified bypassing this object.
+        """
+        self._index = None
+        self._children.clear()
 
-            diffs.reverse()
-            value = self._data.get(item)
+    def _get_child(self, item):
+        """
+        Creates Diffed for nested dict. Values for item are collected from diffs until first deletion, DictView or
+        non-dict value, and the last diff is populated with an empty dict, so nested object could be modified.
+        Created object is cached until diffs of this object or the item itself are changed.
+        """
+        if self._writable and self._diffs and isinstance(self._diffs[-1], PersistentDict):
+            self._thaw_current_diff()
+        diffs = []
+        data = None
+        for container in self._lookup_chain():
             try:
-                effective_value = diffs[-1]
-            except IndexError:
-                effective_value = value
-
-            if diffs or isinstance(effective_value, (dict, DictView)):
-                last_value = {}
-                last_diff[item] = last_value
+                value = container[item]
+            except KeyError:
+                continue
+            if container is self._data:
+                data = value
+            elif isinstance(value, (dict, PersistentDict)):
+                diffs.append(value)
+                continue
+            elif isinstance(value, DictView):
+                diffs.append(value)
+            break
+        diffs.reverse()
+
+        if not isinstance(data, (dict, PersistentDict)):
+            data = None
+        if self._writable and self._diffs:
+            last_diff = self._diffs[-1]
+            if isinstance(last_diff, dict) and item not in last_diff:
+                last_value = last_diff[item] = {}
+                if self._index is not None:
+                    self._index_item(item, last_diff)
                 diffs.append(last_value)
-                return Diffed(value, diffs)
-            elif value is None:
-                raise KeyError('{} not found'.format(item))
-            elif isinstance(value, dict):
-                return Diffed(value)
-            else:
-                return view_value(value)
+        child = self._children[item] = self.__class__(data, diffs)
+        child._parent = self, item
+        return child
+
+    def __getitem__(self, item):
+        """
+        Returns effective value of item, wrapped into Diffed or view. Raises KeyError for deleted items, wherever the
+        deletion is, in the current diff or in an older one.
+        """
+        try:
+            return self._children[item]
+        except KeyError:
+            pass
+        container = self._get_container(item)
+        value = container[item]
+        if value is None:
+            raise KeyError('{} not found'.format(item))
+        elif isinstance(value, (dict, PersistentDict)):
+            return self._get_child(item)
+        elif self._diffs and container is not self._diffs[-1] and isinstance(value, DictView):
+            return self._get_child(item)
+        elif value.__class__ in _delta_types:
+            return view_value(self._get_applied(item))
         else:
-            #Return Diffed if last value is dict and value were not deleted in one of the previous diffs.
-            if isinstance(last_value, dict):
-                re = Diffed(self._data.get(item))
-                for diff in self._diffs[:-1]:
-                    try:
-                        re.add_diff(diff[item])
-                    except KeyError:
-                        pass
-                    except TypeError:
-                        re.add_diff(None)
-                re.add_diff(last_value)
-                return re
-            elif last_value is None:
-                raise KeyError('{} not found'.format(item))
-            else:
-                return view_value(last_value)
+            return view_value(value)
 
-    def __contains__(self, item):
-        for container in self.lookup():
+    def _get_applied(self, item):
+        """
+        Applies Increments and ListItems for item through the diffs to the first absolute value below them.
+        """
+        deltas = []
+        value = None
+        for container in self._lookup_chain():
             try:
                 value = container[item]
             except KeyError:
-                pass
-            else:
-                return value is not None
-        return False
+                continue
+            if value.__class__ not in _delta_types:
+                break
+            deltas.append(value)
+        else:
+            value = None
+        for delta in reversed(deltas):
+            value = delta.apply(value)
+        return value
+
+    def __contains__(self, item):
+        try:
+            container = self._get_container(item)
+        except KeyError:
+            return False
+        return container[item] is not None
 
     def keys(self):
-        keys = set()
-        lookup = list(self.lookup())
-        for container in reversed(lookup):
-            for key, value in container.iteritems():
-                if value is None:
-                    keys.discard(key)
-                else:
-                    keys.add(key)
-        return list(keys)
+        self._get_index()
+        return list(self._keys)
 
     def effective_keys(self):
         """
         Yields all keys for this this object including deleted ones.
         """
-        keys = set()
-        for diff in self.lookup():
-            keys |= set(diff)
-        return list(keys)
+        return self._get_index().keys()
 
     def __len__(self):
-        return len(self.keys())
+        self._get_index()
+        return len(self._keys)
 
     def __iter__(self):
-        for key in self.keys():
-            yield key
+        return iter(self.keys())
+
+    @property
+    def data(self):
+        return self._data
 
     @property
     def diffs(self):
         return self._diffs
 
     def add_diff(self, *diffs):
+        self._children.clear()
         for diff in diffs:
-            if not isinstance(diff, (dict, DictView, NoneType)):
-                raise TypeError(
-                    'Only dicts, DictViews and Nones accepted. Got {} - {}'.format(diff.__class__.__name__, diff))
+            if not isinstance(diff, (dict, DictView, PersistentDict, NoneType)):
+                raise TypeError('Only dicts, DictViews, PersistentDicts and Nones accepted. Got {} - {}'.format(
+                    diff.__class__.__name__, diff))
+            if self._diffs and isinstance(self._diffs[-1], DictView):
+                # The last DictView becomes a barrier for the lookup.
+                self._index = None
             self._diffs.append(diff)
+            if self._index is None:
+                continue
+            elif isinstance(diff, (dict, PersistentDict)):
+                for key in diff:
+                    self._index_item(key, diff)
+            else:
+                self._index = None
+        if self._needs_compaction():
+            self.compact()
+
+    def pin_diff(self, *diffs):
+        """
+        Protects diffs from compaction, so they could be removed later. Diffs could be pinned before they are applied.
+        """
+        for diff in diffs:
+            self._pinned[id(diff)] = diff
+
+    def unpin_diff(self, *diffs):
+        for diff in diffs:
+            self._pinned.pop(id(diff), None)
+
+    def _needs_compaction(self):
+        if self.max_depth is not None and len(self._diffs) > self.max_depth:
+            return True
+        elif self.max_size is not None:
+            size = sum(len(diff) for diff in self._diffs if isinstance(diff, (dict, PersistentDict)))
+            return size > self.max_size
+        return False
+
+    def _is_squashable(self, diff):
+        return isinstance(diff, (dict, PersistentDict)) and id(diff) not in self._pinned
+
+    def compact(self):
+        """
+        Squashes each run of subsequent diffs into a single diff, oldest first. Pinned diffs, deletions, DictViews
+        and the current diff are kept intact, squashed diffs could not be removed anymore. Called automatically,
+        when max_depth or max_size is exceeded.
+
+        :return: number of diffs squashed.
+        """
+        diffs = self._diffs
+        squashed = 0
+        i = 0
+        while i < len(diffs) - 1:
+            j = i
+            while j < len(diffs) - 1 and self._is_squashable(diffs[j]):
+                j += 1
+            if j - i > 1:
+                run = diffs[i:j]
+                squashed_diff = reduce(_squash_diffs, run)
+                diffs[i:j] = [squashed_diff]
+                self._squashed.difference_update(id(diff) for diff in run)
+                self._squashed.add(id(squashed_diff))
+                squashed += len(run)
+                if self._index is not None:
+                    run_ids = set(id(diff) for diff in run)
+                    for key in squashed_diff:
+                        if id(self._index.get(key)) in run_ids:
+                            self._index[key] = squashed_diff
+            i += 1
+        if squashed:
+            self._children.clear()
+            self.compactions += 1
+            self.squashed_diffs += squashed
+            compaction_stats['compactions'] += 1
+            compaction_stats['squashed_diffs'] += squashed
+            self._prune_aliases()
+        return squashed
+
+    def _resolve_diff(self, diff):
+        """
+        Returns the diff, which replaced given one, when it was copied to keep snapshots intact.
+        """
+        while id(diff) in self._aliases:
+            diff = self._aliases[id(diff)][1]
+        return diff
+
+    def _prune_aliases(self):
+        """
+        Drops aliases of diffs, which copies are not applied anymore, so the original diffs are not kept alive.
+        """
+        if not self._aliases:
+            return
+        applied = set(id(diff) for diff in self._diffs)
+        for key in [key for key in self._aliases if id(self._resolve_diff(self._aliases[key][0])) not in applied]:
+            del self._aliases[key]
 
     def remove_diff(self, *diffs):
+        self._children.clear()
         for diff in diffs:
-            self._diffs.remove(diff)
+            while id(diff) in self._aliases:
+                diff = self._aliases.pop(id(diff))[1]
+            # Equal diffs could be applied several times, so look for exactly the same object first.
+            for i, applied_diff in enumerate(self._diffs):
+                if applied_diff is diff:
+                    break
+            else:
+                i = self._diffs.index(diff)
+            diff = self._diffs.pop(i)
+            self._pinned.pop(id(diff), None)
+            self._squashed.discard(id(diff))
+            if self._diffs and id(self._diffs[-1]) in self._squashed:
+                # Squashed diff could not be modified, because its values already include the values below.
+                self._diffs.append({})
+            elif self._shared and self._diffs and isinstance(self._diffs[-1], dict):
+                # The diff becomes the current one and could be modified, so snapshots should keep the original.
+                last_diff = self._diffs[-1]
+                copied_diff = self._diffs[-1] = _copy_diff(last_diff)
+                self._aliases[id(last_diff)] = last_diff, copied_diff
+                if id(last_diff) in self._pinned:
+                    self._pinned[id(copied_diff)] = copied_diff
+                self._index = None
+            if self._index is None:
+                continue
+            elif isinstance(diff, (dict, PersistentDict)) and not (
+                    self._diffs and isinstance(self._diffs[-1], (DictView, NoneType))):
+                self._reindex_items(diff.keys())
+            else:
+                self._index = None
+        self._prune_aliases()
 
     def apply_diff(self, *diffs):
+        self._children.clear()
         for diff in diffs:
-            merge(self._data, diff)
+            diff = self._resolve_diff(diff)
+            if isinstance(self._data, PersistentDict):
+                self._data = self._data.merge(diff)
+            elif self._shared:
+                # Data could be used by snapshots, so changed dicts are copied.
+                self._data = merge(dict(self._data), diff, copy=False)
+            else:
+                merge(self._data, diff)
+            if self._index is None:
+                continue
+            elif isinstance(diff, (dict, DictView, PersistentDict)):
+                self._reindex_items(diff.keys())
+        if self._parent is not None:
+            self._update_parent()
+
+    def _update_parent(self):
+        """Puts the data back to the parent's data, if it was replaced, e.g. PersistentDict merged with diffs or dict
+        created for missing item.
+        """
+        parent, item = self._parent
+        data = parent._data
+        if data.get(item) is self._data:
+            return
+        if isinstance(data, PersistentDict):
+            value = self._data
+            if value.__class__ is dict:
+                value = PersistentDict(value)
+            parent._data = data.set(item, value)
+        else:
+            if parent._shared:
+                data = parent._data = dict(data)
+            data[item] = self._data
+        if parent._index is not None:
+            parent._reindex_items((item,))
+        if parent._parent is not None:
+            parent._update_parent()
 
     def flatten_diff(self, *diffs):
         self.apply_diff(*diffs)
         self.remove_diff(*diffs)
 
+    def snapshot(self):
+        """
+        Returns read only snapshot of the current state, which is not affected by further changes of this object.
+        The data and the diffs are shared with the snapshot, only the current diff is copied, so it's cheap to create.
+        Both objects could be used from different threads without locking: diffs, shared with snapshots, are copied
+        before they are modified.
+
+        :rtype: DiffedSnapshot
+        """
+        self._snapshotted = True
+        diffs = list(self._diffs)
+        if diffs and isinstance(diffs[-1], dict):
+            diffs[-1] = _copy_diff(diffs[-1])
+        return DiffedSnapshot(self._data, diffs)
+
     def flatten(self):
         self.flatten_diff(*self.diffs)
 
+    def _thaw_current_diff(self):
+        """
+        Replaces PersistentDict, which is the current diff, with a dict copy, so it could be modified. The copy is
+        aliased to the original, so the original could still be removed.
+        """
+        diff = self._diffs[-1]
+        copied_diff = self._diffs[-1] = _copy_diff(diff)
+        self._aliases[id(diff)] = diff, copied_diff
+        if id(diff) in self._pinned:
+            self._pinned[id(copied_diff)] = copied_diff
+        self._index = None
+        self._children.clear()
+        return copied_diff
+
     def __setitem__(self, item, value):
         if not self._diffs:
             raise RuntimeError('Assign at least a one diff to Diffed in order to set value.')
@@ -482,16 +1829,78 @@ class Diffed(MappingView, MutableMapping):
         if diff is None:
             diff = {}
             self._diffs[-1] = diff
-        if isinstance(value, (NoneType, int, long, float, str, unicode, list, set, tuple, dict, DictView)):
+        elif isinstance(diff, PersistentDict):
+            diff = self._thaw_current_diff()
+        if isinstance(value, (NoneType, int, long, float, str, unicode, list, set, tuple, dict, DictView,
+                              PersistentDict, Increment, ListItems)):
             diff[item] = value
+            self._children.pop(item, None)
+            if self._index is not None:
+                self._index_item(item, diff)
         else:
             raise ValueError('Type not supported: {value_type}'.format(value_type=type(value)))
 
+    def incr(self, item, delta=1):
+        """
+        Increments numeric item by delta. Only the delta is stored in the current diff, so increments from several diffs
+        are summed up and could be saved with $inc.
+
+        :return: incremented value.
+        """
+        if not self._diffs:
+            raise RuntimeError('Assign at least a one diff to Diffed in order to set value.')
+        increment = Increment(delta)
+        # Effective value is checked, wherever it's stored, so nothing is written if it couldn't be incremented.
+        try:
+            effective_value = self._get_container(item)[item]
+        except KeyError:
+            effective_value = None
+        if not isinstance(effective_value, (NoneType, int, long, float, Increment)):
+            raise TypeError('Only numeric values could be incremented. {!r} given.'.format(effective_value))
+        diff = self.get_current_diff()
+        try:
+            value = diff[item]
+        except KeyError:
+            self[item] = increment
+        else:
+            self[item] = increment.apply(value)
+        return self[item]
+
+    def set_list_item(self, item, index, value):
+        """
+        Sets item of list at index. Only the item is stored in the current diff, so it could be saved with "item.index"
+        path instead of the whole list.
+
+        :return: updated list.
+        """
+        if not self._diffs:
+            raise RuntimeError('Assign at least a one diff to Diffed in order to set value.')
+        items = ListItems({index: value})
+        try:
+            effective_value = self._get_container(item)[item]
+        except KeyError:
+            effective_value = None
+        if not isinstance(effective_value, (list, tuple, ListItems)):
+            raise TypeError('Only items of lists could be set. {!r} given.'.format(effective_value))
+        diff = self.get_current_diff()
+        try:
+            current_value = diff[item]
+        except KeyError:
+            self[item] = items
+        else:
+            self[item] = items.apply(current_value)
+        return self[item]
+
     def __delitem__(self, item):
         if not self._diffs:
             raise RuntimeError('Assign at least a one diff to Diffed in order to remove value.')
         diff = self.get_current_diff()
+        if isinstance(diff, PersistentDict):
+            diff = self._thaw_current_diff()
         diff[item] = None
+        self._children.pop(item, None)
+        if self._index is not None:
+            self._index_item(item, diff)
 
     def reset(self, other):
         for key, value in other.iteritems():
@@ -500,6 +1909,13 @@ class Diffed(MappingView, MutableMapping):
             self[key] = None
 
     def dump_item(self, item):
+        return self._dump_item(item, True)
+
+    def _dump_item(self, item, copy):
+        """
+        Merges values for item through the diffs. If copy is False, values from the data and diffs are shared with
+        the result, only changed nested dicts are copied.
+        """
         values = []
         for lookup in self.lookup():
             try:
@@ -507,19 +1923,33 @@ class Diffed(MappingView, MutableMapping):
             except KeyError:
                 pass
             else:
-                if isinstance(value, dict):
+                if isinstance(value, (dict, PersistentDict)):
                     values.insert(0, value)
                 elif not values:
+                    if value.__class__ in _delta_types:
+                        return self._get_applied(item)
                     return dump_value(value)
                 else:
+                    if isinstance(value, DictView):
+                        # DictView replaces everything below, so nested diffs are merged into it.
+                        values.insert(0, value)
                     break
         if not values:
             raise KeyError('{} not found'.format(item))
-        else:
+        elif copy:
             dump = {}
             for value in values:
                 dump = merge(dump, value)
             return dump
+        else:
+            first = values[0]
+            if isinstance(first, (dict, PersistentDict)):
+                dump = dict(_merged_data(first)[0])
+            else:
+                dump = merge({}, first)
+            for value in values[1:]:
+                merge(dump, value, copy=False)
+            return dump
 
     def dump(self):
         dump = {}
@@ -535,70 +1965,238 @@ class Diffed(MappingView, MutableMapping):
         return self._dump_diff(self._diffs[-1])
 
 
+class DiffedSnapshot(Diffed):
+    """
+    Read only Diffed, see :meth:`Diffed.snapshot`.
+    """
+
+    _writable = False
+
+    def __init__(self, data=None, diffs=None):
+        super(DiffedSnapshot, self).__init__(data)
+        self._diffs = list(diffs or ())
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError('Snapshot is read only.')
+
+    __setitem__ = __delitem__ = incr = reset = _read_only
+    add_diff = remove_diff = apply_diff = pin_diff = unpin_diff = compact = _read_only
+
+    def snapshot(self):
+        return self
+
+
 JSON = 'json'
 JSONP = 'jsonp'
+NDJSON = 'ndjson'
 XJSON = 'x-json'
 AMF = 'amf'
 YAML = 'yaml'
+MSGPACK = 'msgpack'
+
+try:
+    import simplejson as _json
+except ImportError:
+    import json as _json
+    _json_options = {}
+else:
+    # Defaults of simplejson, which differ from stdlib json, so the output doesn't depend on the backend installed.
+    _json_options = {'use_decimal': False, 'namedtuple_as_object': False}
+import json as _stdlib_json
+
+
+# Instances of exactly these classes are serialized straight from their data. Subclasses may override dump, e.g. to
+# exclude fields, so they are dumped.
+_raw_view_types = frozenset([MappingView, DictView, ListView])
+_raw_diffed_types = frozenset([Diffed, DiffedSnapshot])
+
+
+def _encode_default(value):
+    """Fallback for JSON and MessagePack encoders. Serializes views and Diffed objects straight from their data, so
+    they don't have to be dumped first.
+    """
+    cls = value.__class__
+    if cls in _raw_diffed_types:
+        return _diffed_items(value)
+    elif cls in _raw_view_types:
+        return value._data
+    elif cls is PersistentDict:
+        return dict(value.iteritems())
+    elif isinstance(value, set):
+        return list(value)
+    dump = dump_value(value)
+    if dump is value:
+        raise TypeError('{!r} is not serializable'.format(value))
+    return dump
+
+
+def _diffed_items(diffed):
+    """Returns effective items of diffed, the same as :meth:`Diffed.dump` does. Only values, which are merged through
+    the diffs, are dumped, the rest are taken as is.
+    """
+    items = {}
+    data = diffed._data
+    for key in diffed:
+        container = diffed._get_container(key)
+        value = container[key]
+        if value.__class__ in _delta_types:
+            value = diffed._get_applied(key)
+        elif isinstance(value, (dict, PersistentDict)):
+            if container is data:
+                value = _merged_data(value)[0]
+            else:
+                value = diffed._dump_item(key, False)
+        items[key] = value
+    return items
+
+
+# Values of these types are kept by _merged_data as is.
+_merged_plain_types = frozenset([unicode, str, int, long, float, bool, list, tuple])
+
+
+def _merged_data(value):
+    """Returns value the way ``merge({}, value)`` does, but nested dicts are copied only if there are Nones, empty
+    dicts, Increments or ListItems to get rid of. The second item is False, if value is empty.
+    """
+    result = None if value.__class__ is dict else dict(value.iteritems())
+    merged = False
+    for key, item in value.iteritems():
+        if item.__class__ in _merged_plain_types:
+            merged = True
+        elif item is None:
+            if result is None:
+                result = dict(value)
+            del result[key]
+            merged = True
+        elif item.__class__ is dict or isinstance(item, (dict, PersistentDict)):
+            nested, nested_merged = _merged_data(item)
+            if nested is not item or not nested_merged:
+                if result is None:
+                    result = dict(value)
+                if nested_merged:
+                    result[key] = nested
+                else:
+                    del result[key]
+            merged = merged or nested_merged
+        elif item.__class__ in _delta_types:
+            if result is None:
+                result = dict(value)
+            result[key] = item.apply(None)
+            merged = True
+        else:
+            merged = True
+    return value if result is None else result, merged
+
+
+_json_encoder = _json.JSONEncoder(separators=(', ', ': '), default=_encode_default, **_json_options)
+
+
+def encode_json(data):
+    """Encodes data to JSON. Uses simplejson if it's installed, stdlib json otherwise, both with the same options, so
+    the output is the same. Views, PersistentDicts and Diffed objects are encoded without dumping them first.
+    """
+    return _json_encoder.encode(data)
+
+
+def decode_json(data):
+    # stdlib json is used for decoding, since simplejson returns str instead of unicode for ascii strings.
+    return _stdlib_json.loads(data)
+
+
+class DataFormat(object):
+    __slots__ = 'name', 'dumps', 'loads', 'content_type'
+
+    def __init__(self, name, dumps, loads, content_type):
+        self.name = name
+        self.dumps = dumps
+        self.loads = loads
+        self.content_type = content_type
+
+    def __repr__(self):
+        return 'DataFormat({!r}, {!r})'.format(self.name, self.content_type)
+
 
 _supported_data_formats = {}
 
-content_types = {
-    JSON: 'application/json',
-    XJSON: 'application/x-json',
-    AMF: 'application/x-amf',
-    YAML: 'application/yaml'
+content_types = {}
+
+# These formats are registered on first use, since their modules may require optional packages.
+_lazy_data_formats = {
+    XJSON: ('cherrycommon._xjson', 'application/x-json'),
+    AMF: ('cherrycommon._amf', 'application/x-amf'),
+    YAML: ('cherrycommon._yaml', 'application/yaml'),
+    MSGPACK: ('cherrycommon._msgpack', 'application/x-msgpack')
 }
 
+# Content types are known upfront, only the codecs are loaded on first use.
+content_types.update((name, content_type) for name, (_, content_type) in _lazy_data_formats.iteritems())
+
+
+def register_data_format(name, dumps, loads, content_type):
+    """Registers data format, so it could be used in :func:`encode_data`, :func:`decode_data` and data handlers.
+    Registered format replaces the existing one with the same name.
+
+    :param name: name of the data format.
+    :param dumps: function, which encodes plain data to string.
+    :param loads: function, which decodes string to plain data.
+    :param content_type: mime type for encoded data.
+    :return: registered :class:`DataFormat`.
+    """
+    data_format = _supported_data_formats[name] = DataFormat(name, dumps, loads, content_type)
+    content_types[name] = content_type
+    return data_format
+
+
+def _encode_ndjson(documents):
+    if isinstance(documents, (Mapping, MappingView)) or not hasattr(documents, '__iter__'):
+        # Single document, e.g. a document saved by CRUD handler, is encoded as a single line.
+        documents = documents,
+    return ''.join('{}\n'.format(encode_json(document)) for document in documents)
+
+
+def _decode_ndjson(data):
+    return [decode_json(line) for line in data.splitlines() if line.strip()]
+
+
+register_data_format(JSON, encode_json, decode_json, 'application/json')
+register_data_format(NDJSON, _encode_ndjson, _decode_ndjson, 'application/x-ndjson')
+
 
 def check_data_format(data_format=JSON):
+    """Returns :class:`DataFormat` registered for name.
+
+    :raises ImportError: if data format requires package, which is not installed.
+    :raises NotImplementedError: if data format is not registered.
+    """
     try:
-        _module = _supported_data_formats[data_format]
+        _format = _supported_data_formats[data_format]
     except KeyError:
         pass
     else:
-        if _module:
-            return _module
+        if _format:
+            return _format
         else:
             raise ImportError('Data format is not supported: {}'.format(data_format))
 
-    if data_format == JSON:
-        import json
-        _module = _supported_data_formats[JSON] = json
-    elif data_format == XJSON:
-        import cherrycommon._xjson
-        _module = _supported_data_formats[XJSON] = cherrycommon._xjson
-    elif data_format == AMF:
-        try:
-            import cherrycommon._amf
-        except ImportError:
-            _supported_data_formats[AMF] = False
-            raise
-        else:
-            _module = _supported_data_formats[AMF] = cherrycommon._amf
-    elif data_format == YAML:
-        try:
-            import cherrycommon._yaml
-        except ImportError:
-            _supported_data_formats[YAML] = False
-            raise
-        else:
-            _module = _supported_data_formats[YAML] = cherrycommon._yaml
-    else:
+    try:
+        module_name, content_type = _lazy_data_formats[data_format]
+    except KeyError:
         raise NotImplementedError('Data format {} is not supported'.format(data_format))
-    return _module
+    try:
+        _module = import_module(module_name)
+    except ImportError:
+        _supported_data_formats[data_format] = False
+        raise
+    return register_data_format(data_format, _module.dumps, _module.loads, content_type)
 
 
 def encode_data(data, data_format=JSON):
-    _module = check_data_format(data_format)
-    return _module.dumps(data)
+    return check_data_format(data_format).dumps(data)
 
 
 def decode_data(data, data_format=JSON):
-    _module = check_data_format(data_format)
-    return _module.loads(data)
+    return check_data_format(data_format).loads(data)
 
 
 def get_content_type(data_format=JSON):
-    check_data_format(data_format)
-    return content_types[data_format]
+    return check_data_format(data_format).content_type
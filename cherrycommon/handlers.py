@@ -7,12 +7,14 @@ import mimetypes
 import email
 import hashlib
 from abc import ABCMeta, abstractmethod
-from pymongo.cursor import Cursor
+from collections import Iterator
+from cherrycommon.asyncdb import AsyncDataProvider
 from cherrycommon.db import DataProvider, DEFAULT_HOST, DEFAULT_PORT
 from tornado.web import Application, StaticFileHandler, HTTPError, URLSpec, RequestHandler
 from tornado.template import BaseLoader, Template
+from tornado.gen import coroutine
 
-from cherrycommon.dictutils import JSON, AMF, encode_data, decode_data, get_content_type
+from cherrycommon.dictutils import JSON, NDJSON, AMF, encode_data, decode_data, encode_json, get_content_type
 from cherrycommon.mathutils import random_id
 from cherrycommon.pathutils import norm_path, file_path
 
@@ -167,6 +169,10 @@ class DataHandler(RequestHandler):
                 self._request_data = self.decode_data(self.request.body)
             except (TypeError, ValueError):
                 self._request_data = {}
+            else:
+                if not self.request.body or self._request_data is None:
+                    # Empty body is decoded to None or an empty list by some data formats.
+                    self._request_data = {}
         return self._request_data
 
     _ARG_DEFAULT = []
@@ -174,7 +180,8 @@ class DataHandler(RequestHandler):
     def get_argument(self, name, default=_ARG_DEFAULT, strip=True):
         try:
             return self.get_request_data()[name]
-        except KeyError:
+        except (KeyError, TypeError):
+            # Request data may be a list, which has no named arguments.
             return super(DataHandler, self).get_argument(name, default=default, strip=strip)
 
     def respond(self, data=None):
@@ -239,6 +246,7 @@ class CollectionHandler(AbstractCollectionHandler):
     """
 
     data_format = JSON
+    data_provider_class = DataProvider
 
     def initialize(self, db=None, collection=None, host=DEFAULT_HOST, port=DEFAULT_PORT,
                    use_cache=False, data_format=JSON):
@@ -258,7 +266,7 @@ class CollectionHandler(AbstractCollectionHandler):
         else:
             self.collection = collection
 
-        self.data_provider = DataProvider(db, collection, host=host, port=port)
+        self.data_provider = self.data_provider_class(db, collection, host=host, port=port)
         self.data_format = data_format
 
     def query_documents(self, **kwargs):
@@ -272,23 +280,73 @@ class CollectionHandler(AbstractCollectionHandler):
 
 
 class CollectionDumper(CollectionHandler):
+    """Responds with documents from collection. If streamed is set, cursors are streamed in JSON and NDJSON formats:
+    documents are encoded one by one, as they come off the cursor, and flushed in chunks of about chunk_size bytes, so
+    the response is never held in memory as a whole.
+    """
+
+    streamed = False
+    chunk_size = 64 * 1024
+    stream_formats = JSON, NDJSON
+
     def respond(self, data=None):
-        if isinstance(data, Cursor):
+        if isinstance(data, Iterator):
+            if self.streamed and self.data_format in self.stream_formats:
+                return self.stream(data)
             data = list(data)
         super(CollectionDumper, self).respond(data)
 
+    @coroutine
+    def stream(self, documents):
+        """Writes documents as JSON array or, if data format is NDJSON, as newline delimited JSON. Waits for each
+        chunk to be flushed, before encoding the next one. If documents could not be read or encoded after the first
+        chunk is sent, the connection is closed, so the client doesn't get truncated response as a complete one.
+
+        :param documents: iterable with documents.
+        """
+        ndjson = self.data_format == NDJSON
+        self.set_header('Content-Type', get_content_type(self.data_format))
+        separator = '' if ndjson else '['
+        chunk = []
+        size = 0
+        try:
+            for document in documents:
+                data = encode_json(document)
+                if ndjson:
+                    chunk.append(data)
+                    chunk.append('\n')
+                else:
+                    chunk.append(separator)
+                    chunk.append(data)
+                    separator = ','
+                size += len(data) + 1
+                if size >= self.chunk_size:
+                    self.write(''.join(chunk))
+                    chunk = []
+                    size = 0
+                    yield self.flush()
+        except Exception:
+            if self._headers_written:
+                # Status is already sent, so the error could not be reported to the client otherwise.
+                self.request.connection.close()
+            raise
+        if not ndjson:
+            chunk.append('[]' if separator == '[' else ']')
+        self.write(''.join(chunk))
+
+    @coroutine
     def get(self, *args, **kwargs):
         ids = self.get_arguments('ids')
         if ids:
-            self.respond(self.get_documents(spec={'_id': {'$in': ids}}, **kwargs))
+            yield self.respond(self.get_documents(spec={'_id': {'$in': ids}}, **kwargs))
             return
 
         keys = self.get_argument('keys', False)
         if keys:
-            self.respond(self.get_ids())
+            yield self.respond(self.get_ids())
             return
 
-        self.respond(self.get_documents())
+        yield self.respond(self.get_documents())
 
 
 class CollectionCRUD(CollectionDumper):
@@ -297,13 +355,13 @@ class CollectionCRUD(CollectionDumper):
         return document
 
     def save_document(self, document):
-        self.data_provider.save(document)
+        return self.data_provider.save(document)
 
     def put_document(self, document_id, document):
-        self.data_provider.update(document_id, {'$set': document}, upsert=True)
+        return self.data_provider.update(document_id, {'$set': document}, upsert=True)
 
     def delete_document(self, document_id):
-        self.data_provider.remove(document_id)
+        return self.data_provider.remove(document_id)
 
     def post(self, *args, **kwargs):
         document = decode_data(self.request.body, self.data_format)
@@ -322,6 +380,48 @@ class CollectionCRUD(CollectionDumper):
         self.delete_document(document_id)
 
 
+class AsyncCollectionHandler(CollectionHandler):
+    """Collection handler, which doesn't block IOLoop: queries are run in a thread pool, see
+    :mod:`cherrycommon.asyncdb`, so query_documents, get_ids and get_document return futures.
+    """
+
+    data_provider_class = AsyncDataProvider
+
+
+class AsyncCollectionDumper(AsyncCollectionHandler, CollectionDumper):
+    @coroutine
+    def get(self, *args, **kwargs):
+        ids = self.get_arguments('ids')
+        if ids:
+            documents = yield self.get_documents(spec={'_id': {'$in': ids}}, **kwargs)
+        elif self.get_argument('keys', False):
+            documents = yield self.get_ids()
+        else:
+            documents = yield self.get_documents()
+        yield self.respond(iter(documents))
+
+
+class AsyncCollectionCRUD(AsyncCollectionDumper, CollectionCRUD):
+    @coroutine
+    def post(self, *args, **kwargs):
+        document = decode_data(self.request.body, self.data_format)
+        document = self.generate_document_id(document)
+        yield self.save_document(document)
+        self.respond(document)
+
+    @coroutine
+    def put(self, *args, **kwargs):
+        document = decode_data(self.request.body, self.data_format)
+        document_id = document.pop('_id', kwargs['id'])
+        yield self.put_document(document_id, document)
+        self.respond(document)
+
+    @coroutine
+    def delete(self, *args, **kwargs):
+        document_id = kwargs['id']
+        yield self.delete_document(document_id)
+
+
 _DEFAULT_HOST = '.*$'
 
 
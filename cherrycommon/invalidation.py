@@ -0,0 +1,140 @@
+"""Cross-process invalidation of :class:`cherrycommon.db.DataProvider` caches over zmq PUB/SUB.
+
+Each process runs :class:`CacheInvalidationBus`, which publishes ids of documents changed by this process and drops
+documents changed by other processes from local caches. With several writers, run :func:`run_forwarder` somewhere and
+point publishers to its frontend and subscribers to its backend::
+
+    # forwarder process
+    run_forwarder('tcp://*:5601', 'tcp://*:5602')
+
+    # worker processes
+    bus = CacheInvalidationBus('tcp://forwarder:5601', ['tcp://forwarder:5602'], loop=process.loop)
+    bus.start()
+
+With a single writer, it could bind its publisher and workers could subscribe to it directly.
+"""
+from logging import getLogger
+from threading import Lock
+from bson import BSON
+import zmq
+from zmq.eventloop.zmqstream import ZMQStream
+from cherrycommon.db import DataProvider
+from cherrycommon.mathutils import random_id
+
+logger = getLogger('invalidation')
+
+
+def _encode_name(name):
+    return name.encode('utf-8') if isinstance(name, unicode) else name
+
+
+def _topic(db, collection):
+    # Db names can't contain dots, the trailing zero keeps subscriptions from matching collections by prefix. zmq
+    # frames are bytes, so unicode names are encoded.
+    return '{}.{}\0'.format(_encode_name(db), _encode_name(collection))
+
+
+class CacheInvalidationBus(object):
+    """Publishes and receives invalidations of DataProvider caches. Messages are ``[topic, origin, id]``, where topic
+    is db and collection, origin is id of the bus, which published the message, so it skips its own messages, and id
+    is BSON encoded document id or empty for the whole collection.
+
+    :param publish_address: zmq address of the publisher, None for subscribe only bus.
+    :param subscribe_addresses: zmq addresses to receive invalidations from.
+    :param bind: bind publisher instead of connecting it.
+    :param collections: (db, collection) tuples to receive invalidations for, all collections if None.
+    :param loop: zmq IOLoop to receive invalidations on.
+    :param context: zmq context, the global instance is used by default.
+    """
+
+    def __init__(self, publish_address=None, subscribe_addresses=(), bind=False, collections=None, loop=None,
+                 context=None):
+        self.publish_address = publish_address
+        self.subscribe_addresses = list(subscribe_addresses)
+        self.bind = bind
+        self.collections = collections
+        self._loop = loop
+        self._context = context or zmq.Context.instance()
+        self._origin = random_id()
+        self._publisher = None
+        self._publisher_lock = Lock()
+        self._stream = None
+        self.published = 0
+        self.received = 0
+
+    def start(self):
+        """Opens sockets and installs the bus as DataProvider.cache_invalidator, if it publishes.
+        """
+        if self.publish_address:
+            self._publisher = self._context.socket(zmq.PUB)
+            if self.bind:
+                self._publisher.bind(self.publish_address)
+            else:
+                self._publisher.connect(self.publish_address)
+            DataProvider.cache_invalidator = self
+
+        if self.subscribe_addresses:
+            subscriber = self._context.socket(zmq.SUB)
+            if self.collections is None:
+                subscriber.setsockopt(zmq.SUBSCRIBE, '')
+            else:
+                for db, collection in self.collections:
+                    subscriber.setsockopt(zmq.SUBSCRIBE, _topic(db, collection))
+            for address in self.subscribe_addresses:
+                subscriber.connect(address)
+            self._stream = ZMQStream(subscriber, self._loop)
+            self._stream.on_recv(self._on_message)
+        return self
+
+    def stop(self):
+        if DataProvider.cache_invalidator is self:
+            DataProvider.cache_invalidator = None
+        if self._publisher is not None:
+            with self._publisher_lock:
+                self._publisher.close(linger=0)
+                self._publisher = None
+        if self._stream is not None:
+            self._stream.close(linger=0)
+            self._stream = None
+
+    def invalidate(self, db, collection, _id=None):
+        """Publishes invalidation of the document, or the whole collection if _id is None. Safe to call from any
+        thread.
+        """
+        payload = '' if _id is None else BSON.encode({'_id': _id})
+        with self._publisher_lock:
+            if self._publisher is None:
+                return
+            self._publisher.send_multipart([_topic(db, collection), self._origin, payload])
+            self.published += 1
+
+    def _on_message(self, frames):
+        try:
+            topic, origin, payload = frames
+        except ValueError:
+            logger.warning('Invalid cache invalidation message: {!r}'.format(frames))
+            return
+        if origin == self._origin:
+            return
+        db, collection = topic[:-1].decode('utf-8').split('.', 1)
+        _id = BSON(payload).decode()['_id'] if payload else None
+        DataProvider.drop_cached(db, collection, _id)
+        self.received += 1
+
+
+def run_forwarder(frontend, backend, context=None):
+    """Forwards invalidations from publishers, connected to frontend, to subscribers, connected to backend. Blocks
+    until context is terminated.
+    """
+    context = context or zmq.Context.instance()
+    xsub = context.socket(zmq.XSUB)
+    xsub.bind(frontend)
+    xpub = context.socket(zmq.XPUB)
+    xpub.bind(backend)
+    try:
+        zmq.proxy(xsub, xpub)
+    except zmq.ContextTerminated:
+        pass
+    finally:
+        xsub.close(linger=0)
+        xpub.close(linger=0)
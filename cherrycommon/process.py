@@ -160,6 +160,7 @@ class IOLoopProcess(BasicProcess):
                                             crc=crc, log=log, ports=ports, sockets=sockets,
                                             external_address=external_address)
         self._loop = loop
+        self._stop_callbacks = []
 
     @property
     def loop(self):
@@ -176,7 +177,17 @@ class IOLoopProcess(BasicProcess):
             self.stop()
             self.logger.error('Exited via Ctrl-C: {}'.format(self.name))
 
+    def add_stop_callback(self, callback):
+        """Adds callback to be called on stop, before the loop is stopped, e.g. to flush buffered writes.
+        """
+        self._stop_callbacks.append(callback)
+
     def stop(self):
+        for callback in self._stop_callbacks:
+            try:
+                callback()
+            except Exception:
+                self.logger.exception('Stop callback failed: {!r}'.format(callback))
         self.loop.stop()
         super(IOLoopProcess, self).stop()
 
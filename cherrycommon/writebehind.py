@@ -0,0 +1,265 @@
+"""Write-behind buffering of :class:`cherrycommon.db.DataProvider` updates. Updates of single documents are kept in
+memory, updates of the same document are coalesced into one, and all of them are written with one bulk write once in
+interval or when there are too many of them::
+
+    players = DataProvider('game', 'players', use_cache=True)
+    players.write_behind = WriteBehindBuffer(players, interval=1, loop=process.loop).start()
+    process.add_stop_callback(players.write_behind.stop)
+
+    players.update(player_id, {'$inc': {'gold': 10}})  # buffered
+
+Until flushed, buffered updates are not visible to reads. Other writes of the data provider flush the buffer first, so
+they are applied in the order they were made. Values of buffered updates should not be changed after update. Updates,
+which are not idempotent, like $inc, are written at most once, see :meth:`WriteBehindBuffer.flush`.
+"""
+from logging import getLogger
+from threading import Lock
+from time import time
+from pymongo.errors import ConnectionFailure, BulkWriteError
+from tornado.ioloop import IOLoop, PeriodicCallback
+
+logger = getLogger('writebehind')
+
+# Operators, which are coalesced. Updates with other operators are buffered as is.
+_coalesced_operators = frozenset(['$set', '$unset', '$inc'])
+_idempotent_operators = frozenset(['$set', '$unset'])
+_number_types = (int, long, float)
+
+
+def _is_coalesced(update):
+    return all(operator in _coalesced_operators for operator in update)
+
+
+def _is_idempotent(update):
+    return all(operator in _idempotent_operators for operator in update)
+
+
+def _overlaps(path, other):
+    return path == other or other.startswith(path + '.') or path.startswith(other + '.')
+
+
+def _can_merge(pending, update):
+    for operator, fields in update.iteritems():
+        for path in fields:
+            for pending_operator, pending_fields in pending.iteritems():
+                for pending_path, pending_value in pending_fields.iteritems():
+                    if not _overlaps(path, pending_path):
+                        continue
+                    if operator == '$inc':
+                        # Increment could only be added to increment or number set before.
+                        if pending_path != path or pending_operator == '$unset':
+                            return False
+                        if (pending_operator == '$set' and
+                                (pending_value.__class__ is bool or not isinstance(pending_value, _number_types))):
+                            return False
+                    elif path != pending_path and not pending_path.startswith(path + '.'):
+                        # $set or $unset of a field inside of the pending one.
+                        return False
+    return True
+
+
+def merge_update(pending, update):
+    """Merges update into pending one, if the result is the same as of applying them one after another. Updates
+    should contain $set, $unset and $inc operators only.
+
+    Examples:
+        >>> pending = {'$set': {'stats': {'level': 1}}, '$inc': {'gold': 5}}
+        >>> merge_update(pending, {'$inc': {'gold': 5}, '$unset': {'stats': 1}})
+        True
+        >>> pending
+        {'$unset': {'stats': 1}, '$inc': {'gold': 10}}
+        >>> merge_update(pending, {'$set': {'stats.level': 2}})
+        False
+
+    :param pending: update to merge into, changed in place.
+    :param update: update to merge.
+    :return: False if updates conflict and pending one was not changed.
+    """
+    if not _can_merge(pending, update):
+        return False
+    for operator, fields in update.iteritems():
+        for path, value in fields.iteritems():
+            if operator == '$inc':
+                pending_set = pending.get('$set')
+                if pending_set is not None and path in pending_set:
+                    pending_set[path] += value
+                else:
+                    pending_inc = pending.setdefault('$inc', {})
+                    pending_inc[path] = pending_inc.get(path, 0) + value
+                continue
+            for pending_fields in pending.itervalues():
+                for pending_path in [p for p in pending_fields if p == path or p.startswith(path + '.')]:
+                    del pending_fields[pending_path]
+            pending.setdefault(operator, {})[path] = value
+    for operator in [operator for operator, fields in pending.iteritems() if not fields]:
+        del pending[operator]
+    return True
+
+
+class WriteBehindBuffer(object):
+    """Buffers updates of single documents for data provider, see the module docs. Flushes are done on the IOLoop, each
+    flush is one ordered bulk write.
+
+    :param data_provider: DataProvider to write to.
+    :param interval: seconds between flushes.
+    :param max_pending: number of buffered updates, which triggers flush before the interval ends.
+    :param loop: IOLoop to flush on, the current one by default.
+    """
+
+    def __init__(self, data_provider, interval=1.0, max_pending=1000, loop=None):
+        self.data_provider = data_provider
+        self.interval = interval
+        self.max_pending = max_pending
+        self._loop = loop
+        self._lock = Lock()
+        # Held for the whole flush, so flushes from the IOLoop and from other threads don't overlap.
+        self._flush_lock = Lock()
+        # Lists of [update, upsert, coalesced] entries by document ids.
+        self._pending = {}
+        self._depth = 0
+        self._flush_scheduled = False
+        self._periodic = None
+        self.updates = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.writes = 0
+        self.errors = 0
+        self.dropped = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self.total_flush_latency = 0.0
+
+    @property
+    def loop(self):
+        if self._loop is None:
+            self._loop = IOLoop.current()
+        return self._loop
+
+    def start(self):
+        """Starts periodic flushes. Pending updates are not flushed, when the IOLoop stops, unless :meth:`stop` is
+        called, e.g. added with :meth:`cherrycommon.process.IOLoopProcess.add_stop_callback`.
+        """
+        if self._periodic is None:
+            self._periodic = PeriodicCallback(self.flush, self.interval * 1000, self.loop)
+            self._periodic.start()
+        return self
+
+    def stop(self):
+        """Stops periodic flushes and flushes pending updates.
+        """
+        if self._periodic is not None:
+            self._periodic.stop()
+            self._periodic = None
+        self.flush()
+
+    def update(self, _id, update, upsert=False):
+        """Buffers update of document. $set, $unset and $inc are coalesced with the previous update of the document,
+        unless they conflict with it. Only updates with operators could be buffered, not replacement documents.
+        """
+        if not update or not all(key.startswith('$') for key in update):
+            raise ValueError('Only updates with operators could be buffered. {!r} given.'.format(update))
+        coalesced = _is_coalesced(update)
+        with self._lock:
+            self.updates += 1
+            entries = self._pending.get(_id)
+            if entries:
+                last = entries[-1]
+                if coalesced and last[2] and last[1] == upsert and merge_update(last[0], update):
+                    self.coalesced += 1
+                    return
+            else:
+                entries = self._pending[_id] = []
+            entries.append([dict((operator, dict(fields)) for operator, fields in update.iteritems()), upsert,
+                            coalesced])
+            self._depth += 1
+            if self._depth >= self.max_pending and not self._flush_scheduled:
+                self._flush_scheduled = True
+                self.loop.add_callback(self.flush)
+
+    def flush(self):
+        """Writes all buffered updates with one bulk write. Flushes never overlap, so updates of a document are written
+        in order, even if flushes are called from different threads.
+
+        Delivery is at-most-once for updates, which are not idempotent: if connection fails during the write, it's
+        unknown which updates were applied, so only $set and $unset updates are kept for the next flush, and the
+        rest, e.g. $inc, are dropped rather than applied twice. If the write fails with an error, updates before the
+        failed one are applied, the failed one is dropped and the rest are kept for the next flush.
+
+        :return: number of written updates.
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                depth, self._depth = self._depth, 0
+                self._flush_scheduled = False
+            if not pending:
+                return 0
+
+            updates = [(_id, update, upsert) for _id, entries in pending.iteritems() for update, upsert, _ in entries]
+            started = time()
+            try:
+                self.data_provider.bulk_update(updates)
+            except ConnectionFailure:
+                retried = [update for update in updates if _is_idempotent(update[1])]
+                logger.exception('Failed to flush {} updates, {} will be retried.'.format(depth, len(retried)))
+                self._failed(updates, 0, retried)
+                return 0
+            except BulkWriteError as e:
+                write_errors = e.details.get('writeErrors')
+                if not write_errors:
+                    # Only write concern errors, all updates were applied, but not confirmed to be replicated.
+                    logger.exception('Flushed {} updates with write concern errors.'.format(depth))
+                    self._failed(updates, len(updates), ())
+                    return len(updates)
+                # Ordered bulk write stops at the first error, the rest of updates were not applied.
+                index = write_errors[0]['index']
+                logger.exception('Failed to flush update {!r}, dropped.'.format(updates[index]))
+                self._failed(updates, index, updates[index + 1:])
+                return index
+            except Exception:
+                logger.exception('Failed to flush {} updates, dropped.'.format(depth))
+                self._failed(updates, 0, ())
+                return 0
+
+            latency = time() - started
+            self.flushes += 1
+            self.writes += depth
+            self.last_flush_latency = latency
+            self.max_flush_latency = max(self.max_flush_latency, latency)
+            self.total_flush_latency += latency
+            return depth
+
+    def _failed(self, updates, written, retried):
+        """Counts failed flush and puts updates, which should be retried, before ones buffered since the flush started.
+        """
+        requeued = {}
+        for _id, update, upsert in retried:
+            requeued.setdefault(_id, []).append([update, upsert, _is_coalesced(update)])
+        with self._lock:
+            self.errors += 1
+            self.writes += written
+            self.dropped += len(updates) - written - len(retried)
+            for _id, entries in requeued.iteritems():
+                self._pending[_id] = entries + self._pending.get(_id, [])
+            self._depth += len(retried)
+
+    def __len__(self):
+        return self._depth
+
+    def get_stats(self):
+        """Returns queue depth, i.e. number of buffered updates, number of buffered documents, counters and flush
+        latencies in seconds.
+        """
+        return {
+            'pending': self._depth,
+            'documents': len(self._pending),
+            'updates': self.updates,
+            'coalesced': self.coalesced,
+            'flushes': self.flushes,
+            'writes': self.writes,
+            'errors': self.errors,
+            'dropped': self.dropped,
+            'last_flush_latency': self.last_flush_latency,
+            'max_flush_latency': self.max_flush_latency,
+            'avg_flush_latency': self.total_flush_latency / self.flushes if self.flushes else 0.0
+        }
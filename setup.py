@@ -10,13 +10,15 @@ setup(
     author_email='info@wysegames.com',
     description='Set of various utilities used by cherry game engine.',
     install_requires=[
-        "tornado >= 2.4",
-        "pymongo >= 2.3",
+        "tornado >= 4.0",
+        "pymongo >= 2.7",
         "openpyxl",
         "python-daemon"
     ],
     extras_require={
         'AMF data encode/decode':  ['pyamf'],
-        'YAML data encode/decode': ['pyyaml']
+        'YAML data encode/decode': ['pyyaml'],
+        'MessagePack data encode/decode': ['msgpack >= 0.5.2'],
+        'Columnar projection': ['numpy']
     }
 )
@@ -0,0 +1,102 @@
+"""In-memory stand-ins for pymongo collections, shared by tests of data providers.
+"""
+from time import sleep
+from cherrycommon.db import DataProvider
+
+
+class MemoryCollection(object):
+    """In-memory stand-in for the part of pymongo collection used by DataProvider.
+    """
+
+    def __init__(self):
+        self.documents = {}
+        self.delay = 0
+        self.bulk_writes = 0
+
+    def _match(self, spec):
+        if not isinstance(spec, dict):
+            spec = {'_id': spec}
+        sleep(self.delay)
+        if '_id' not in spec:
+            return self.documents.values()
+        _id = spec['_id']
+        ids = _id['$in'] if isinstance(_id, dict) else [_id]
+        return [self.documents[_id] for _id in ids if _id in self.documents]
+
+    def find_one(self, spec, fields=None):
+        documents = self._match(spec)
+        return dict(documents[0]) if documents else None
+
+    def find(self, spec=None, fields=None):
+        return iter(map(dict, self._match(spec or {})))
+
+    def distinct(self, key):
+        return [document[key] for document in self._match({})]
+
+    def save(self, document, safe=False):
+        self.documents[document['_id']] = dict(document)
+
+    def insert(self, documents, **kwargs):
+        for document in documents:
+            self.save(document)
+
+    def update(self, spec, update, upsert=False, **kwargs):
+        documents = self._match(spec)
+        if not documents and upsert:
+            self.documents[spec['_id']] = {'_id': spec['_id']}
+            documents = self._match(spec)
+        for document in documents:
+            if not any(key.startswith('$') for key in update):
+                _id = document['_id']
+                document.clear()
+                document.update(update, _id=_id)
+                continue
+            for operator, fields in update.iteritems():
+                for path, value in fields.iteritems():
+                    keys = path.split('.')
+                    node = document
+                    for key in keys[:-1]:
+                        node = node.setdefault(key, {})
+                    if operator == '$set':
+                        node[keys[-1]] = value
+                    elif operator == '$unset':
+                        node.pop(keys[-1], None)
+                    elif operator == '$inc':
+                        node[keys[-1]] = node.get(keys[-1], 0) + value
+
+    def initialize_ordered_bulk_op(self):
+        return MemoryBulk(self)
+
+    def remove(self, spec=None):
+        for document in self._match(spec or {}):
+            del self.documents[document['_id']]
+
+
+class MemoryBulk(object):
+    def __init__(self, collection):
+        self.collection = collection
+        self.operations = []
+
+    def find(self, spec):
+        self.operations.append([spec, None, False])
+        return self
+
+    def upsert(self):
+        self.operations[-1][2] = True
+        return self
+
+    def update_one(self, update):
+        self.operations[-1][1] = update
+
+    def execute(self):
+        self.collection.bulk_writes += 1
+        for spec, update, upsert in self.operations:
+            self.collection.update(spec, update, upsert=upsert)
+        return {'nModified': len(self.operations)}
+
+
+class MemoryDataProvider(DataProvider):
+    collections = {}
+
+    def _get_collection(self, host, port, db, collection):
+        return self.collections.setdefault((db, collection), MemoryCollection())
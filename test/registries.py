@@ -0,0 +1,13 @@
+"""Helpers for tests, which change global registries.
+"""
+
+
+def restore_registry(test, registry):
+    """Restores contents of global registry, when the test is done.
+    """
+    saved = dict(registry)
+
+    def restore():
+        registry.clear()
+        registry.update(saved)
+    test.addCleanup(restore)
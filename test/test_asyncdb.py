@@ -0,0 +1,90 @@
+from cherrycommon.asyncdb import ThreadPool, AsyncDataProvider
+from cherrycommon.db import DataProvider
+from cherrycommon.dictutils import decode_data, encode_data, JSON
+from cherrycommon.handlers import AsyncCollectionCRUD
+from tornado.gen import sleep as gen_sleep
+from tornado.testing import AsyncTestCase, AsyncHTTPTestCase, gen_test
+from tornado.web import Application
+from memorydb import MemoryDataProvider
+import unittest
+
+
+class MemoryAsyncDataProvider(AsyncDataProvider):
+    data_provider_class = MemoryDataProvider
+
+
+class AsyncDataProviderTest(AsyncTestCase):
+    def setUp(self):
+        super(AsyncDataProviderTest, self).setUp()
+        MemoryDataProvider.collections.clear()
+        self.pool = ThreadPool(2)
+        self.provider = MemoryAsyncDataProvider('cherry_common_unittest', 'documents', use_cache=True, pool=self.pool)
+        self.collection = self.provider.data_provider.collection
+        self.collection.insert([{'_id': str(i), 'value': i} for i in range(3)])
+
+    def tearDown(self):
+        self.pool.shutdown()
+        DataProvider.drop_cached('cherry_common_unittest', 'documents')
+        super(AsyncDataProviderTest, self).tearDown()
+
+    @gen_test
+    def test_crud(self):
+        document = yield self.provider.get('1')
+        self.assertEqual(document['value'], 1)
+        documents = yield self.provider.get_many(['2', '3', '0'])
+        self.assertEqual([document and document['value'] for document in documents], [2, None, 0])
+        self.assertEqual(len((yield self.provider.find())), 3)
+
+        yield self.provider.save({'_id': '3', 'value': 3})
+        yield self.provider.update('1', {'$set': {'value': 4}})
+        self.assertEqual((yield self.provider.get('1'))['value'], 4)
+        yield self.provider.remove('0')
+        self.assertEqual(sorted((yield self.provider.ids())), ['1', '2', '3'])
+
+        with self.assertRaises(TypeError):
+            yield self.provider.update(1, {'$set': {}})
+
+    @gen_test
+    def test_cached(self):
+        document = yield self.provider.get('1')
+        self.assertTrue(self.provider.get('1').done())
+        self.assertIs((yield self.provider.get('1')), document)
+        self.assertFalse(self.provider.get('1', force_reload=True).done())
+
+    @gen_test
+    def test_not_blocking(self):
+        self.collection.delay = 0.2
+        futures = [self.provider.find() for _ in range(4)]
+        ticks = 0
+        while not all(future.done() for future in futures):
+            yield gen_sleep(0.01)
+            ticks += 1
+        self.assertGreater(ticks, 10)
+        self.assertEqual(len(self.pool._threads), 2)
+
+
+class AsyncCollectionCRUDTest(AsyncHTTPTestCase):
+    def get_app(self):
+        MemoryDataProvider.collections.clear()
+
+        class CRUD(AsyncCollectionCRUD):
+            data_provider_class = MemoryAsyncDataProvider
+
+        options = {'db': 'cherry_common_unittest', 'collection': 'documents'}
+        return Application([('/documents', CRUD, options), ('/documents/(?P<id>.+)', CRUD, options)])
+
+    def test_crud(self):
+        body = encode_data({'_id': '1', 'value': 1}, JSON)
+        self.assertEqual(self.fetch('/documents', method='POST', body=body).code, 200)
+        self.fetch('/documents/2', method='PUT', body=encode_data({'value': 2}, JSON))
+        documents = decode_data(self.fetch('/documents').body, JSON)
+        self.assertEqual(sorted(document['value'] for document in documents), [1, 2])
+        self.assertEqual(sorted(decode_data(self.fetch('/documents?keys=1').body, JSON)), ['1', '2'])
+
+        self.fetch('/documents/1', method='DELETE')
+        self.assertEqual(decode_data(self.fetch('/documents?ids=1&ids=2').body, JSON),
+                         [{'_id': '2', 'value': 2}])
+
+
+if __name__ == '__main__':
+    unittest.main()
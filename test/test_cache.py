@@ -0,0 +1,72 @@
+from threading import Thread
+from cherrycommon.cache import LRUCache
+import time
+import unittest
+
+
+class LRUCacheTest(unittest.TestCase):
+    def test_entries(self):
+        cache = LRUCache(max_entries=2)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(cache['a'], 1)
+        cache['c'] = 3
+        self.assertNotIn('b', cache)
+        self.assertEqual(sorted(cache), ['a', 'c'])
+        self.assertRaises(KeyError, cache.__getitem__, 'b')
+        self.assertEqual(cache.get_stats(), {'hits': 1, 'misses': 1, 'evictions': 1, 'expirations': 0,
+                                             'entries': 2, 'size': 0})
+
+        self.assertEqual(cache.pop('a'), 1)
+        self.assertIsNone(cache.pop('a', None))
+        del cache['c']
+        self.assertEqual(len(cache), 0)
+
+    def test_size(self):
+        self.assertRaises(ValueError, LRUCache, max_size=10)
+        cache = LRUCache(max_size=10, size_of=len)
+        cache['a'] = 'x' * 4
+        cache['b'] = 'x' * 4
+        cache['a'] = 'x' * 7
+        self.assertEqual(sorted(cache), ['a'])
+        self.assertEqual(cache.size, 7)
+        cache['c'] = 'x' * 20
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.size, 0)
+
+    def test_ttl(self):
+        cache = LRUCache(ttl=0.05)
+        cache['a'] = 1
+        self.assertEqual(cache['a'], 1)
+        time.sleep(0.06)
+        self.assertNotIn('a', cache)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.expirations, 1)
+        self.assertEqual(len(cache), 0)
+
+    def test_threads(self):
+        cache = LRUCache(max_entries=50)
+
+        def _worker(offset):
+            for i in xrange(5000):
+                key = (i + offset) % 100
+                cache[key] = i
+                cache.get((key * 7) % 100)
+                cache.pop(key + 1, None)
+
+        threads = [Thread(target=_worker, args=(offset,)) for offset in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLessEqual(len(cache), 50)
+        entries = []
+        entry = cache._root[1]
+        while entry is not cache._root:
+            entries.append(entry[2])
+            entry = entry[1]
+        self.assertEqual(sorted(entries), sorted(cache))
+
+
+if __name__ == '__main__':
+    unittest.main()
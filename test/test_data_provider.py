@@ -36,6 +36,32 @@ class TestDataProvider(unittest.TestCase):
         provider.update('1', {'$set': {'value': 1}})
         self.assertEqual(provider['1']['value'], 1)
 
+    def test_cache(self):
+        cache = DataProvider.configure_cache('cherry_common_unittest', 'documents', max_entries=2)
+        provider = DataProvider('cherry_common_unittest', 'documents', use_cache=True)
+        for _id in ('1', '2', '3', '3'):
+            self.assertEqual(provider.get(_id, include_fields=['_id'])['value'], int(_id))
+        self.assertEqual(cache.get_stats()['evictions'], 1)
+        self.assertEqual(cache.hits, 1)
+
+        provider.update('3', {'$set': {'value': 4}})
+        self.assertEqual(provider['3']['value'], 4)
+        self.provider.update('3', {'$set': {'value': 3}})
+        self.assertEqual(provider['3']['value'], 4)
+        self.assertEqual(provider.get('3', force_reload=True)['value'], 3)
+
+    def test_get_many(self):
+        self.assertEqual([document and document['value'] for document in self.provider.get_many(['3', '4', '1'])],
+                         [3, None, 1])
+
+        cache = DataProvider.configure_cache('cherry_common_unittest', 'documents')
+        provider = DataProvider('cherry_common_unittest', 'documents', use_cache=True)
+        provider.get_many_chunk_size = 2
+        documents = provider.get_many(['1', '2', '1', '3', '4'])
+        self.assertEqual([document and document['_id'] for document in documents], ['1', '2', '1', '3', None])
+        self.assertEqual(len(cache), 3)
+        self.assertIs(provider.get_many(['2'])[0], documents[1])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,52 @@
+from copy import deepcopy
+from cherrycommon.dictutils import diff, merge, Diffed, DictView, PersistentDict
+import unittest
+
+
+class DiffTest(unittest.TestCase):
+    def setUp(self):
+        self.old = {
+            'gold': 100,
+            'name': 'player',
+            'stats': {'xp': 10, 'level': 1, 'skills': {'sword': 1}},
+            'items': [1, 2, 3],
+            'removed': {'flat': 1}
+        }
+        self.new = deepcopy(self.old)
+        self.new['gold'] = 150
+        self.new['stats']['level'] = 2
+        self.new['items'].append(4)
+        self.new['added'] = {'flat': 1}
+        del self.new['removed']
+
+    def test_diff(self):
+        result = diff(self.old, self.new)
+        self.assertEqual(result, {
+            'gold': 150,
+            'stats': {'level': 2},
+            'items': [1, 2, 3, 4],
+            'added': {'flat': 1},
+            'removed': None
+        })
+        self.assertEqual(merge(deepcopy(self.old), result), self.new)
+        self.assertEqual(Diffed(self.old, [result]).dump(), self.new)
+        self.assertEqual(diff(self.old, deepcopy(self.old)), {})
+
+    def test_types(self):
+        result = diff({'value': 1, 'string': 'a', 'nested': 1}, {'value': 1.0, 'string': u'a', 'nested': {'flat': 1}})
+        self.assertEqual(result, {'nested': {'flat': 1}})
+
+    def test_empty(self):
+        result = diff({'nested': {'flat': 1}, 'scalar': 1}, {'nested': {}, 'scalar': {}, 'added': {'empty': {}}})
+        self.assertEqual(result, {'nested': {'flat': None}, 'scalar': None})
+
+    def test_views(self):
+        old = PersistentDict(self.old)
+        new = old.merge({'stats': {'level': 2}})
+        self.assertEqual(diff(old, new), {'stats': {'level': 2}})
+        result = diff(DictView(self.old), DictView(self.new))
+        self.assertEqual(result, diff(self.old, self.new))
+        self.assertIsInstance(result['added'], dict)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,4 @@
-from cherrycommon.dictutils import Diffed, DictView, ListView, dump_value
+from cherrycommon.dictutils import Diffed, DictView, ListView, Increment, ListItems, dump_value
 import unittest
 
 
@@ -186,6 +186,80 @@ class DiffedCase(unittest.TestCase):
         self.assertNotIn('flat', nested)
         self.assertNotIn('dict', nested)
 
+    def test_index(self):
+        diffed = Diffed({'flat': 0, 'deleted': 0, 'nested': {'flat': 0}})
+        self.assertEqual(diffed['flat'], 0)
+        diffs = [{'flat': i} for i in range(1, 40)]
+        diffed.add_diff(*diffs)
+        self.assertEqual(diffed['flat'], 39)
+        self.assertEqual(diffed['nested']['flat'], 0)
+
+        diffed.remove_diff(diffs[-1])
+        self.assertEqual(diffed['flat'], 38)
+        diffed['deleted'] = None
+        self.assertNotIn('deleted', diffed)
+        self.assertRaises(KeyError, diffed.__getitem__, 'deleted')
+        self.assertIsNone(diffed.get_effective_item('deleted'))
+
+        # Deletion in an older diff hides the item the same way, as in the current one.
+        diffed.add_diff({})
+        self.assertRaises(KeyError, diffed.__getitem__, 'deleted')
+        self.assertEqual(diffed.get('deleted', 1), 1)
+        self.assertEqual(diffed.setdefault('deleted', 2), 2)
+
+        diffed.add_diff(DictView({'view': 1}))
+        self.assertEqual(diffed['flat'], 38)
+        diffed.add_diff({'flat': 40})
+        self.assertEqual(diffed['flat'], 40)
+        self.assertEqual(diffed['view'], 1)
+        self.assertNotIn('nested', diffed)
+
+        diffed.add_diff(None)
+        self.assertRaises(LookupError, diffed.__contains__, 'flat')
+        diffed.add_diff({'flat': 41})
+        self.assertEqual(diffed['flat'], 41)
+        self.assertNotIn('view', diffed)
+
+    def test_keys(self):
+        diffed = Diffed({'flat': 1, 'deleted': 1, 'nested': {'flat': 1}})
+        self.assertEqual(len(diffed), 3)
+        diff = {'deleted': None, 'new': 1}
+        diffed.add_diff(diff)
+        self.assertEqual(sorted(diffed), ['flat', 'nested', 'new'])
+        self.assertEqual(sorted(diffed.effective_keys()), ['deleted', 'flat', 'nested', 'new'])
+
+        del diffed['flat']
+        diffed['deleted'] = 2
+        self.assertEqual(sorted(diffed.keys()), ['deleted', 'nested', 'new'])
+
+        diffed.remove_diff(diff)
+        self.assertEqual(sorted(diffed.keys()), ['deleted', 'flat', 'nested'])
+
+        diffed.add_diff({'flat': None, 'new': 1})
+        diffed.flatten()
+        self.assertEqual(sorted(diffed.keys()), ['deleted', 'nested', 'new'])
+        self.assertEqual(len(diffed), 3)
+
+    def test_child_cache(self):
+        diffed = Diffed({'inventory': {'items': {'sword': 1}}}, {})
+        inventory = diffed['inventory']
+        self.assertIs(diffed['inventory'], inventory)
+        self.assertIs(inventory['items'], diffed['inventory']['items'])
+
+        inventory['items']['shield'] = 1
+        self.assertEqual(diffed['inventory']['items']['shield'], 1)
+
+        diffed.add_diff({'inventory': {'items': {'sword': 2}}})
+        self.assertIsNot(diffed['inventory'], inventory)
+        self.assertEqual(diffed['inventory']['items']['sword'], 2)
+        self.assertEqual(diffed['inventory']['items']['shield'], 1)
+
+        inventory = diffed['inventory']
+        diffed['inventory'] = {'items': {'sword': 3}}
+        self.assertIsNot(diffed['inventory'], inventory)
+        self.assertEqual(diffed['inventory']['items']['sword'], 3)
+        del diffed['inventory']
+        self.assertNotIn('inventory', diffed)
 
     def test_dump(self):
         data = {
@@ -214,6 +288,151 @@ class DiffedCase(unittest.TestCase):
         self.assertNotIn('deleted', dump)
         self.assertNotIn('deleted', dump['dict'])
 
+    def test_incr(self):
+        diffed = Diffed({'gold': 10, 'stats': {'xp': 1}}, [{}])
+        self.assertEqual(diffed.incr('gold', 5), 15)
+        diffed.add_diff({})
+        self.assertEqual(diffed.incr('gold', 2), 17)
+        self.assertEqual(diffed.incr('gems'), 1)
+        self.assertEqual(diffed['stats'].incr('xp', 9), 10)
+        self.assertEqual(diffed.diffs, [{'gold': Increment(5)}, {'gold': Increment(2), 'gems': Increment(1),
+                                                                 'stats': {'xp': Increment(9)}}])
+        self.assertEqual(diffed.dump(), {'gold': 17, 'gems': 1, 'stats': {'xp': 10}})
+
+        diffed['gold'] = 1
+        self.assertEqual(diffed.incr('gold', 1.5), 2.5)
+        del diffed['gems']
+        self.assertEqual(diffed.incr('gems', 3), 3)
+        self.assertRaises(TypeError, diffed.incr, 'stats', 1)
+        self.assertRaises(TypeError, diffed.incr, 'gold', '1')
+
+        diffed.flatten()
+        self.assertEqual(diffed.data, {'gold': 2.5, 'gems': 3, 'stats': {'xp': 10}})
+
+    def test_incr_not_numeric(self):
+        diffed = Diffed({'name': 'bob'}, [{}, {}])
+        self.assertRaises(TypeError, diffed.incr, 'name')
+        diffed.diffs[0]['title'] = 'hero'
+        diffed.reindex()
+        self.assertRaises(TypeError, diffed.incr, 'title')
+        self.assertEqual(diffed.dump(), {'name': 'bob', 'title': 'hero'})
+        self.assertEqual(diffed.dump_diff(), {})
+
+    def test_set_list_item(self):
+        data = {'items': ['a', 'b'], 'name': 'player'}
+        diffed = Diffed(data, [{}, {}])
+        self.assertEqual(diffed.set_list_item('items', 0, 'x').dump(), ['x', 'b'])
+        diffed.add_diff({})
+        self.assertEqual(diffed.set_list_item('items', 3, 'y').dump(), ['x', 'b', None, 'y'])
+        self.assertEqual(diffed['items'].dump(), ['x', 'b', None, 'y'])
+        self.assertEqual(sorted(diffed.keys()), ['items', 'name'])
+        self.assertEqual(diffed.dump(), {'items': ['x', 'b', None, 'y'], 'name': 'player'})
+        self.assertEqual(diffed.diffs[-1], {'items': ListItems({3: 'y'})})
+        self.assertRaises(TypeError, diffed.set_list_item, 'name', 0, 'x')
+        self.assertRaises(TypeError, diffed.set_list_item, 'missing', 0, 'x')
+
+        diffed.compact()
+        self.assertEqual(diffed['items'].dump(), ['x', 'b', None, 'y'])
+        diffed.flatten()
+        self.assertEqual(diffed.data['items'], ['x', 'b', None, 'y'])
+
+    def test_compact(self):
+        data = {'gold': 10, 'stats': {'xp': 1, 'level': 1}, 'name': 'player'}
+        pinned = {'gold': 100}
+        diffed = Diffed(data, [{}], max_depth=4)
+        diffed.pin_diff(pinned)
+        diffed.add_diff({'gold': Increment(5), 'stats': {'xp': 2}}, {'name': None}, pinned)
+        self.assertEqual(diffed.compactions, 0)
+        diffed.add_diff({'stats': None}, {'stats': {'level': 2}}, {})
+        self.assertEqual(diffed.compactions, 1)
+        self.assertEqual(diffed.squashed_diffs, 5)
+        self.assertEqual(len(diffed.diffs), 4)
+        self.assertIs(diffed.diffs[1], pinned)
+        self.assertEqual(diffed.dump(), {'gold': 100, 'stats': {'level': 2}})
+        self.assertEqual(diffed.data, {'gold': 10, 'stats': {'xp': 1, 'level': 1}, 'name': 'player'})
+
+        diffed.remove_diff(pinned)
+        self.assertEqual(diffed.dump(), {'gold': 15, 'stats': {'level': 2}})
+        diffed['stats']['xp'] = 3
+        self.assertEqual(diffed['stats'].dump(), {'level': 2, 'xp': 3})
+
+    def test_snapshot(self):
+        data = {'gold': 10, 'stats': {'xp': 1}}
+        rollback = {'gold': 20}
+        diffed = Diffed(data, [rollback])
+        snapshot = diffed.snapshot()
+        expected = {'gold': 20, 'stats': {'xp': 1}}
+        self.assertEqual(snapshot.dump(), expected)
+
+        diffed['gold'] = 30
+        diffed['stats']['xp'] = 2
+        diffed.incr('gems')
+        self.assertEqual(snapshot.dump(), expected)
+        self.assertEqual(snapshot['stats']['xp'], 1)
+        self.assertRaises(TypeError, snapshot.__setitem__, 'gold', 1)
+        self.assertRaises(TypeError, snapshot['stats'].__setitem__, 'xp', 1)
+        self.assertRaises(TypeError, snapshot.add_diff, {})
+
+        diffed.add_diff({'gold': 40})
+        second_snapshot = diffed.snapshot()
+        diffed.remove_diff(diffed.diffs[-1])
+        diffed['gold'] = 50
+        self.assertEqual(second_snapshot['gold'], 40)
+        diffed.flatten()
+        self.assertEqual(diffed.dump(), {'gold': 50, 'stats': {'xp': 2}, 'gems': 1})
+        self.assertEqual(data, {'gold': 10, 'stats': {'xp': 1}})
+        self.assertEqual(snapshot.dump(), expected)
+        self.assertEqual(second_snapshot.dump(), {'gold': 40, 'stats': {'xp': 2}, 'gems': 1})
+
+        rollback = {'gold': 20}
+        diffed = Diffed(data, [rollback])
+        diffed.add_diff({})
+        snapshot = diffed.snapshot()
+        diffed.remove_diff(diffed.diffs[-1])
+        diffed['gold'] = 60
+        diffed.remove_diff(rollback)
+        self.assertEqual(diffed.diffs, [])
+        self.assertEqual(snapshot['gold'], 20)
+
+    def test_snapshot_child(self):
+        diffed = Diffed({'stats': {'xp': 1}}, [{}])
+        snapshot = diffed.snapshot()
+        diffed['stats']['xp'] = 2
+        diffed['stats'].flatten()
+        self.assertEqual(diffed['stats']['xp'], 2)
+        self.assertEqual(snapshot['stats']['xp'], 1)
+
+        diffed = Diffed({'stats': {'xp': 1}}, [{'stats': {'xp': 2}}, {'stats': {'xp': 3}}])
+        stats = diffed['stats']
+        snapshot = diffed.snapshot()
+        stats.remove_diff(stats.diffs[-1])
+        stats['xp'] = 99
+        self.assertEqual(stats['xp'], 99)
+        self.assertEqual(snapshot['stats']['xp'], 3)
+        self.assertEqual(snapshot.diffs[0], {'stats': {'xp': 2}})
+
+    def test_snapshot_aliases(self):
+        first, second = {'gold': 1}, {'gold': 2}
+        diffed = Diffed({}, [first, second])
+        diffed.snapshot()
+        diffed.remove_diff(second)
+        self.assertEqual(len(diffed._aliases), 1)
+        diffed.flatten()
+        self.assertEqual(diffed._aliases, {})
+
+        diffed = Diffed({}, [first, second])
+        diffed.snapshot()
+        diffed.remove_diff(second)
+        diffed.remove_diff(diffed.diffs[-1])
+        self.assertEqual(diffed._aliases, {})
+
+    def test_compact_size(self):
+        diffed = Diffed({}, [{}], max_size=4)
+        for i in range(10):
+            diffed.add_diff({'counter': Increment(1), 'last': i})
+        self.assertLessEqual(len(diffed.diffs), 3)
+        self.assertEqual(diffed.dump(), {'counter': 10, 'last': 9})
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,6 +1,18 @@
-from cherrycommon.dictutils import encode_data, decode_data, AMF, JSON, XJSON, YAML
+from cherrycommon.dictutils import encode_data, decode_data, get_content_type, register_data_format, \
+    check_data_format, DictView, Diffed, PersistentDict, Increment, AMF, JSON, XJSON, YAML, \
+    MSGPACK, content_types, encode_json, _supported_data_formats
+from cherrycommon import _xjson, _amf
+from cherrycommon.db import Proxy
+from collections import OrderedDict, defaultdict, namedtuple
+from registries import restore_registry
 import unittest
 
+Point = namedtuple('Point', 'x y')
+
+
+class User(Proxy):
+    exclude_fields = ('password',)
+
 
 class EncoderTest(unittest.TestCase):
     src = {
@@ -21,6 +33,26 @@ class EncoderTest(unittest.TestCase):
         re = decode_data(encode_data(self.src, AMF), AMF)
         self._is_match(re)
 
+    def test_amf_keys(self):
+        src = {'nested': {1: 'int', None: 'none', '': 'empty', 'set': {1}}, 'view': DictView({'list': (1, 2)})}
+        self.assertIs(_amf._plain_value(self.src), self.src)
+        re = decode_data(encode_data(src, AMF), AMF)
+        self.assertEqual(re, {'nested': {'1': 'int', 'None': 'none', 'set': [1]}, 'view': {'list': [1, 2]}})
+        self.assertEqual(src['nested'][1], 'int')
+
+        src = OrderedDict([(1, 'int'), ('', 'empty'), ('nested', defaultdict(list, {None: [1]}))])
+        re = decode_data(encode_data(src, AMF), AMF)
+        self.assertEqual(re, {'1': 'int', 'nested': {'None': [1]}})
+
+    def test_amf_context(self):
+        encoder = _amf.AMFContext()
+        decoder = _amf.AMFContext()
+        first = encoder.dumps(self.src)
+        second = encoder.dumps(self.src)
+        self.assertLess(len(second), len(first))
+        self._is_match(decoder.loads(first))
+        self._is_match(decoder.loads(second))
+
     def test_json(self):
         re = decode_data(encode_data(self.src, JSON), JSON)
         self._is_match(re)
@@ -29,6 +61,65 @@ class EncoderTest(unittest.TestCase):
         re = decode_data(encode_data(self.src, XJSON), XJSON)
         self._is_match(re)
 
+    def test_msgpack(self):
+        self._is_match(decode_data(encode_data(self.src, MSGPACK), MSGPACK))
+        view = DictView(dict(self.src, long=2 ** 40, string='string'))
+        re = decode_data(encode_data({'view': view, 'list': view['nested']['list']}, MSGPACK), MSGPACK)
+        self._is_match(re['view'])
+        self.assertEqual(re['view']['long'], 2 ** 40)
+        self.assertIsInstance(re['view']['string'], unicode)
+        self.assertEqual(re['list'], [1, 2])
+        self.assertEqual(get_content_type(MSGPACK), 'application/x-msgpack')
+
+    def test_xjson_dictionary(self):
+        documents = [{'_id': 'player_{}'.format(i), 'stats': {'level': i, 'xp': i * 100}} for i in range(10)]
+        dictionary = _xjson.build_dictionary(documents)
+        restore_registry(self, _xjson._dictionaries)
+        self.assertIn('"stats": {', dictionary)
+        plain = encode_data(documents[0], XJSON)
+        _xjson.register_dictionary(200, dictionary, default=True)
+        try:
+            encoded = encode_data(documents[0], XJSON)
+            self.assertLess(len(encoded), len(plain))
+            self.assertEqual(decode_data(encoded, XJSON), documents[0])
+            self.assertEqual(decode_data(plain, XJSON), documents[0])
+        finally:
+            _xjson.set_default_dictionary()
+        self.assertEqual(decode_data(encoded, XJSON), documents[0])
+        self.assertRaises(ValueError, decode_data, encoded.replace(chr(200), chr(201), 1), XJSON)
+
+    def test_json_views(self):
+        self._is_match(decode_data(encode_data(DictView(self.src))))
+        self._is_match(decode_data(encode_data(PersistentDict(self.src))))
+        self.assertEqual(decode_data(encode_data({'set': {1}})), {'set': [1]})
+        self.assertRaises(TypeError, encode_data, {'object': object()})
+
+    def test_dump_overridden(self):
+        user = User(data={'_id': 'user', 'password': 'secret'})
+        for data_format in (JSON, MSGPACK, AMF):
+            self.assertEqual(decode_data(encode_data({'user': user}, data_format), data_format),
+                             {'user': {'_id': 'user'}})
+
+    def test_json_diffed(self):
+        diffed = Diffed(self.src, [{'nested': {'plain': 2}, 'list': None}, {'plain': Increment(2)}])
+        self.assertEqual(decode_data(encode_data(diffed)), diffed.dump())
+        self.assertEqual(decode_data(encode_data({'diffed': diffed.snapshot()}))['diffed'], diffed.dump())
+        self.assertEqual(diffed.diffs[-1], {'plain': Increment(2)})
+
+    def test_register(self):
+        restore_registry(self, _supported_data_formats)
+        restore_registry(self, content_types)
+        register_data_format('test', repr, eval, 'text/x-test')
+        self.assertEqual(get_content_type('test'), 'text/x-test')
+        self.assertEqual(decode_data(encode_data(self.src, 'test'), 'test'), self.src)
+        self.assertEqual(check_data_format(JSON).content_type, 'application/json')
+        self.assertRaises(NotImplementedError, check_data_format, 'unknown')
+        self.assertEqual(content_types[YAML], 'application/yaml')
+        self.assertEqual(content_types[AMF], 'application/x-amf')
+
+    def test_json_options(self):
+        self.assertEqual(encode_json({'point': Point(1, 2)}), '{"point": [1, 2]}')
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
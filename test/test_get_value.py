@@ -1,4 +1,7 @@
-from cherrycommon.dictutils import get_value, set_value
+from cherrycommon.dictutils import (get_value, set_value, compile_field, CompiledField, project, dump_value,
+                                    flatten_value, register_dump_type, register_flatten_type, _dumpers, _flatteners)
+from datetime import date
+from registries import restore_registry
 import unittest
 
 
@@ -65,6 +68,45 @@ class TestGetValue(unittest.TestCase):
         self.assertIsInstance(get_value(document, 'str_round_field', flatten=True), int)
         self.assertIsInstance(get_value(document, 'str_float_field', flatten=True), float)
         self.assertIsInstance(get_value(document, 'str_field', flatten=True), unicode)
+        self.assertEqual(flatten_value([' 2 ', 'name', float('inf'), '1e3']), [2, 'name', float('inf'), 1000])
+
+    def test_register_type(self):
+        restore_registry(self, _dumpers)
+        restore_registry(self, _flatteners)
+        register_dump_type(date, lambda value: value.isoformat())
+        register_flatten_type(date, lambda value: value.toordinal())
+        document = {'date': date(2013, 1, 1), 'nested': [date(2013, 1, 2)]}
+        self.assertEqual(dump_value(document), {'date': u'2013-01-01', 'nested': [u'2013-01-02']})
+        self.assertEqual(flatten_value(document), {'date': 734869, 'nested': [734870]})
+
+    def test_compiled_field(self):
+        field = compile_field('nested_list[2].list_field')
+        self.assertIsInstance(field, CompiledField)
+        self.assertEqual(field.steps, (('nested_list', 2), ('list_field', None)))
+        self.assertIs(compile_field('nested_list[2].list_field'), field)
+        self.assertIs(compile_field(field), field)
+        self.assertRaises(ValueError, compile_field, 'nested_list[a]')
+        self.assertRaises(ValueError, compile_field, 'nested..field')
+
+        document = {'nested_list': [1, 'str', {'list_field': 1}]}
+        self.assertEqual(get_value(document, field), 1)
+        set_value(document, field, 2)
+        self.assertEqual(field.get(document), 2)
+        self.assertEqual(get_value(document, 'nested_list[5].list_field', None), None)
+        self.assertRaises(KeyError, get_value, document, 'missing_field')
+
+    def test_project(self):
+        documents = [
+            {'_id': 'a', 'stats': {'level': [1, 2]}, 'gold': '10'},
+            {'_id': 'b', 'stats': {'level': [3]}, 'gold': 20.0},
+            {'_id': 'c', 'stats': 'invalid', 'gold': 30},
+        ]
+        columns = project(iter(documents), ['_id', 'stats.level[1]', 'gold'], default=0)
+        self.assertEqual(list(columns['_id']), ['a', 'b', 'c'])
+        self.assertEqual(list(columns['stats.level[1]']), [2, 0, 0])
+        self.assertEqual(list(columns['gold']), [10, 20, 30])
+        self.assertIsInstance(columns['_id'], list)
+        self.assertEqual(project([], ['gold']), {'gold': []})
 
 
 if __name__ == '__main__':
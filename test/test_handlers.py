@@ -0,0 +1,90 @@
+from cherrycommon.dictutils import decode_data, encode_data, DictView, JSON, NDJSON, YAML
+from cherrycommon.handlers import CollectionDumper, DataHandler
+from tornado.testing import AsyncHTTPTestCase
+from tornado.web import Application
+import unittest
+
+DOCUMENTS = [{'_id': 'document_{}'.format(i), 'value': i, 'nested': {'list': [i]}} for i in range(100)]
+
+
+class MemoryDumper(CollectionDumper):
+    streamed = True
+    chunk_size = 256
+
+    def initialize(self, documents=(), data_format=JSON, streamed=True):
+        self.documents = documents
+        self.data_format = data_format
+        self.streamed = streamed
+
+    def query_documents(self, **kwargs):
+        return iter(self.documents)
+
+    def get_ids(self):
+        return [document['_id'] for document in self.documents]
+
+    def get_document(self, _id):
+        raise KeyError(_id)
+
+
+class EchoHandler(DataHandler):
+    data_format = JSON
+
+    def post(self):
+        self.respond({'data': self.get_request_data(), 'name': self.get_argument('name', None)})
+
+
+class CollectionDumperTest(AsyncHTTPTestCase):
+    def get_app(self):
+        views = map(DictView, DOCUMENTS)
+        return Application([
+            ('/json', MemoryDumper, {'documents': DOCUMENTS}),
+            ('/ndjson', MemoryDumper, {'documents': views, 'data_format': NDJSON}),
+            ('/yaml', MemoryDumper, {'documents': DOCUMENTS, 'data_format': YAML}),
+            ('/buffered', MemoryDumper, {'documents': DOCUMENTS, 'streamed': False}),
+            ('/broken', MemoryDumper, {'documents': DOCUMENTS + [object()]}),
+            ('/broken_first', MemoryDumper, {'documents': [object()] + DOCUMENTS}),
+            ('/empty', MemoryDumper),
+            ('/echo', EchoHandler)
+        ])
+
+    def test_json(self):
+        response = self.fetch('/json')
+        self.assertEqual(response.headers['Content-Type'], 'application/json')
+        self.assertIsNone(response.headers.get('Content-Length'))
+        self.assertEqual(decode_data(response.body, JSON), DOCUMENTS)
+        self.assertEqual(decode_data(self.fetch('/empty').body), [])
+        self.assertEqual(len(decode_data(self.fetch('/json?keys=1').body)), 100)
+
+    def test_ndjson(self):
+        response = self.fetch('/ndjson')
+        self.assertEqual(response.headers['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(len(response.body.splitlines()), 100)
+        self.assertEqual(decode_data(response.body, NDJSON), DOCUMENTS)
+
+    def test_ndjson_single(self):
+        self.assertEqual(encode_data({'value': 1}, NDJSON), '{"value": 1}\n')
+        self.assertEqual(decode_data(encode_data(DOCUMENTS[:2], NDJSON), NDJSON), DOCUMENTS[:2])
+
+    def test_stream_error(self):
+        self.assertEqual(self.fetch('/broken_first').code, 500)
+        response = self.fetch('/broken')
+        self.assertNotEqual(response.code, 200)
+        self.assertIsNotNone(response.error)
+
+    def test_request_data(self):
+        def echo(body):
+            return decode_data(self.fetch('/echo?name=query', method='POST', body=body).body, JSON)
+        self.assertEqual(echo('[1, 2]'), {'data': [1, 2], 'name': 'query'})
+        self.assertEqual(echo('{"name": "body"}'), {'data': {'name': 'body'}, 'name': 'body'})
+        self.assertEqual(echo(''), {'data': {}, 'name': 'query'})
+
+    def test_not_streamed(self):
+        response = self.fetch('/yaml')
+        self.assertEqual(decode_data(response.body, YAML), DOCUMENTS)
+        response = self.fetch('/buffered')
+        self.assertIsNotNone(response.headers.get('Content-Length'))
+        self.assertEqual(decode_data(response.body, JSON), DOCUMENTS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+from shutil import rmtree
+from tempfile import mkdtemp
+from threading import Thread
+from bson import ObjectId
+import zmq
+from zmq.eventloop.ioloop import IOLoop
+from cherrycommon.db import DataProvider
+from cherrycommon.invalidation import CacheInvalidationBus, run_forwarder
+import unittest
+
+
+class CacheInvalidationTest(unittest.TestCase):
+    def setUp(self):
+        self.path = mkdtemp()
+        self.loop = IOLoop()
+        self.cache = DataProvider.configure_cache('cherry_common_unittest', 'players')
+        self.other_cache = DataProvider.configure_cache('cherry_common_unittest', 'configs')
+        self.buses = []
+
+    def tearDown(self):
+        for bus in self.buses:
+            bus.stop()
+        self.loop.close()
+        rmtree(self.path)
+
+    def _address(self, name):
+        return 'ipc://{}/{}'.format(self.path, name)
+
+    def _start(self, *args, **kwargs):
+        bus = CacheInvalidationBus(*args, loop=self.loop, **kwargs).start()
+        self.buses.append(bus)
+        return bus
+
+    def _publish_until_received(self, publisher, subscriber, *args):
+        # Subscriptions take a while to propagate, so invalidation is published until it's received.
+        received = subscriber.received
+
+        def _publish():
+            if subscriber.received > received:
+                self.loop.stop()
+            else:
+                publisher.invalidate(*args)
+                self.loop.call_later(0.01, _publish)
+
+        self.loop.add_callback(_publish)
+        self.loop.call_later(5, self.loop.stop)
+        self.loop.start()
+
+    def test_invalidation(self):
+        publisher = self._start(self._address('bus'), bind=True)
+        subscriber = self._start(subscribe_addresses=[self._address('bus')],
+                                 collections=[('cherry_common_unittest', 'players')])
+        self.assertIs(DataProvider.cache_invalidator, publisher)
+        _id = ObjectId()
+        self.cache[_id] = {'_id': _id}
+        self.cache['other'] = {'_id': 'other'}
+        self.other_cache['config'] = {'_id': 'config'}
+
+        self._publish_until_received(publisher, subscriber, 'cherry_common_unittest', 'players', _id)
+        self.assertNotIn(_id, self.cache)
+        self.assertIn('other', self.cache)
+
+        self._publish_until_received(publisher, subscriber, 'cherry_common_unittest', 'players')
+        self.assertEqual(len(self.cache), 0)
+        self.assertIn('config', self.other_cache)
+
+    def test_unicode_names(self):
+        cache = DataProvider.configure_cache(u'cherry_common_unittest', u'players_\xe9')
+        publisher = self._start(self._address('bus'), bind=True)
+        subscriber = self._start(subscribe_addresses=[self._address('bus')],
+                                 collections=[(u'cherry_common_unittest', u'players_\xe9')])
+        cache['player'] = {'_id': 'player'}
+        self._publish_until_received(publisher, subscriber, u'cherry_common_unittest', u'players_\xe9', 'player')
+        self.assertNotIn('player', cache)
+
+    def test_forwarder(self):
+        context = zmq.Context()
+        forwarder = Thread(target=run_forwarder, args=(self._address('front'), self._address('back'), context))
+        forwarder.start()
+        try:
+            publisher = self._start(self._address('front'), [self._address('back')])
+            subscriber = self._start(self._address('front'), [self._address('back')])
+            self.cache['player'] = {'_id': 'player'}
+            self._publish_until_received(publisher, subscriber, 'cherry_common_unittest', 'players', 'player')
+            self.assertNotIn('player', self.cache)
+            self.assertEqual(publisher.received, 0)
+        finally:
+            context.term()
+            forwarder.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
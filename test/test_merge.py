@@ -1,4 +1,4 @@
-from cherrycommon.dictutils import merge, DictView
+from cherrycommon.dictutils import merge, DictView, PersistentDict, ListItems
 import unittest
 
 
@@ -72,5 +72,39 @@ class MergeTest(unittest.TestCase):
         merged = merge(source, {'nested': None}, keep_none=True)
         self.assertIn('nested', merged)
 
+    def test_shared(self):
+        nested = {'flat': 1, 'untouched': {'flat': 1}}
+        target = {'nested': nested}
+        source = {
+            'nested': {'flat': 2, 'deleted': None, 'empty': {'empty': {}}},
+            'list': [1, 2]
+        }
+
+        merged = merge(target, source, copy=False)
+        self.assertIs(merged, target)
+        self.assertEqual(merged['nested']['flat'], 2)
+        self.assertNotIn('empty', merged['nested'])
+        self.assertIs(merged['list'], source['list'])
+        self.assertIs(merged['nested']['untouched'], nested['untouched'])
+        self.assertEqual(nested['flat'], 1)
+        self.assertEqual(source['nested']['flat'], 2)
+
+    def test_persistent_dict(self):
+        nested = PersistentDict({'a': 1, 'b': 2})
+        merged = merge({'p': nested}, {'p': {'c': 3, 'a': None}})
+        self.assertEqual(merged['p'].dump(), {'b': 2, 'c': 3})
+        self.assertEqual(nested.dump(), {'a': 1, 'b': 2})
+        self.assertIs(merge({'p': nested}, {'p': {'empty': {}}})['p'], nested)
+
+    def test_list_items(self):
+        items = ['a', {'count': 1}]
+        merged = merge({'items': items}, {'items': ListItems({0: 'b', 1: {'count': 2}, 3: None}),
+                                          'missing': ListItems({1: 'd'})}, copy=False)
+        self.assertEqual(merged, {'items': ['b', {'count': 2}, None, None], 'missing': {'1': 'd'}})
+        self.assertEqual(items, ['a', {'count': 1}])
+        self.assertEqual(merge({}, {'slot[1]': 5}), {'slot[1]': 5})
+        self.assertRaises(TypeError, merge, {'items': 1}, {'items': ListItems({0: 'a'})})
+        self.assertRaises(TypeError, ListItems, {-1: 'a'})
+
 if __name__ == '__main__':
     unittest.main()
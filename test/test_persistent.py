@@ -0,0 +1,97 @@
+from cherrycommon.dictutils import PersistentDict, Diffed, DictView, ListItems, get_value
+import unittest
+
+
+class CollidingKey(object):
+    def __init__(self, name):
+        self.name = name
+
+    def __hash__(self):
+        return 1
+
+    def __eq__(self, other):
+        return isinstance(other, CollidingKey) and self.name == other.name
+
+
+class PersistentDictTest(unittest.TestCase):
+    def test_set_delete(self):
+        empty = PersistentDict()
+        first = empty.set('a', 1)
+        second = first.set('b', 2).delete('a')
+        self.assertEqual(len(empty), 0)
+        self.assertEqual(dict(first), {'a': 1})
+        self.assertEqual(dict(second), {'b': 2})
+        self.assertIs(second.delete('missing'), second)
+        self.assertIs(first.set('a', 1), first)
+
+    def test_many_keys(self):
+        data = dict((i, i * 2) for i in range(5000))
+        persistent = PersistentDict(data)
+        self.assertEqual(len(persistent), len(data))
+        self.assertEqual(dict(persistent.iteritems()), data)
+        smaller = persistent
+        for i in range(0, 5000, 2):
+            smaller = smaller.delete(i)
+        self.assertEqual(len(smaller), 2500)
+        self.assertNotIn(0, smaller)
+        self.assertEqual(persistent[0], 0)
+
+    def test_collisions(self):
+        a, b, c = CollidingKey('a'), CollidingKey('b'), CollidingKey('c')
+        persistent = PersistentDict().set(a, 1).set(b, 2).set(c, 3).set(1, 4)
+        self.assertEqual(len(persistent), 4)
+        self.assertEqual(persistent[b], 2)
+        persistent = persistent.delete(b)
+        self.assertNotIn(b, persistent)
+        self.assertEqual(persistent[c], 3)
+        self.assertEqual(persistent[1], 4)
+
+    def test_merge(self):
+        original = PersistentDict({'gold': 1, 'stats': {'xp': 1, 'level': 1}, 'untouched': {'flat': 1}})
+        merged = original.merge({'gold': None, 'stats': {'xp': 2}, 'empty': {}, 'view': DictView({'flat': 1})})
+        self.assertEqual(merged.dump(), {'stats': {'xp': 2, 'level': 1}, 'untouched': {'flat': 1}, 'view': {'flat': 1}})
+        self.assertEqual(original.dump(), {'gold': 1, 'stats': {'xp': 1, 'level': 1}, 'untouched': {'flat': 1}})
+        self.assertIs(merged['untouched'], original['untouched'])
+        self.assertEqual(get_value(merged, 'stats.xp'), 2)
+
+        self.assertEqual(PersistentDict({'items': [0, 0]}).merge({'items': ListItems({1: 1})})['items'], [0, 1])
+        self.assertEqual(original.merge({'items[1]': 1})['items[1]'], 1)
+
+    def test_diffed(self):
+        diffed = Diffed(PersistentDict({'gold': 1, 'stats': {'xp': 1}}), {})
+        snapshot = diffed.data
+        diffed['gold'] = 2
+        diffed['stats']['xp'] = 2
+        self.assertEqual(diffed['stats']['xp'], 2)
+        diffed.flatten()
+        self.assertIsInstance(diffed.data, PersistentDict)
+        self.assertEqual(diffed.dump(), {'gold': 2, 'stats': {'xp': 2}})
+        self.assertEqual(snapshot.dump(), {'gold': 1, 'stats': {'xp': 1}})
+
+    def test_diffed_child_flatten(self):
+        diffed = Diffed(PersistentDict({'stats': {'xp': 1, 'level': 1}}), [{}])
+        snapshot = diffed.data
+        stats = diffed['stats']
+        stats['xp'] = 2
+        stats.flatten()
+        self.assertEqual(diffed.data.dump(), {'stats': {'xp': 2, 'level': 1}})
+        self.assertEqual(snapshot.dump(), {'stats': {'xp': 1, 'level': 1}})
+
+    def test_diffed_persistent_diff(self):
+        diff = PersistentDict({'b': 2, 'stats': {'xp': 1}})
+        diffed = Diffed({'a': 1}, [diff])
+        diffed['c'] = 3
+        del diffed['a']
+        diffed['stats']['xp'] = 2
+        self.assertEqual(diffed.dump(), {'b': 2, 'c': 3, 'stats': {'xp': 2}})
+        self.assertEqual(diff.dump(), {'b': 2, 'stats': {'xp': 1}})
+        diffed.remove_diff(diff)
+        self.assertEqual(diffed.dump(), {'a': 1})
+
+    def test_merge_into_dict(self):
+        merged = PersistentDict({'gold': 1}).set('stats', {'xp': 1, 'level': 1}).merge({'stats': {'xp': 2}})
+        self.assertEqual(merged.dump(), {'gold': 1, 'stats': {'xp': 2, 'level': 1}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,4 @@
-from cherrycommon.dictutils import get_schema
+from cherrycommon.dictutils import get_schema, infer_schema
 import unittest
 
 
@@ -29,6 +29,35 @@ class SchemaTest(unittest.TestCase):
         self.assertIn('nested_dict.nested_field_1', nested_schema)
         self.assertNotIn('nested_dict.nested_field_1', top_level_schema)
 
+    def test_infer(self):
+        documents = iter([
+            {'plain_field': 1, 'nested_dict': {'nested_field': 'a'}, 'nested_list': [1]},
+            {'plain_field': 2.5, 'nested_dict': {'nested_field': None}},
+            {'plain_field': None, 'string_field': 'str'},
+            {'plain_field': 3, 'nested_dict': {'nested_field': 'b', 'deep': {'field': 1}}},
+        ])
+        schema = infer_schema(documents, nested_level=1)
+        self.assertEqual(schema.documents, 4)
+        self.assertEqual(schema.get_fields(), [
+            'nested_dict', 'nested_dict.deep', 'nested_dict.nested_field',
+            'nested_list', 'plain_field', 'string_field'
+        ])
+        self.assertNotIn('nested_dict', schema.get_fields(skip_nested=True))
+
+        plain_field = schema.fields['plain_field']
+        self.assertTrue(plain_field.is_number)
+        self.assertTrue(plain_field.nullable)
+        self.assertTrue(schema.fields['nested_list'].is_list)
+        self.assertFalse(schema.fields['nested_dict.nested_field'].is_number)
+        self.assertEqual(schema.presence('nested_dict'), 0.75)
+        self.assertEqual(schema.presence('missing_field'), 0)
+
+    def test_sample(self):
+        documents = ({'field_{}'.format(i % 10): i} for i in range(1000))
+        schema = infer_schema(documents, sample=100)
+        self.assertEqual(schema.documents, 100)
+        self.assertEqual(sum(stats.count for stats in schema.fields.itervalues()), 100)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,92 @@
+from cherrycommon.db import get_update, DiffedProxy
+from cherrycommon.dictutils import DictView, Increment, ListItems
+import unittest
+
+
+class UpdateTest(unittest.TestCase):
+    def test_update(self):
+        update = get_update({
+            'gold': 10,
+            'stats': {'level': 2, 'bonus': None, 'empty': {}},
+            'items': ListItems({1: 'sword'}),
+            'deleted': None
+        })
+        self.assertEqual(update, {
+            '$set': {'gold': 10, 'stats.level': 2, 'items.1': 'sword'},
+            '$unset': {'stats.bonus': 1, 'deleted': 1}
+        })
+        self.assertEqual(get_update(), {})
+        self.assertEqual(get_update({}, {'empty': {'empty': {}}}), {})
+
+    def test_chain(self):
+        update = get_update(
+            {'stats': {'level': 2, 'xp': 10}, 'profile': None, 'settings': DictView({'sound': 1, 'music': 1})},
+            {'stats': {'xp': None}, 'profile': {'name': 'player'}, 'settings': {'music': None}},
+            {'stats': {'level': 3}}
+        )
+        self.assertEqual(update, {
+            '$set': {'stats.level': 3, 'profile': {'name': 'player'}, 'settings': {'sound': 1}},
+            '$unset': {'stats.xp': 1}
+        })
+        self.assertEqual(get_update({'stats': {'xp': 1}}, {'stats': None}), {'$unset': {'stats': 1}})
+        self.assertRaises(ValueError, get_update, {'stats': 1}, None)
+
+    def test_increment(self):
+        update = get_update(
+            {'gold': Increment(5), 'gems': 1, 'stats': {'xp': Increment(1)}, 'deleted': None},
+            {'gold': Increment(-2), 'gems': Increment(2), 'stats': {'xp': Increment(1)}, 'deleted': Increment(1)}
+        )
+        self.assertEqual(update, {
+            '$inc': {'gold': 3, 'stats.xp': 2},
+            '$set': {'gems': 3, 'deleted': 1}
+        })
+        self.assertRaises(TypeError, get_update, {'stats': {'xp': 1}}, {'stats': Increment(1)})
+
+    def test_list_items(self):
+        self.assertEqual(get_update({'items': ['a', 'b']}, {'items': ListItems({1: 'x'})}),
+                         {'$set': {'items': ['a', 'x']}})
+        self.assertEqual(get_update({'items': ListItems({1: 'x'})}, {'items': ListItems({0: 'y'})}),
+                         {'$set': {'items.0': 'y', 'items.1': 'x'}})
+        self.assertEqual(get_update({'items': ListItems({1: 'x'}), 'other': ListItems({0: 'y'})}, {'items': None}),
+                         {'$set': {'other.0': 'y'}, '$unset': {'items': 1}})
+        self.assertEqual(get_update({'items': ListItems({1: 'x'})}, {'items': ['a']}), {'$set': {'items': ['a']}})
+        self.assertEqual(get_update({'items[1]': 'x'}), {'$set': {'items[1]': 'x'}})
+        self.assertRaises(TypeError, get_update, {'items': {'a': 1}}, {'items': ListItems({1: 'x'})})
+
+
+class DataProviderMock(object):
+    def __init__(self):
+        self.updates = []
+
+    def update(self, spec, update, **kwargs):
+        self.updates.append((spec, update))
+
+
+class Player(DiffedProxy):
+    _data_provider = DataProviderMock()
+
+
+class CommitTest(unittest.TestCase):
+    def test_commit(self):
+        player = Player(data={'_id': 'player', 'gold': 10, 'stats': {'level': 1}}, diffs=[{}])
+        player['gold'] = 20
+        player['stats']['level'] = 2
+        self.assertEqual(player.commit(), {'$set': {'gold': 20, 'stats.level': 2}})
+        self.assertEqual(Player._data_provider.updates, [('player', {'$set': {'gold': 20, 'stats.level': 2}})])
+        self.assertEqual(player.diffs, [{}])
+        self.assertEqual(player.dump(), {'_id': 'player', 'gold': 20, 'stats': {'level': 2}})
+        self.assertEqual(player.commit(), {})
+        self.assertEqual(len(Player._data_provider.updates), 1)
+
+    def test_commit_list_items(self):
+        player = Player(data={'_id': 'player', 'items': ['a', 'b']}, diffs=[{}])
+        self.assertEqual(player.set_list_item('items', 1, 'x').dump(), ['a', 'x'])
+        self.assertEqual(player['items'].dump(), ['a', 'x'])
+        self.assertEqual(sorted(player.keys()), ['_id', 'items'])
+        self.assertEqual(player.dump(), {'_id': 'player', 'items': ['a', 'x']})
+        self.assertEqual(player.commit(), {'$set': {'items.1': 'x'}})
+        self.assertEqual(player.dump(), {'_id': 'player', 'items': ['a', 'x']})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+from collections import Mapping, Sequence
+from cherrycommon.dictutils import DictView, ListView, MappingView
+import unittest
+
+
+class ViewsTest(unittest.TestCase):
+    def setUp(self):
+        self.data = {
+            'nested': {'flat': 1, 'list': [1, {'flat': 2}]},
+            'string': 'string'
+        }
+        self.view = DictView(self.data)
+
+    def test_types(self):
+        self.assertIsInstance(self.view, Mapping)
+        self.assertIsInstance(self.view['nested']['list'], Sequence)
+        self.assertIsInstance(self.view['string'], unicode)
+        self.assertFalse(hasattr(self.view, '__dict__'))
+        self.assertFalse(hasattr(ListView([]), '__dict__'))
+        self.assertEqual(MappingView(), {})
+
+    def test_cache(self):
+        nested = self.view['nested']
+        self.assertIs(self.view['nested'], nested)
+        self.assertIs(nested['list'][1], nested['list'][1])
+
+        self.data['nested'] = {'flat': 2}
+        self.assertIsNot(self.view['nested'], nested)
+        self.assertEqual(self.view['nested']['flat'], 2)
+
+    def test_slice(self):
+        items = DictView({'list': [1, 2, 3]})['list'][1:]
+        self.assertIsInstance(items, ListView)
+        self.assertEqual(list(items), [2, 3])
+        self.assertEqual(list(self.view['nested']['list'][:1]), [1])
+
+    def test_iteration(self):
+        self.assertEqual(sorted(self.view.iterkeys()), ['nested', 'string'])
+        values = dict(self.view.iteritems())
+        self.assertIs(values['nested'], self.view['nested'])
+        self.assertIn(u'string', list(self.view.itervalues()))
+        items = list(self.view['nested']['list'].itervalues())
+        self.assertIsInstance(items[1], DictView)
+        self.assertEqual(list(self.view['nested']['list']), [1, {'flat': 2}])
+
+    def test_dump(self):
+        dump = self.view.dump()
+        self.assertEqual(dump, self.data)
+        self.assertIsNot(dump['nested'], self.data['nested'])
+        self.assertEqual(self.view['nested']['list'].dump(), [1, {'flat': 2}])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+from cherrycommon.db import DataProvider
+from cherrycommon.process import IOLoopProcess
+from cherrycommon.writebehind import WriteBehindBuffer, merge_update
+from pymongo.errors import AutoReconnect, BulkWriteError
+from threading import Thread, Event
+from memorydb import MemoryDataProvider
+from tornado.gen import sleep
+from tornado.testing import AsyncTestCase, gen_test
+import unittest
+
+
+class MergeUpdateTest(unittest.TestCase):
+    def test_merge(self):
+        pending = {'$set': {'stats': {'level': 1}, 'name': 'a'}, '$inc': {'gold': 5}}
+        self.assertTrue(merge_update(pending, {'$inc': {'gold': 5}, '$unset': {'stats': 1}}))
+        self.assertEqual(pending, {'$set': {'name': 'a'}, '$unset': {'stats': 1}, '$inc': {'gold': 10}})
+
+        self.assertTrue(merge_update(pending, {'$set': {'gold': 1, 'stats': {}}}))
+        self.assertTrue(merge_update(pending, {'$inc': {'gold': 2}}))
+        self.assertEqual(pending, {'$set': {'name': 'a', 'gold': 3, 'stats': {}}})
+
+    def test_conflicts(self):
+        pending = {'$set': {'stats': {'level': 1}, 'name': 'a'}, '$unset': {'bonus': 1}}
+        self.assertFalse(merge_update(pending, {'$set': {'stats.level': 2}}))
+        self.assertFalse(merge_update(pending, {'$inc': {'name': 1}}))
+        self.assertFalse(merge_update(pending, {'$inc': {'bonus': 1}}))
+        self.assertEqual(pending, {'$set': {'stats': {'level': 1}, 'name': 'a'}, '$unset': {'bonus': 1}})
+
+        self.assertFalse(merge_update(pending, {'$set': {'bonus.value': 1}}))
+        self.assertTrue(merge_update(pending, {'$set': {'stats': {'level': 2}, 'bonus': 1}}))
+        self.assertEqual(pending, {'$set': {'stats': {'level': 2}, 'name': 'a', 'bonus': 1}})
+
+
+class WriteBehindTest(AsyncTestCase):
+    def setUp(self):
+        super(WriteBehindTest, self).setUp()
+        MemoryDataProvider.collections.clear()
+        self.provider = MemoryDataProvider('cherry_common_unittest', 'documents', use_cache=True)
+        self.collection = self.provider.collection
+        self.provider.insert([{'_id': str(i), 'value': i} for i in range(3)])
+        self.buffer = self.provider.write_behind = WriteBehindBuffer(self.provider, interval=0.05, max_pending=5,
+                                                                     loop=self.io_loop)
+
+    def tearDown(self):
+        DataProvider.drop_cached('cherry_common_unittest', 'documents')
+        super(WriteBehindTest, self).tearDown()
+
+    def test_coalesce(self):
+        self.assertEqual(self.provider.get('1')['value'], 1)
+        for _ in range(10):
+            self.provider.update('1', {'$inc': {'value': 1}})
+        self.provider.update('2', {'$set': {'stats': {'level': 1}}})
+        self.provider.update('2', {'$set': {'stats.level': 2}, '$unset': {'value': 1}})
+        self.provider.update('3', {'$set': {'value': 3}}, upsert=True)
+        self.assertEqual(self.provider.get('1')['value'], 1)
+        self.assertEqual(len(self.buffer), 4)
+
+        self.assertEqual(self.buffer.flush(), 4)
+        self.assertEqual(self.collection.bulk_writes, 1)
+        self.assertEqual(self.provider.get('1')['value'], 11)
+        self.assertEqual(self.provider.get('2'), {'_id': '2', 'stats': {'level': 2}})
+        self.assertEqual(self.provider.get('3')['value'], 3)
+        stats = self.buffer.get_stats()
+        self.assertEqual((stats['pending'], stats['updates'], stats['coalesced'], stats['writes']), (0, 13, 9, 4))
+
+    def test_write_order(self):
+        self.provider.update('1', {'$set': {'value': 2}})
+        self.provider.save({'_id': '1', 'value': 3})
+        self.assertEqual(self.provider.get('1')['value'], 3)
+        self.provider.update('1', {'$set': {'value': 4}}, multi=False)
+        self.assertEqual(self.collection.bulk_writes, 1)
+        self.assertEqual(self.provider.get('1')['value'], 4)
+
+    def test_replacement(self):
+        self.provider.update('1', {'$inc': {'value': 1}})
+        self.provider.update('2', {'value': 20})
+        self.assertEqual(self.collection.documents['2'], {'_id': '2', 'value': 20})
+        self.assertEqual(self.collection.documents['1']['value'], 2)
+        self.assertEqual(len(self.buffer), 0)
+        self.assertRaises(ValueError, self.buffer.update, '1', {'value': 1})
+
+    @gen_test
+    def test_periodic(self):
+        self.buffer.start()
+        self.provider.update('1', {'$set': {'value': 2}})
+        yield sleep(0.1)
+        self.assertEqual(self.collection.documents['1']['value'], 2)
+
+        self.buffer.interval = 10
+        self.buffer.stop()
+        self.buffer.start()
+        for i in range(5):
+            self.provider.update(str(i), {'$set': {'value': 0}})
+        self.assertEqual(len(self.buffer), 5)
+        yield sleep(0)
+        self.assertEqual(len(self.buffer), 0)
+        self.buffer.stop()
+
+    def test_retry(self):
+        def fail(updates):
+            raise AutoReconnect()
+        self.provider.update('1', {'$set': {'value': 2}})
+        self.provider.update('2', {'$inc': {'value': 2}})
+        self.provider.bulk_update = fail
+        self.assertEqual(self.buffer.flush(), 0)
+        del self.provider.bulk_update
+        self.provider.update('1', {'$inc': {'value': 2}})
+        self.assertEqual(len(self.buffer), 1)
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.collection.documents['1']['value'], 4)
+        self.assertEqual(self.collection.documents['2']['value'], 2)
+        stats = self.buffer.get_stats()
+        self.assertEqual((stats['errors'], stats['dropped']), (1, 1))
+
+    def test_write_error(self):
+        def fail(updates):
+            MemoryDataProvider.bulk_update(self.provider, updates[:1])
+            raise BulkWriteError({'writeErrors': [{'index': 1, 'errmsg': 'error'}]})
+        for _id in '012':
+            self.provider.update(_id, {'$inc': {'value': 10}})
+        self.provider.bulk_update = fail
+        self.assertEqual(self.buffer.flush(), 1)
+        del self.provider.bulk_update
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(sum(document['value'] for document in self.collection.documents.values()), 23)
+        self.assertEqual(self.buffer.get_stats()['dropped'], 1)
+
+        def fail_concern(updates):
+            MemoryDataProvider.bulk_update(self.provider, updates)
+            raise BulkWriteError({'writeErrors': [], 'writeConcernErrors': [{'errmsg': 'timeout'}]})
+        self.provider.update('1', {'$inc': {'value': 10}})
+        self.provider.bulk_update = fail_concern
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.collection.documents['1']['value'], 21)
+        stats = self.buffer.get_stats()
+        self.assertEqual((stats['errors'], stats['dropped'], stats['pending']), (2, 1, 0))
+
+    def test_concurrent_flush(self):
+        started = Event()
+        finish = Event()
+
+        def slow(updates):
+            started.set()
+            finish.wait()
+            MemoryDataProvider.bulk_update(self.provider, updates)
+        self.provider.update('1', {'$set': {'value': 2}})
+        self.provider.bulk_update = slow
+        thread = Thread(target=self.buffer.flush)
+        thread.start()
+        started.wait()
+        del self.provider.bulk_update
+        self.provider.update('1', {'$set': {'value': 3}})
+        concurrent = Thread(target=self.buffer.flush)
+        concurrent.start()
+        concurrent.join(0.05)
+        self.assertTrue(concurrent.is_alive())
+        finish.set()
+        thread.join()
+        concurrent.join()
+        self.assertEqual(self.collection.documents['1']['value'], 3)
+
+    def test_process_stop(self):
+        process = IOLoopProcess('test', loop=self.io_loop)
+        process.add_stop_callback(self.buffer.stop)
+        self.provider.update('1', {'$set': {'value': 2}})
+        process.stop()
+        self.assertEqual(self.collection.documents['1']['value'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()